@@ -44,11 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'money.metrics.RequestMetricsMiddleware',  # first, so it times the whole stack
+    'money.routers.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'money.sharding.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'money.fx.currency_context',
             ],
         },
     },
@@ -96,6 +100,58 @@ DATABASES = {
     },
 }
 
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds aliases replica1, replica2, ...
+# mirroring `default`; money.routers sends the reads of dashboard/list/report
+# views there and pins a client to the primary for REPLICA_PIN_SECONDS after it writes.
+# With sharding, money data is read from the user's shard: give the shards replicas
+# of their own with a dict, e.g. {'default': ['replica1'], 'shard2': ['shard2_replica1']}
+DATABASE_REPLICAS = []
+for _i, _host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{_i}'] = {**DATABASES['default'], 'HOST': _host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_i}')
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+# User sharding: DB_SHARD_HOSTS=host2,host3 adds aliases shard2, shard3, ... next to
+# `default` (the first shard, and home of auth, sessions and the shard directory);
+# see money.sharding and `manage.py rebalance_user`
+DATABASE_SHARDS = ['default']
+for _i, _host in enumerate(filter(None, os.getenv('DB_SHARD_HOSTS', '').split(',')), 2):
+    DATABASES[f'shard{_i}'] = {**DATABASES['default'], 'HOST': _host.strip()}
+    DATABASE_SHARDS.append(f'shard{_i}')
+DATABASE_ROUTERS = ['money.sharding.ShardRouter', 'money.routers.PrimaryReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# locmem by default; point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached in production
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'finance-manager'),
+    }
+}
+
+# Seconds a per-user dashboard stays cached (it is also invalidated on every write)
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 300))
+
+# Requests issuing more SQL queries than this are logged and counted at /metrics/
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', 25))
+
+# Budgets whose spend reaches this share of the amount are flagged "near limit" (money.budgets)
+BUDGET_NEAR_LIMIT = float(os.getenv('BUDGET_NEAR_LIMIT', 0.8))
+
+# Transactions dated before the 1st of the month this many months back are moved
+# to the archive table by `manage.py archive_transactions` (money.archive)
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', 36))
+
+# Currencies (money.fx): new accounts and users default to DEFAULT_CURRENCY; FX rates
+# are read from the date,currency,rate CSV files in FX_RATES_DIR, quoted against
+# FX_REFERENCE_CURRENCY; edits to the files are picked up within FX_RATES_CHECK_SECONDS
+DEFAULT_CURRENCY = os.getenv('DEFAULT_CURRENCY', 'MYR')
+FX_REFERENCE_CURRENCY = os.getenv('FX_REFERENCE_CURRENCY', DEFAULT_CURRENCY)
+FX_RATES_DIR = os.getenv('FX_RATES_DIR', BASE_DIR / 'fx_rates')
+FX_RATES_CHECK_SECONDS = int(os.getenv('FX_RATES_CHECK_SECONDS', 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,27 @@
+"""
+Settings for the test suite: SQLite, no MySQL server needed.
+
+    python manage.py test --settings=finance_manager.test_settings
+
+Besides ``default`` there is a replica alias and a second shard alias, so the
+routing tests can switch replicas/sharding on with override_settings. Both
+stay out of DATABASE_REPLICAS/DATABASE_SHARDS here, like in a stock setup.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # Not a mirror: the replica tests need it to lag behind
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica1.sqlite3',
+    },
+    'shard2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'shard2.sqlite3',
+    },
+}
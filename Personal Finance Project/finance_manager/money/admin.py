@@ -1,4 +1,4 @@
 from django.contrib import admin
 
-from .models import Transaction, Category, Account, Budget
-admin.site.register([Transaction, Category, Account, Budget])
+from .models import Transaction, Category, CategoryRule, Account, Budget, RecurringTransaction
+admin.site.register([Transaction, Category, CategoryRule, Account, Budget, RecurringTransaction])
@@ -0,0 +1,96 @@
+"""
+Hot/cold split of the transaction table.
+
+Transactions dated before a cutoff (the 1st of the month
+``settings.ARCHIVE_AFTER_MONTHS`` back) are moved to ArchivedTransaction with
+their ids, so the live table -- and every per-user list, dashboard and ledger
+query on it -- only holds recent history. Each batch copies up to
+``batch_size`` rows (in primary-key order, locking just those rows) and deletes
+them from the live table in one short database transaction; an interrupted
+run loses nothing and simply starts over on the rows that are still live.
+
+Totals stay exact: the batch's income - expense per account moves from
+``Account.transaction_total`` to ``Account.archived_total`` (money.ledger), so
+live balances do not change, and MonthlyCategoryTotal rollups and balance
+checkpoints already count the rows wherever they live. Reports, checkpoints,
+``rebuild_rollups`` and the ``archived`` search/export option read the archive
+table directly.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.conf import settings
+from django.db import connections
+
+from . import caching, sharding
+from .cents import to_cents
+from .ledger import apply_archive_deltas, add_months, month_start, signed_cents
+from .models import ArchivedTransaction, Transaction
+
+BATCH_SIZE = 1000
+ARCHIVE_FIELDS = (
+    'id', 'user_id', 'account_id', 'category_id', 'type', 'amount', 'date', 'note',
+    'created_at', 'transfer_key', 'recurring_id',
+)
+
+
+def archive_cutoff(today=None, months=None):
+    """Rows dated before this are archived."""
+    months = settings.ARCHIVE_AFTER_MONTHS if months is None else months
+    return add_months(month_start(today or date.today()), -months)
+
+
+@dataclass
+class ArchiveResult:
+    moved: int = 0
+    batches: int = 0
+    last_pk: int = 0
+    user_ids: set = field(default_factory=set)
+
+
+def _delete_live(pks):
+    # Raw DELETE: the ledger signals would subtract the rows from every total
+    conn = connections[sharding.db()]
+    table = conn.ops.quote_name(Transaction._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(pks))
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', pks)
+
+
+def archive_batch(before, after_pk=0, user_id=None, batch_size=BATCH_SIZE):
+    """Move the next batch of rows dated before ``before``; returns them as dicts."""
+    with sharding.atomic():
+        qs = Transaction.objects.filter(date__lt=before, pk__gt=after_pk)
+        if user_id is not None:
+            qs = qs.filter(user_id=user_id)
+        rows = list(qs.select_for_update().order_by('pk').values(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            return rows
+        ArchivedTransaction.objects.bulk_create([ArchivedTransaction(**row) for row in rows])
+        deltas = defaultdict(int)
+        for row in rows:
+            deltas[row['account_id']] += signed_cents(row['type'], to_cents(row['amount']))
+        apply_archive_deltas(deltas)
+        _delete_live([row['id'] for row in rows])
+    return rows
+
+
+def archive(before=None, user_id=None, batch_size=BATCH_SIZE, after_pk=0, on_batch=None):
+    """Archive every live row dated before ``before`` (default: the configured cutoff)."""
+    before = before or archive_cutoff()
+    result = ArchiveResult(last_pk=after_pk)
+    while True:
+        rows = archive_batch(before, result.last_pk, user_id, batch_size)
+        if not rows:
+            break
+        result.moved += len(rows)
+        result.batches += 1
+        result.last_pk = rows[-1]['id']
+        batch_users = {row['user_id'] for row in rows}
+        for uid in batch_users:
+            caching.bump_data_version(uid)  # pages cached before the move
+        result.user_ids |= batch_users
+        if on_batch:
+            on_batch(result)
+    return result
@@ -0,0 +1,74 @@
+"""
+Async dashboard: the independent loaders of money.dashboard run concurrently.
+
+Django's async ORM methods still funnel every query through the single
+thread-sensitive executor, so awaiting them one after another would be no
+faster than the sync view. Each loader here runs in its own worker thread
+(``thread_sensitive=False``) with its own database connection, which is
+recycled under the usual CONN_MAX_AGE rules when the loader finishes, and
+the results are combined with the same ``build_summary``/``build_context``
+as the sync dashboard; the view shares the sync one's cache entry
+(money.caching). The worker threads' queries are counted towards the request
+at /metrics/ (money.metrics.track_queries).
+"""
+import asyncio
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from . import caching
+from .dashboard import (
+    build_context, build_summary, last_months, load_accounts, load_budgets, load_daily_expenses,
+    load_month_rollups,
+)
+from .fx import Conversion
+from .metrics import track_queries
+
+
+def _in_own_connection(func):
+    def run(*args):
+        try:
+            with track_queries():
+                return func(*args)
+        finally:
+            close_old_connections()  # this worker thread's connections, as after a request
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def adashboard_summary(user, today=None):
+    """``dashboard_summary`` with its three loaders in parallel."""
+    today = today or date.today()
+    first_day = today.replace(day=1)
+    accounts, rollups, budgets = await asyncio.gather(
+        _in_own_connection(load_accounts)(user),
+        _in_own_connection(load_month_rollups)(user, [first_day]),
+        _in_own_connection(load_budgets)(user, first_day),
+    )
+    # Queries only for a user without accounts (see money.fx.base_currency)
+    conversion = await _in_own_connection(Conversion.for_user)(user, accounts)
+    return build_summary(today, accounts, rollups, budgets, conversion)
+
+
+async def acached_dashboard_summary(user, today=None):
+    """``cached_dashboard_summary``: the same cache entry, filled by ``adashboard_summary``."""
+    today = today or date.today()
+    key, value = await sync_to_async(caching.lookup)(user, 'summary', today)
+    if value is None:
+        value = await adashboard_summary(user, today)
+        await sync_to_async(caching.store)(key, value)
+    return value
+
+
+async def adashboard_data(user, today=None):
+    """``dashboard_data`` with its four loaders in parallel."""
+    today = today or date.today()
+    first_day = today.replace(day=1)
+    accounts, rollups, daily_rows, budgets = await asyncio.gather(
+        _in_own_connection(load_accounts)(user),
+        _in_own_connection(load_month_rollups)(user, last_months(today)),
+        _in_own_connection(load_daily_expenses)(user, first_day),
+        _in_own_connection(load_budgets)(user, first_day),
+    )
+    conversion = await _in_own_connection(Conversion.for_user)(user, accounts)
+    return build_context(today, accounts, rollups, daily_rows, budgets, conversion)
@@ -0,0 +1,193 @@
+"""
+Budget vs actual, evaluated in bulk and stored as BudgetSnapshot rows.
+
+``evaluate`` is the batch engine (``manage.py evaluate_budgets``): for a chunk
+of users it reads every Budget, then the month's expense of those budgets
+from the MonthlyCategoryTotal rollup grouped by account currency, converts it
+to each user's base currency (money.fx, at the month's closing rate) and
+upserts all snapshots with one statement. Each
+snapshot is stamped with the user's ``Profile.data_version`` (bumped on every
+write, see money.caching), read before the figures, so an incremental run
+only re-evaluates users whose version has moved since their snapshots were
+written.
+
+Readers (dashboard, budget list) call ``attach_status``: a snapshot stamped
+with the current version is used as is, anything else falls back to live
+rollup figures, so a write between two runs is never shown stale. A change
+of the rate files reaches the snapshots on the next full evaluation; until
+then readers see the figures of the rates they were written with.
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models.functions import TruncMonth
+
+from . import fx
+from .cents import SumCents, from_cents
+from .models import Budget, BudgetSnapshot, MonthlyCategoryTotal, Profile
+
+logger = logging.getLogger(__name__)
+
+USERS_PER_BATCH = 500
+
+
+def near_limit():
+    return Decimal(str(getattr(settings, 'BUDGET_NEAR_LIMIT', 0.8)))
+
+
+def classify(amount, spent):
+    amount, spent = Decimal(amount or 0), Decimal(spent or 0)
+    if spent > amount:
+        return 'over'
+    if amount and spent >= amount * near_limit():
+        return 'near'
+    return 'ok'
+
+
+def data_versions(user_ids):
+    """{user_id: Profile.data_version}; 0 for users who never wrote anything."""
+    found = dict(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', 'data_version'))
+    return {user_id: found.get(user_id, 0) for user_id in user_ids}
+
+
+def loaded_data_version(budgets):
+    """The owner's data version, free for budgets loaded with ``select_related('user__profile')``."""
+    try:
+        return budgets[0].user.profile.data_version
+    except Profile.DoesNotExist:
+        return 0
+
+
+def expense_totals(user_ids, months, category_ids, bases, today=None, missing=None):
+    """
+    {(user_id, month, category_id): spent} in each user's base currency
+    (``bases``: user_id -> currency), from one rollup query. Given a
+    ``missing`` set, unquoted currencies count as zero and are added to it
+    (see money.fx.RateTable.factors).
+    """
+    today = today or date.today()
+    rows = list(
+        MonthlyCategoryTotal.objects.filter(
+            user_id__in=user_ids, type='expense', month__in=months, category_id__in=category_ids,
+        )
+        .order_by()
+        .values_list('user_id', 'month', 'category_id', 'account__currency')
+        .annotate(total=SumCents('total'))
+    )
+    spent = defaultdict(int)
+    if rows:
+        users, row_months, categories, currencies, totals = zip(*rows)
+        converted = fx.rate_table().convert(
+            totals, currencies, [fx.closing_day(m, today) for m in row_months], [bases[u] for u in users], missing,
+        )
+        for key, cents in zip(zip(users, row_months, categories), converted.tolist()):
+            spent[key] += cents
+    return {key: from_cents(cents) for key, cents in spent.items()}
+
+
+def budgets_with_spend(user_ids):
+    budgets = list(
+        Budget.objects.filter(user_id__in=user_ids)
+        .order_by()
+        .annotate(month_start=TruncMonth('month'))
+        .values_list('pk', 'user_id', 'month_start', 'category_id', 'amount')
+    )
+    if not budgets:
+        return []
+    missing = set()
+    spent = expense_totals(
+        user_ids, {b[2] for b in budgets}, {b[3] for b in budgets}, fx.base_currencies(user_ids),
+        missing=missing,
+    )
+    if missing:
+        logger.warning('No FX rate for %s; left out of the budget figures', ', '.join(sorted(missing)))
+    return [
+        (pk, user_id, month, amount, spent.get((user_id, month, category_id), Decimal('0')))
+        for pk, user_id, month, category_id, amount in budgets
+    ]
+
+
+def evaluate_users(user_ids):
+    """Recompute and store the snapshots of every budget of these users; returns rows written."""
+    versions = data_versions(user_ids)
+    snapshots = []
+    for pk, user_id, month, amount, spent in budgets_with_spend(user_ids):
+        snapshots.append(BudgetSnapshot(
+            budget_id=pk, user_id=user_id, month=month, amount=amount, spent=spent,
+            status=classify(amount, spent), version=versions[user_id],
+        ))
+    BudgetSnapshot.objects.bulk_create(
+        snapshots, update_conflicts=True, unique_fields=['budget'],
+        update_fields=['user', 'month', 'amount', 'spent', 'status', 'version', 'evaluated_at'],
+    )
+    return len(snapshots)
+
+
+def live_spend(user, conversion):
+    """A ``live_spent`` for ``attach_status``: one rollup query, in ``conversion.base``."""
+    def spent(stale):
+        found = expense_totals(
+            [user.pk], {b.month.replace(day=1) for b in stale}, {b.category_id for b in stale},
+            {user.pk: conversion.base}, missing=conversion.missing,
+        )
+        return {(month, category_id): total for (_, month, category_id), total in found.items()}
+    return spent
+
+
+def changed_user_ids(user_ids=None):
+    """Users with a budget whose snapshot is missing or older than their data version."""
+    stamped = defaultdict(set)
+    rows = Budget.objects.order_by().values_list('user_id', 'snapshot__version').distinct()
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    for user_id, version in rows.iterator():
+        stamped[user_id].add(version)
+    changed = []
+    candidates = sorted(stamped)
+    for i in range(0, len(candidates), USERS_PER_BATCH):
+        chunk = candidates[i:i + USERS_PER_BATCH]
+        current = data_versions(chunk)
+        changed += [user_id for user_id in chunk if stamped[user_id] != {current[user_id]}]
+    return changed
+
+
+def evaluate(full=False, user_ids=None, batch_size=USERS_PER_BATCH):
+    """Evaluate budgets of every user (``full``) or only of users whose data changed."""
+    if full:
+        qs = Budget.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        if user_ids is not None:
+            qs = qs.filter(user_id__in=user_ids)
+        targets = list(qs)
+    else:
+        targets = changed_user_ids(user_ids)
+    written = 0
+    for i in range(0, len(targets), batch_size):
+        written += evaluate_users(targets[i:i + batch_size])
+    return len(targets), written
+
+
+def attach_status(budgets, user_id, live_spent):
+    """
+    Set ``b.spent`` and ``b.status`` on budgets loaded with
+    ``select_related('snapshot', 'user__profile')``. ``live_spent(stale)`` returns
+    {(month, category_id): spent} for the budgets without a fresh snapshot.
+    """
+    if not budgets:
+        return budgets
+    version = loaded_data_version(budgets)
+    stale = []
+    for b in budgets:
+        snapshot = getattr(b, 'snapshot', None)
+        if snapshot is not None and snapshot.version == version:
+            b.spent, b.status = snapshot.spent, snapshot.status
+        else:
+            stale.append(b)
+    if stale:
+        spent = live_spent(stale)
+        for b in stale:
+            b.spent = spent.get((b.month.replace(day=1), b.category_id), Decimal('0'))
+            b.status = classify(b.amount, b.spent)
+    return budgets
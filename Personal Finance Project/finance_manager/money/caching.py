@@ -0,0 +1,109 @@
+"""
+Per-user cache of the dashboard context and chart series.
+
+Every user has a data version stored in the cache; any save/delete of their
+Transaction, Account, Category, Budget or Profile rows bumps it (see money.signals),
+and bulk writers bump it explicitly. The same call bumps the persistent
+``Profile.data_version``, which budget snapshots compare against (money.budgets):
+unlike the cached one it is shared by every process and survives evictions
+and restarts. Cached dashboards are keyed by
+(user, version, FX rates, today), so a write, a change of the rate files
+(money.fx) or a new day simply makes the old entry unreachable and it
+expires on its own.
+
+Backend is whatever CACHES['default'] is (locmem by default, Redis/Memcached
+in production); timeouts come from settings.DASHBOARD_CACHE_TIMEOUT.
+"""
+import hashlib
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from . import sharding
+from .dashboard import dashboard_data, dashboard_summary
+from .fx import table_version
+from .models import Profile
+
+VERSION_KEY = 'money:version:{}'
+ENTRY_KEY = 'money:{}:{}:{}:{}:{}'  # name, user, version, rates, day
+STATS_KEY = 'money:stats:dashboard:{}'
+
+
+def _initial_version():
+    # Time based, so a version evicted from the cache never restarts at a
+    # value an older cached dashboard was stored under
+    return time.time_ns()
+
+
+def data_version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id):
+    profiles = Profile.objects.using(sharding.db_for_user(user_id))
+    if not profiles.filter(user_id=user_id).update(data_version=F('data_version') + 1):
+        # No signals: saving a Profile bumps the version itself
+        profiles.bulk_create([Profile(user_id=user_id, data_version=1)], ignore_conflicts=True)
+    key = VERSION_KEY.format(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:  # missing key
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def _count(outcome):
+    key = STATS_KEY.format(outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def cache_stats():
+    return {o: cache.get(STATS_KEY.format(o), 0) for o in ('hit', 'miss')}
+
+
+def lookup(user, name, today):
+    """(key, cached value or None) of a per-user entry, counting the hit or miss."""
+    key = ENTRY_KEY.format(name, user.pk, data_version(user.pk), table_version(), today.isoformat())
+    value = cache.get(key)
+    _count('miss' if value is None else 'hit')
+    return key, value
+
+
+def store(key, value):
+    cache.set(key, value, timeout=getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+
+
+def cached_for_user(user, name, builder, today=None):
+    """Return ``builder(user, today)``, cached until the user's data or the day changes."""
+    today = today or date.today()
+    key, value = lookup(user, name, today)
+    if value is None:
+        value = builder(user, today)
+        store(key, value)
+    return value
+
+
+def cached_dashboard_data(user, today=None):
+    return cached_for_user(user, 'dashboard', dashboard_data, today)
+
+
+def cached_dashboard_summary(user, today=None):
+    return cached_for_user(user, 'summary', dashboard_summary, today)
+
+
+def user_etag(user, name, today=None):
+    """Strong validator for a cached entry; changes exactly when the entry would."""
+    today = today or date.today()
+    raw = f'{name}:{user.pk}:{data_version(user.pk)}:{table_version()}:{today.isoformat()}'
+    return hashlib.sha1(raw.encode()).hexdigest()
@@ -0,0 +1,97 @@
+"""
+Money stored as integer cents.
+
+Every amount, balance and total column is a ``CentsField``: a BIGINT count of
+cents that Python code reads and writes as a two-place ``Decimal``, exactly as
+the DecimalField columns it replaced (forms, templates, exports and lookups
+such as ``amount__gte=Decimal('10')`` are unchanged). What changes is the
+arithmetic underneath: the database sums integers, which is exact on every
+backend (SQLite summed decimals as floats) and cheaper on large ledgers.
+
+Hot paths skip the Decimals altogether and work in cents:
+
+* ``SumCents`` -- an aggregate returning an int of cents instead of a Decimal;
+* ``cents_value`` -- an int literal for F() arithmetic on a cents column
+  (``F('total') + cents_value(delta)``); a bare Decimal there would be sent as
+  units, not cents;
+* ``to_cents`` / ``from_cents`` convert at the edges, and raw driver rows
+  (money.reports) load straight into int64 arrays.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.core import validators
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Sum, Value
+from django.utils.functional import cached_property
+
+
+def to_cents(amount):
+    """Decimal/str/int amount in units -> int cents (half to even, as DecimalField stored it)."""
+    if isinstance(amount, float):
+        amount = str(amount)
+    return int(Decimal(amount).scaleb(2).to_integral_value())
+
+
+def from_cents(cents):
+    """int cents (or a driver's integral Decimal) -> two-place Decimal."""
+    return Decimal(cents).scaleb(-2)
+
+
+def cents_value(cents):
+    return Value(int(cents), output_field=models.BigIntegerField())
+
+
+class SumCents(Sum):
+    """SUM of a cents column as an int number of cents (None over no rows unless ``default``)."""
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, output_field=models.BigIntegerField(), **extra)
+
+
+class CentsField(models.BigIntegerField):
+    description = 'Amount stored as integer cents'
+    default_error_messages = {
+        'invalid': '“%(value)s” value must be a decimal number.',
+    }
+
+    def __init__(self, *args, max_digits=12, **kwargs):
+        # Digits (two of them decimals) accepted from forms and full_clean
+        self.max_digits = max_digits
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['max_digits'] = self.max_digits
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # A DecimalField's checks rather than the bigint range
+        return [*self.default_validators, *self._validators, validators.DecimalValidator(self.max_digits, 2)]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_cents(value)
+
+    def to_python(self, value):
+        # Unrounded, like DecimalField: full_clean rejects a third decimal place
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return Decimal(str(value) if isinstance(value, float) else value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        return None if value is None else to_cents(self.to_python(value))
+
+    def formfield(self, **kwargs):
+        # Skip BigIntegerField's bigint bounds, which are not in units
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': 2,
+            **kwargs,
+        })
@@ -0,0 +1,121 @@
+"""
+Balance as of a past date from monthly checkpoints.
+
+An AccountCheckpoint holds the sum of an account's transactions up to the end
+of one closed month. The balance on day ``d`` is therefore
+
+    opening balance + checkpoint of the month before d + transactions of d's month up to d
+
+so only the transactions since the nearest checkpoint are summed (as int
+cents, see money.cents); rows moved
+to ArchivedTransaction (money.archive) count as well. Checkpoints are created
+lazily, in one grouped query per account, the first time a date after them is
+asked for; from then on money.ledger shifts them by the delta of every insert,
+edit or delete dated in or before their month, so back-dated changes never
+leave them stale. Creation locks the account row, which the ledger updates
+before touching checkpoints, so the two cannot interleave.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db.models import F, Q
+from django.db.models.functions import TruncMonth
+
+from . import sharding
+from .cents import SumCents, from_cents, to_cents
+from .ledger import add_months, month_start
+from .models import Account, AccountCheckpoint, ArchivedTransaction, Transaction
+
+MAX_HISTORY_DAYS = 3660  # one chart point per day
+
+
+SIGNED = {
+    'income': SumCents('amount', filter=Q(type='income'), default=0),
+    'expense': SumCents('amount', filter=Q(type='expense'), default=0),
+}
+
+
+def _net_by(account, group=None, **filters):
+    """
+    Income - expense cents of the account's rows matching ``filters``, live
+    and archived: a dict per value of the ``group`` expression, or a total.
+    """
+    net = defaultdict(int)
+    for model in (Transaction, ArchivedTransaction):
+        rows = model.objects.filter(account=account, **filters).order_by()
+        if group is None:
+            rows = [{'key': None, **rows.aggregate(**SIGNED)}]
+        else:
+            rows = rows.annotate(key=group).values('key').annotate(**SIGNED)
+        for row in rows:
+            net[row['key']] += row['income'] - row['expense']
+    return net if group is not None else net[None]
+
+
+def ensure_checkpoints(account, through):
+    """
+    Create the missing checkpoints of ``account`` up to the month ``through``
+    (clamped to the last closed month) and return the one for ``through``,
+    or None if the account has no transactions by then.
+    """
+    through = min(month_start(through), add_months(month_start(date.today()), -1))
+    existing = AccountCheckpoint.objects.filter(account=account, month=through).order_by('month').first()
+    if existing is not None:  # the common case: no lock needed
+        return existing
+    with sharding.atomic():
+        Account.objects.select_for_update().only('pk').get(pk=account.pk)
+        latest = AccountCheckpoint.objects.filter(account=account, month__lte=through).order_by('-month').first()
+        if latest is not None and latest.month == through:
+            return latest
+        filters = {'date__lt': add_months(through, 1)}
+        if latest is not None:
+            filters['date__gte'] = add_months(latest.month, 1)
+        net = _net_by(account, TruncMonth('date'), **filters)
+        if not net and latest is None:
+            return None
+
+        running = to_cents(latest.total) if latest is not None else 0
+        month = add_months(latest.month, 1) if latest is not None else min(net)
+        created = []
+        while month <= through:
+            running += net.get(month, 0)
+            created.append(AccountCheckpoint(account=account, month=month, total=from_cents(running)))
+            month = add_months(month, 1)
+        AccountCheckpoint.objects.bulk_create(created)
+        return created[-1] if created else latest
+
+
+def balance_as_of(account, day):
+    """Balance at the end of ``day``."""
+    checkpoint = ensure_checkpoints(account, add_months(month_start(day), -1))
+    filters = {'date__lte': day}
+    if checkpoint:
+        filters['date__gte'] = add_months(checkpoint.month, 1)
+    base = to_cents(checkpoint.total) if checkpoint else 0
+    return from_cents(to_cents(account.balance or 0) + base + _net_by(account, **filters))
+
+
+def balance_history(account, start, end):
+    """Daily closing balances from ``start`` to ``end`` as {'labels', 'values'}."""
+    opening = balance_as_of(account, start - timedelta(days=1))
+    net = _net_by(account, F('date'), date__gte=start, date__lte=end)
+    labels, values = [], []
+    balance = to_cents(opening)
+    day = start
+    while day <= end:
+        balance += net.get(day, 0)
+        labels.append(day.isoformat())
+        values.append(balance / 100)
+        day += timedelta(days=1)
+    return {'labels': labels, 'values': values}
+
+
+def rebuild_checkpoints(accounts):
+    """Drop and recreate the checkpoints of the given accounts; returns rows created."""
+    created = 0
+    for account in accounts:
+        with sharding.atomic():
+            AccountCheckpoint.objects.filter(account=account).delete()
+            if ensure_checkpoints(account, date.today()) is not None:
+                created += AccountCheckpoint.objects.filter(account=account).count()
+    return created
@@ -0,0 +1,303 @@
+"""
+Dashboard figures computed with a fixed number of queries.
+
+Each loader below issues exactly one query no matter how much history the user
+has; ``dashboard_data`` combines them into the full dashboard context, while
+``dashboard_summary`` and ``CHART_SERIES`` serve the page shell and the JSON
+chart endpoints separately:
+
+* accounts        -- live balances (Account.transaction_total, see money.ledger)
+                     and the owner's base currency
+* month rollups   -- income/expense per month, category & currency (MonthlyCategoryTotal)
+* daily expenses  -- current month grouped by day & currency in SQL
+* budgets         -- this month's Budget rows with their snapshots (money.budgets)
+
+Amounts come back per currency and are converted to the user's base currency
+(money.fx) column-wise while the context is built, with no further queries.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import F, Q
+
+from .budgets import attach_status
+from .cents import SumCents, from_cents
+from .forecast import build_forecast
+from .fx import Conversion, closing_day
+from .models import Account, Budget, MonthlyCategoryTotal, Transaction
+
+CHART_MONTHS = 6
+
+
+def last_months(today, count=CHART_MONTHS):
+    """First day of the last ``count`` months, oldest first (current month last)."""
+    months = []
+    m, y = today.month, today.year
+    for _ in range(count):
+        months.append(date(y, m, 1))
+        # prev month
+        m -= 1
+        if m == 0:
+            m = 12
+            y -= 1
+    months.reverse()
+    return months
+
+
+def next_month(d):
+    return date(d.year + (1 if d.month == 12 else 0), 1 if d.month == 12 else d.month + 1, 1)
+
+
+def load_accounts(user):
+    # The owner's Profile rides along for the base currency (money.fx.base_currency)
+    return list(Account.objects.filter(user=user).select_related('user__profile').order_by('name'))
+
+
+def load_month_rollups(user, months):
+    """{'month', 'category_id', 'currency', 'income', 'expense'} rows (int cents) over the given months."""
+    rows = (
+        MonthlyCategoryTotal.objects
+        .filter(user=user, month__gte=months[0], month__lte=months[-1])
+        .order_by()
+        .values('month', 'category_id', currency=F('account__currency'))
+        .annotate(
+            income=SumCents('total', filter=Q(type='income'), default=0),
+            expense=SumCents('total', filter=Q(type='expense'), default=0),
+        )
+    )
+    return list(rows)
+
+
+def load_daily_expenses(user, month):
+    """(date, currency, expense cents) rows for the given month."""
+    rows = (
+        Transaction.objects
+        .filter(user=user, type='expense', date__gte=month, date__lt=next_month(month))
+        .order_by()
+        .values_list('date', 'account__currency')
+        .annotate(total=SumCents('amount'))
+    )
+    return list(rows)
+
+
+def load_budgets(user, month):
+    return list(
+        Budget.objects.filter(user=user, month__gte=month, month__lt=next_month(month))
+        .select_related('category', 'snapshot', 'user__profile')
+    )
+
+
+def dashboard_data(user, today=None):
+    today = today or date.today()
+    first_day = today.replace(day=1)
+    months = last_months(today)
+
+    accounts = load_accounts(user)
+    rollups = load_month_rollups(user, months)
+    daily_rows = load_daily_expenses(user, first_day)
+    budgets = load_budgets(user, first_day)
+    return build_context(today, accounts, rollups, daily_rows, budgets, Conversion.for_user(user, accounts))
+
+
+def dashboard_summary(user, today=None):
+    """Only the summary cards (three queries); charts come from the series below."""
+    today = today or date.today()
+    first_day = today.replace(day=1)
+    accounts = load_accounts(user)
+    rollups = load_month_rollups(user, [first_day])
+    budgets = load_budgets(user, first_day)
+    return build_summary(today, accounts, rollups, budgets, Conversion.for_user(user, accounts))
+
+
+def build_summary(today, accounts, rollups, budgets, conversion):
+    """Fold the loaded rows into the summary context (no queries)."""
+    first_day = today.replace(day=1)
+    rollups = convert_rollups(rollups, conversion, today)
+    income, expense, spent_map = month_totals(rollups, first_day)
+    budgets = budget_status(budgets, spent_map)
+    convert_balances(accounts, conversion, today)
+    return {
+        **live_totals(accounts, income, expense),
+        'income': income, 'expense': expense, 'net': income - expense, 'spent': expense,
+        'accounts': accounts, 'budget_alerts': budget_alerts(budgets),
+        'base_currency': conversion.base, 'missing_rates': sorted(conversion.missing),
+    }
+
+
+# ---------- Conversion to the base currency (no queries) ----------
+
+def convert_rollups(rows, conversion, today):
+    """
+    Fold per-currency rollup rows into (month, category_id) rows with Decimal
+    income/expense in the base currency, each month at its closing rate.
+    """
+    if not rows:
+        return []
+    days = [closing_day(row['month'], today) for row in rows]
+    currencies = [row['currency'] for row in rows]
+    income = conversion.cents([row['income'] for row in rows], currencies, days)
+    expense = conversion.cents([row['expense'] for row in rows], currencies, days)
+    merged = {}
+    for row, row_income, row_expense in zip(rows, income.tolist(), expense.tolist()):
+        found = merged.setdefault((row['month'], row['category_id']), [0, 0])
+        found[0] += row_income
+        found[1] += row_expense
+    return [
+        {'month': month, 'category_id': category_id, 'income': from_cents(i), 'expense': from_cents(e)}
+        for (month, category_id), (i, e) in merged.items()
+    ]
+
+
+def convert_daily(rows, conversion):
+    """day-of-month -> expense total in the base currency."""
+    if not rows:
+        return {}
+    days, currencies, cents = zip(*rows)
+    by_day = {}
+    for d, converted in zip(days, conversion.cents(cents, currencies, days).tolist()):
+        by_day[d.day] = by_day.get(d.day, 0) + converted
+    return {day: from_cents(total) for day, total in by_day.items()}
+
+
+def convert_balances(accounts, conversion, today):
+    """Set ``base_balance`` (live balance in the base currency) on every account."""
+    balances = conversion.amounts([a.live_balance for a in accounts], [a.currency for a in accounts], today)
+    for account, balance in zip(accounts, balances):
+        account.base_balance = balance
+    return accounts
+
+
+# ---------- Series (one chart each, no queries) ----------
+
+def month_totals(rollups, month):
+    """(income, expense, {category_id: expense}) for one month of rollup rows."""
+    income = Decimal('0'); expense = Decimal('0')
+    spent_map = {}
+    for row in rollups:
+        if row['month'] != month:
+            continue
+        month_expense = row['expense'] or Decimal('0')
+        income += row['income'] or 0
+        expense += month_expense
+        if month_expense:
+            spent_map[row['category_id']] = month_expense
+    return income, expense, spent_map
+
+
+def live_totals(accounts, income, expense):
+    # Live Money = opening balances + all-time income - all-time expense
+    live_total = sum((a.base_balance for a in accounts), Decimal('0'))
+    live_after_month_expense = live_total - expense
+    return {
+        'live_total': live_total,
+        'live_after_month_expense': live_after_month_expense,
+        'live_money': live_after_month_expense + income,
+    }
+
+
+def daily_series(month, totals_by_day):
+    last_day = (next_month(month) - month).days
+    return {
+        'labels': [f"{i:02d}" for i in range(1, last_day + 1)],
+        'values': [float(totals_by_day.get(i, 0)) for i in range(1, last_day + 1)],
+    }
+
+
+def trend_series(months, rollups):
+    # last 6 months expense by month
+    expense_by_month = {}
+    for row in rollups:
+        expense_by_month[row['month']] = expense_by_month.get(row['month'], 0) + (row['expense'] or 0)
+    return {
+        'labels': [f"{m:%Y-%m}" for m in months],
+        'values': [float(expense_by_month.get(m, 0)) for m in months],
+    }
+
+
+def budget_status(budgets, spent_map):
+    # Snapshot figures where current, this month's rollups otherwise
+    if budgets:
+        attach_status(budgets, budgets[0].user_id, lambda stale: {
+            (b.month.replace(day=1), b.category_id): spent_map.get(b.category_id, Decimal('0')) for b in stale
+        })
+    return budgets
+
+
+def budget_alerts(budgets):
+    return [b for b in budgets if b.status != 'ok']
+
+
+def budget_series(budgets):
+    return {
+        'labels': [b.category.name for b in budgets],
+        'budget': [float(b.amount or 0) for b in budgets],
+        'spent': [float(b.spent) for b in budgets],
+        'status': [b.status for b in budgets],
+    }
+
+
+def account_series(accounts):
+    return {
+        'labels': [a.name for a in accounts],
+        'values': [float(a.base_balance) for a in accounts],
+    }
+
+
+def build_context(today, accounts, rollups, daily_rows, budgets, conversion):
+    """Fold the loaded rows into the dashboard context (no queries)."""
+    first_day = today.replace(day=1)
+    convert_balances(accounts, conversion, today)
+    rollups = convert_rollups(rollups, conversion, today)
+    income, expense, spent_map = month_totals(rollups, first_day)
+    daily = daily_series(first_day, convert_daily(daily_rows, conversion))
+    trend = trend_series(last_months(today), rollups)
+    budget = budget_series(budget_status(budgets, spent_map))
+    return {
+        **live_totals(accounts, income, expense),
+        'income': income, 'expense': expense, 'net': income - expense, 'spent': expense,
+        'exp_daily_labels': daily['labels'], 'exp_daily_values': daily['values'],
+        'chart_labels': trend['labels'], 'chart_values': trend['values'],
+        'budgets': budgets, 'spent_map': spent_map, 'budget_alerts': budget_alerts(budgets),
+        'budget_labels': budget['labels'], 'budget_values': budget['budget'], 'spent_values': budget['spent'],
+        'accounts': accounts, 'missing_rates': sorted(conversion.missing),
+        'base_currency': conversion.base,  # saves money.fx.currency_context its query
+    }
+
+
+# ---------- Chart API loaders ----------
+
+def load_daily_expense_series(user, today):
+    first_day = today.replace(day=1)
+    return daily_series(first_day, convert_daily(load_daily_expenses(user, first_day), Conversion.for_user(user)))
+
+
+def load_monthly_trend_series(user, today):
+    months = last_months(today)
+    rollups = convert_rollups(load_month_rollups(user, months), Conversion.for_user(user), today)
+    return trend_series(months, rollups)
+
+
+def load_budget_series(user, today):
+    first_day = today.replace(day=1)
+    rollups = convert_rollups(load_month_rollups(user, [first_day]), Conversion.for_user(user), today)
+    _, _, spent_map = month_totals(rollups, first_day)
+    return budget_series(budget_status(load_budgets(user, first_day), spent_map))
+
+
+def load_account_series(user, today):
+    accounts = load_accounts(user)
+    return account_series(convert_balances(accounts, Conversion.for_user(user, accounts), today))
+
+
+def load_forecast_series(user, today):
+    # Two queries: accounts and the history the projection is fitted on
+    return build_forecast(user, today)
+
+
+CHART_SERIES = {
+    'daily-expense': load_daily_expense_series,
+    'monthly-trend': load_monthly_trend_series,
+    'budgets': load_budget_series,
+    'accounts': load_account_series,
+    'forecast': load_forecast_series,
+}
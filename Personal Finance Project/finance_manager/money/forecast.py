@@ -0,0 +1,136 @@
+"""
+Projected account balances for the rest of this month and the next months.
+
+The user's recent history is read once into arrays (money.reports) and every
+step after that is array arithmetic over (account, category) streams:
+
+* monthly totals per stream over the last ``HISTORY_MONTHS`` full months;
+* level = mean of the last twelve months the user has data for;
+* seasonality = mean of the same calendar month minus the overall mean, used
+  once a year of history exists, so December shopping or a yearly insurance
+  premium come back in the right month;
+* timing = each stream's share of its amounts by day of month (rent on the
+  1st, salary on the 25th); days a short month lacks fold into its last day.
+
+Daily flows are level+season times the day share; the balance of an account is
+its live balance plus the running sum of its flows from tomorrow on, in the
+account's currency. The total converts every account to the user's base
+currency at today's rate (money.fx; future rates are not guessed). Results
+are cached per user data version (money.caching), so they are recomputed only
+after the user's data changes.
+"""
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+
+from .fx import Conversion
+from .ledger import add_months
+from .models import Account
+from .reports import load_ledger
+
+HISTORY_MONTHS = 24
+HORIZON_MONTHS = 12
+
+
+def _month_index(dates):
+    return dates.astype('datetime64[M]').astype(np.int64)
+
+
+def stream_history(ledger, first_month, months):
+    """
+    Signed cents per (account, category) stream: returns (streams, monthly,
+    day_shares) where streams is a (n, 2) array of ids, monthly is (n, months)
+    and day_shares is (n, 31).
+    """
+    pairs = np.stack([ledger.account_ids, ledger.category_ids], axis=1)
+    streams, stream_idx = np.unique(pairs, axis=0, return_inverse=True)
+    stream_idx = stream_idx.reshape(-1)
+    n = len(streams)
+    signed = np.where(ledger.income, ledger.cents, -ledger.cents).astype(np.float64)
+    month_idx = _month_index(ledger.dates) - _month_index(np.array([first_month], dtype='datetime64[D]'))[0]
+    monthly = np.bincount(stream_idx * months + month_idx, weights=signed, minlength=n * months).reshape(n, months)
+
+    day_idx = (ledger.dates - ledger.dates.astype('datetime64[M]')).astype(np.int64)
+    by_day = np.bincount(stream_idx * 31 + day_idx, weights=np.abs(signed), minlength=n * 31).reshape(n, 31)
+    totals = by_day.sum(axis=1, keepdims=True)
+    day_shares = np.divide(by_day, totals, out=np.full_like(by_day, 1 / 31), where=totals > 0)
+    return streams, monthly, day_shares
+
+
+def monthly_projection(monthly, first_month, months_ahead, start_month):
+    """(n, months_ahead) projected signed cents per stream, from ``start_month`` on."""
+    active = np.flatnonzero(monthly.any(axis=0))
+    if not len(active):
+        return np.zeros((len(monthly), months_ahead))
+    history = monthly[:, active[0]:]
+    level = history[:, -12:].mean(axis=1)
+    first_calendar = first_month.month - 1 + active[0]
+    target_calendar = (start_month.month - 1 + np.arange(months_ahead)) % 12
+    projection = np.repeat(level[:, None], months_ahead, axis=1)
+    if history.shape[1] >= 12:
+        calendar_of_col = (first_calendar + np.arange(history.shape[1])) % 12
+        onehot = (calendar_of_col[:, None] == np.arange(12)[None, :]).astype(np.float64)
+        by_calendar = (history @ onehot) / onehot.sum(axis=0)
+        season = by_calendar - history.mean(axis=1, keepdims=True)
+        projection = projection + season[:, target_calendar]
+    # A season never turns a spending stream into income or the reverse
+    return np.where(level[:, None] < 0, np.minimum(projection, 0), np.maximum(projection, 0))
+
+
+def daily_weights(day_shares, days):
+    """(n, len(days)) share of its month's amount each stream spends on each day."""
+    dom = np.array([d.day for d in days]) - 1
+    month_len = np.array([calendar.monthrange(d.year, d.month)[1] for d in days])
+    weights = day_shares[:, dom]
+    # On the last day of a short month, add the shares of the days it lacks
+    tail = np.cumsum(day_shares[:, ::-1], axis=1)[:, ::-1]  # tail[:, k] = shares of days k..30
+    last = dom == month_len - 1
+    weights[:, last] = tail[:, dom[last]]
+    return weights
+
+
+def build_forecast(user, today=None, history_months=HISTORY_MONTHS, horizon_months=HORIZON_MONTHS):
+    today = today or date.today()
+    this_month = today.replace(day=1)
+    first_month = add_months(this_month, -history_months)
+    accounts = list(Account.objects.filter(user=user).select_related('user__profile').order_by('name'))
+    conversion = Conversion.for_user(user, accounts)
+    ledger = load_ledger(user, first_month, this_month - timedelta(days=1))
+
+    horizon_end = add_months(this_month, horizon_months + 1) - timedelta(days=1)
+    days = [today + timedelta(days=i) for i in range(1, (horizon_end - today).days + 1)]
+    flows = np.zeros((len(accounts), len(days)))
+    if len(ledger) and days:
+        streams, monthly, day_shares = stream_history(ledger, first_month, history_months)
+        projected = monthly_projection(monthly, first_month, horizon_months + 1, this_month)
+        month_of_day = np.array([(d.year - today.year) * 12 + d.month - today.month for d in days])
+        stream_flows = projected[:, month_of_day] * daily_weights(day_shares, days)
+        account_row = {a.pk: i for i, a in enumerate(accounts)}
+        rows = np.array([account_row.get(account_id, -1) for account_id in streams[:, 0]])
+        known = rows >= 0
+        np.add.at(flows, rows[known], stream_flows[known])
+
+    opening = np.array([float(a.live_balance) for a in accounts]).reshape(-1, 1)
+    balances = opening + np.cumsum(flows, axis=1) / 100 if days else opening[:, :0]
+    month_ends = [i for i, d in enumerate(days) if (d + timedelta(days=1)).day == 1]
+    to_base = conversion.factors([a.currency for a in accounts], [today] * len(accounts))
+    total = (balances * to_base[:, None]).sum(axis=0) if len(accounts) else np.zeros(len(days))
+    # Balance on the last day of this month; today's if that is today
+    this_month_end = (add_months(this_month, 1) - today).days - 2
+    month_end_balance = total[this_month_end] if this_month_end >= 0 else (opening[:, 0] * to_base).sum()
+    round2 = lambda values: np.round(values, 2).tolist()
+    return {
+        'currency': conversion.base,
+        'missing_rates': sorted(conversion.missing),
+        'labels': [d.isoformat() for d in days],
+        'total': round2(total),
+        'month_end_labels': [days[i].isoformat() for i in month_ends],
+        'total_month_end': round2(total[month_ends]),
+        'accounts': [
+            {'id': a.pk, 'name': a.name, 'currency': a.currency, 'month_end': round2(balances[i, month_ends])}
+            for i, a in enumerate(accounts)
+        ],
+        'month_end_balance': round(float(month_end_balance), 2),
+        'horizon_balance': round2(total[-1]) if days else None,
+    }
@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.models import User
-from django.contrib.auth.forms import AuthenticationForm
-from .models import Transaction, Category, Account, Budget
+from .models import Transaction, Category, CategoryRule, Account, Budget, Profile, RecurringTransaction
+from .importer import IMPORT_FORMATS
+from .fx import currency_choices, rate_table
+from .rules import default_category, matching_category
 
 class SignUpForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput)
@@ -19,6 +21,28 @@ class SignUpForm(forms.ModelForm):
 
 class TransactionForm(forms.ModelForm):
     date = forms.DateField(widget=forms.DateInput(attrs={'type':'date'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Left empty, the user's categorization rules pick it (money.rules)
+        self.fields['category'].required = False
+
+    def clean(self):
+        cleaned = super().clean()
+        if (not cleaned.get('category') and cleaned.get('account') and cleaned.get('type')
+                and cleaned.get('amount') is not None):
+            category_id = matching_category(self.instance.user, cleaned.get('note'), cleaned['type'],
+                                            cleaned['account'].pk, cleaned['amount'])
+            if category_id:
+                cleaned['category'] = Category.objects.get(pk=category_id)
+        return cleaned
+
+    def save(self, commit=True):
+        # No rule applied: the default category, created here rather than while validating
+        if self.instance.category_id is None:
+            self.instance.category = default_category(self.instance.user, self.instance.type)
+        return super().save(commit)
+
     class Meta:
         model = Transaction
         fields = ['account','category','type','amount','date','note']
@@ -47,9 +71,19 @@ class CategoryForm(forms.ModelForm):
         fields = ['name','type']
 
 class AccountForm(forms.ModelForm):
+    currency = forms.ChoiceField(choices=currency_choices, required=False)
+
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
+        obj = self.instance
+        # Existing amounts are in the old currency; it is fixed once the account is used
+        if obj.pk and (obj.transaction_set.exists() or obj.archived_transactions.exists()):
+            self.fields['currency'].disabled = True
+
+    def clean_currency(self):
+        # Left out: the account keeps its currency (the default one for a new account)
+        return self.cleaned_data['currency'] or self.instance.currency
 
     def clean(self):
         cleaned = super().clean()
@@ -63,30 +97,137 @@ class AccountForm(forms.ModelForm):
 
     class Meta:
         model = Account
-        fields = ['name','balance']  # balance = opening balance
+        fields = ['name','currency','balance']  # balance = opening balance
+
+class ProfileForm(forms.ModelForm):
+    base_currency = forms.ChoiceField(choices=currency_choices)
+
+    class Meta:
+        model = Profile
+        fields = ['base_currency']
+
+class LoadedChoiceIterator(forms.models.ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.objects:
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.objects) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.objects)
+
+
+class LoadedModelChoiceField(forms.ModelChoiceField):
+    # Choices from objects loaded once, e.g. by the view for every form of a formset:
+    # rendering and cleaning run no queries
+    iterator = LoadedChoiceIterator
+
+    def __init__(self, model, **kwargs):
+        super().__init__(queryset=model.objects.none(), **kwargs)
+        self.objects = []
+
+    @property
+    def objects(self):
+        return self._objects
+
+    @objects.setter
+    def objects(self, objects):
+        self._objects = list(objects)
+        self._by_pk = {str(obj.pk): obj for obj in self._objects}
+        self.widget.choices = self.choices
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self._by_pk.get(str(getattr(value, 'pk', value)))
+        if obj is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return obj
+
 
 class TransferForm(forms.Form):
-    from_account = forms.ModelChoiceField(queryset=Account.objects.none())
-    to_account   = forms.ModelChoiceField(queryset=Account.objects.none())
+    from_account = LoadedModelChoiceField(Account)
+    to_account   = LoadedModelChoiceField(Account)
     amount       = forms.DecimalField(min_value=0.01, max_digits=12, decimal_places=2)
     date         = forms.DateField(widget=forms.DateInput(attrs={'type':'date'}))
     note         = forms.CharField(required=False)
 
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user')
+        # ``accounts``: the user's accounts, loaded once for the whole formset
+        accounts = kwargs.pop('accounts', None)
+        user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        qs = Account.objects.filter(user=user).order_by('name')
-        self.fields['from_account'].queryset = qs
-        self.fields['to_account'].queryset = qs
+        if accounts is None:
+            accounts = Account.objects.filter(user=user).order_by('name')
+        self.fields['from_account'].objects = accounts
+        self.fields['to_account'].objects = accounts
 
     def clean(self):
         cleaned = super().clean()
-        if cleaned.get('from_account') == cleaned.get('to_account'):
+        src, dst = cleaned.get('from_account'), cleaned.get('to_account')
+        if src is not None and src == dst:
             raise forms.ValidationError('From and To accounts must be different.')
+        if src is not None and dst is not None and src.currency != dst.currency:
+            table = rate_table()
+            unquoted = [c for c in (src.currency, dst.currency) if not table.quoted(c)]
+            if unquoted:
+                raise forms.ValidationError(f"No exchange rate for {', '.join(unquoted)}.")
         return cleaned
 
+class CategoryRuleForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user')
+        super().__init__(*args, **kwargs)
+        self.fields['category'].queryset = Category.objects.filter(user=user)
+        self.fields['account'].queryset = Account.objects.filter(user=user).order_by('name')
+        self.fields['account'].empty_label = 'Any account'
+
+    class Meta:
+        model = CategoryRule
+        fields = ['kind','pattern','category','account','min_amount','max_amount','priority']
+
 class BudgetForm(forms.ModelForm):
     month = forms.DateField(widget=forms.DateInput(attrs={'type':'date'}))
     class Meta:
         model = Budget
-        fields = ['category','month','amount']
\ No newline at end of file
+        fields = ['category','month','amount']
+
+class ImportForm(forms.Form):
+    file = forms.FileField()
+    format = forms.ChoiceField(
+        choices=[('auto', 'Detect from file name')] + [(f, f.upper()) for f in IMPORT_FORMATS],
+        initial='auto',
+    )
+    account = forms.ModelChoiceField(
+        queryset=Account.objects.none(), required=False,
+        help_text='Used for rows that do not name an account (QIF/OFX).',
+    )
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user')
+        super().__init__(*args, **kwargs)
+        self.fields['account'].queryset = Account.objects.filter(user=user).order_by('name')
+
+class RecurringForm(forms.ModelForm):
+    start_date = forms.DateField(widget=forms.DateInput(attrs={'type':'date'}))
+    end_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type':'date'}))
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user')
+        super().__init__(*args, **kwargs)
+        self.fields['account'].queryset = Account.objects.filter(user=user).order_by('name')
+        self.fields['category'].queryset = Category.objects.filter(user=user)
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get('start_date'), cleaned.get('end_date')
+        if start and end and end < start:
+            raise forms.ValidationError('End date must be on or after the start date.')
+        return cleaned
+
+    class Meta:
+        model = RecurringTransaction
+        fields = ['account','category','type','amount','note','frequency','interval','start_date','end_date']
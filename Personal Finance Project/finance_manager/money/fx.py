@@ -0,0 +1,249 @@
+"""
+Currency conversion from a local table of FX rates.
+
+Every Account holds amounts in its own ``currency``; totals that mix accounts
+(dashboard, budgets, reports, forecast) are shown in the user's base currency
+(``Profile.base_currency``, ``settings.DEFAULT_CURRENCY`` when unset).
+
+Rates are read from the ``*.csv`` files in ``settings.FX_RATES_DIR``, no live
+service involved. Each line quotes one currency on one day against
+``settings.FX_REFERENCE_CURRENCY``::
+
+    date,currency,rate
+    2025-08-01,USD,0.2365      # 1 MYR = 0.2365 USD
+
+An amount converts at the latest quote on or before its day (the first quote
+for days before the file starts). The files are parsed into a ``RateTable`` of
+NumPy arrays once per change of the files (an LRU cache keyed by their mtimes,
+shared by every request of the process, which looks at the mtimes at most every
+``settings.FX_RATES_CHECK_SECONDS``); a request takes the table once and
+converts whole columns of grouped totals at a time, never row by row.
+
+A currency the files do not quote does not fail a page: a ``Conversion``
+counts its amounts as zero, so the account drops out of the totals, and lists
+it in ``missing`` for the page to warn about.
+"""
+import csv
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import SimpleLazyObject
+
+from .cents import from_cents, to_cents
+from .ledger import add_months
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+class MissingRate(LookupError):
+    """No quote for a currency in the rate files."""
+
+
+def reference_currency():
+    return getattr(settings, 'FX_REFERENCE_CURRENCY', None) or settings.DEFAULT_CURRENCY
+
+
+class RateTable:
+    def __init__(self, quotes=None):
+        # currency -> (sorted datetime64[D] days, float64 units of currency per reference unit)
+        self.quotes = quotes or {}
+
+    def currencies(self):
+        return sorted({reference_currency(), *self.quotes})
+
+    def quoted(self, currency):
+        return currency == reference_currency() or currency in self.quotes
+
+    def rates(self, currency, days):
+        """Units of ``currency`` per reference unit on each of ``days``."""
+        if currency == reference_currency():
+            return np.ones(len(days))
+        try:
+            quoted, rates = self.quotes[currency]
+        except KeyError:
+            raise MissingRate(f'No FX rate for {currency} in {settings.FX_RATES_DIR}') from None
+        idx = np.searchsorted(quoted, days, side='right') - 1
+        return rates[np.maximum(idx, 0)]
+
+    def factors(self, currencies, days, base, missing=None, codes=None):
+        """
+        Multiplier taking an amount in ``currencies[i]`` on ``days[i]`` to
+        ``base`` (one currency, or one per amount). A pair with an unquoted
+        side raises MissingRate, or, given a ``missing`` set, gets 0 and adds
+        the unquoted currency to it.
+
+        With ``codes``, ``currencies`` lists the distinct currencies and
+        amount i is in ``currencies[codes[i]]``: callers that already know
+        (e.g. one currency per account) skip coding a string per amount.
+        """
+        if codes is None:
+            currencies, codes = np.unique(np.asarray(currencies, dtype=str), return_inverse=True)
+        currencies, codes = np.asarray(currencies, dtype=str).tolist(), np.asarray(codes, dtype=np.int64).reshape(-1)
+        bases = np.asarray(base, dtype=str)
+        if bases.ndim:
+            bases, base_codes = np.unique(bases, return_inverse=True)
+        else:
+            bases, base_codes = bases.reshape(1), np.zeros(len(codes), dtype=np.int64)
+        bases = bases.tolist()
+        # A rate matrix: a row per currency involved, a column per distinct day
+        names = sorted({*currencies, *bases})
+        position = {name: i for i, name in enumerate(names)}
+        src = np.array([position[c] for c in currencies], dtype=np.int64)[codes]
+        dst = np.array([position[c] for c in bases], dtype=np.int64)[base_codes.reshape(-1)]
+        day_list, day_codes = np.unique(np.asarray(days, dtype='datetime64[D]'), return_inverse=True)
+        day_codes = day_codes.reshape(-1)
+        matrix = np.full((len(names), len(day_list)), np.nan)
+        for i, name in enumerate(names):
+            if self.quoted(name):
+                matrix[i] = self.rates(name, day_list)
+        with np.errstate(invalid='ignore'):
+            out = np.where(src == dst, 1.0, matrix[dst, day_codes] / matrix[src, day_codes])
+        unpriced = np.isnan(out)
+        if unpriced.any():
+            unquoted = sorted(
+                names[i] for i in np.unique(np.concatenate([src[unpriced], dst[unpriced]])).tolist()
+                if not self.quoted(names[i])
+            )
+            if missing is None:
+                raise MissingRate(f'No FX rate for {unquoted[0]} in {settings.FX_RATES_DIR}')
+            out[unpriced] = 0
+            missing.update(unquoted)
+        return out
+
+    def convert(self, cents, currencies, days, base, missing=None, codes=None):
+        """Amounts in int cents, converted to ``base``, as an int64 array."""
+        cents = np.asarray(cents, dtype=np.float64)
+        return np.rint(cents * self.factors(currencies, days, base, missing, codes)).astype(np.int64)
+
+
+def rate_files():
+    directory = Path(settings.FX_RATES_DIR)
+    return sorted(directory.glob('*.csv')) if directory.is_dir() else []
+
+
+_checked = {}  # FX_RATES_DIR -> (time.monotonic() of the last look at its files, their signature)
+
+
+def _signature():
+    directory = str(settings.FX_RATES_DIR)
+    checked_at, signature = _checked.get(directory, (None, None))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at >= getattr(settings, 'FX_RATES_CHECK_SECONDS', 5):
+        signature = tuple((str(path), path.stat().st_mtime_ns) for path in rate_files())
+        _checked[directory] = (now, signature)
+    return signature
+
+
+@lru_cache(maxsize=4)
+def _load(signature):
+    by_currency = {}
+    for path, _ in signature:  # later files win for the same day
+        with open(path, newline='', encoding='utf-8') as f:
+            for line, row in enumerate(csv.DictReader(f), 2):
+                try:
+                    day, rate = date.fromisoformat(row['date'].strip()), float(row['rate'])
+                    currency = row['currency'].strip().upper()
+                except (KeyError, AttributeError, ValueError):
+                    raise ImproperlyConfigured(f'{path}:{line}: expected date,currency,rate') from None
+                if rate <= 0:
+                    raise ImproperlyConfigured(f'{path}:{line}: rate must be positive')
+                by_currency.setdefault(currency, {})[day] = rate
+    quotes = {}
+    for currency, rates in by_currency.items():
+        days = sorted(rates)
+        quotes[currency] = (np.array(days, dtype='datetime64[D]'), np.array([rates[d] for d in days]))
+    return RateTable(quotes)
+
+
+def rate_table():
+    """The table for the rate files as they are now; parsed only when they changed."""
+    return _load(_signature())
+
+
+def table_version():
+    """Changes whenever the rate files do; part of every cached figure's key (money.caching)."""
+    return hashlib.sha1(repr(_signature()).encode()).hexdigest()[:12]
+
+
+def currency_choices():
+    currencies = sorted({settings.DEFAULT_CURRENCY, *rate_table().currencies()})
+    return [(c, c) for c in currencies]
+
+
+def closing_day(month, today):
+    """The day whose rates convert a month's flows: its last day, today for the current month."""
+    return min(add_months(month, 1) - timedelta(days=1), today)
+
+
+def base_currencies(user_ids):
+    found = dict(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', 'base_currency'))
+    return {user_id: found.get(user_id, settings.DEFAULT_CURRENCY) for user_id in user_ids}
+
+
+def base_currency(user, accounts=None):
+    """
+    The user's base currency. Free (no query) when ``accounts`` is a non-empty
+    list loaded with ``select_related('user__profile')``.
+    """
+    if accounts:
+        try:
+            return accounts[0].user.profile.base_currency
+        except Profile.DoesNotExist:
+            return settings.DEFAULT_CURRENCY
+    found = Profile.objects.filter(user=user).values_list('base_currency', flat=True).first()
+    return found or settings.DEFAULT_CURRENCY
+
+
+@dataclass(frozen=True)
+class Conversion:
+    """
+    Everything a request converts goes through one of these: one base, one
+    table. Currencies without a quote convert to zero and collect in ``missing``.
+    """
+    base: str
+    table: RateTable
+    missing: set = field(default_factory=set, compare=False)
+
+    @classmethod
+    def for_user(cls, user, accounts=None):
+        return cls(base_currency(user, accounts), rate_table())
+
+    def _note_missing(self, found):
+        if found - self.missing:
+            logger.warning('No FX rate for %s; left out of the %s totals', ', '.join(sorted(found)), self.base)
+            self.missing.update(found)
+
+    def factors(self, currencies, days, codes=None):
+        found = set()
+        factors = self.table.factors(currencies, days, self.base, found, codes)
+        self._note_missing(found)
+        return factors
+
+    def cents(self, cents, currencies, days, codes=None):
+        found = set()
+        converted = self.table.convert(cents, currencies, days, self.base, found, codes)
+        self._note_missing(found)
+        return converted
+
+    def amounts(self, amounts, currencies, day):
+        """Decimal amounts (balances, a transfer) on one day, as Decimals in ``base``."""
+        cents = [to_cents(a or 0) for a in amounts]
+        return [from_cents(c) for c in self.cents(cents, list(currencies), [day] * len(cents)).tolist()]
+
+    def amount(self, amount, currency, day):
+        return self.amounts([amount], [currency], day)[0]
+
+
+def currency_context(request):
+    """Template context processor: ``base_currency`` labels the signed-in user's totals."""
+    if not request.user.is_authenticated:
+        return {'base_currency': settings.DEFAULT_CURRENCY}
+    return {'base_currency': SimpleLazyObject(lambda: base_currency(request.user))}
@@ -0,0 +1,247 @@
+"""
+Running aggregates derived from Transaction rows.
+
+Every time a transaction is saved or deleted (see money.signals) the change is
+applied as a delta to:
+
+* ``Account.transaction_total`` -- income - expense per account, so live
+  balances are read straight from the Account rows;
+* ``MonthlyCategoryTotal`` -- (user, month, category, type, account) -> total,
+  count, so month-level charts and budget-vs-actual figures read a handful of
+  rows (per account, so they can be converted by currency, see money.fx);
+* ``AccountCheckpoint`` -- running totals at the end of closed months; a
+  change dated in or before a checkpointed month shifts that checkpoint and
+  every later one (see money.checkpoints).
+
+Bulk operations that bypass model signals must feed a ``LedgerBatch`` or
+rebuild afterwards with ``manage.py rebuild_ledger`` / ``rebuild_rollups``.
+Archiving (money.archive) leaves rollups and checkpoints alone and only moves
+the archived amounts from ``transaction_total`` to ``Account.archived_total``.
+
+Deltas are accumulated and applied as int cents (money.cents), so merging a
+large batch does no Decimal arithmetic and the stored totals stay exact.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date
+
+from django.db import IntegrityError
+from django.db.models import BigIntegerField, Count, F
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import TruncMonth
+
+from . import sharding
+from .cents import SumCents, cents_value, from_cents, to_cents
+from .models import Account, AccountCheckpoint, ArchivedTransaction, MonthlyCategoryTotal, Transaction
+
+
+UPDATE_CHUNK = 500
+ROLLUP_KEY = ('user_id', 'month', 'category_id', 'type', 'account_id')
+
+
+def signed_cents(type, cents):
+    return cents if type == 'income' else -cents
+
+
+def month_start(d):
+    return d.replace(day=1)
+
+
+def add_months(anchor, months):
+    # Keeps the day of month where the target month has it (31st -> 30th/28th/29th)
+    month_index = anchor.month - 1 + months
+    year, month = anchor.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+
+
+def record_change(old, new):
+    """Apply the difference between two ledger states (either may be None)."""
+    record_changes([(old, new)])
+
+
+def record_changes(changes):
+    """Apply many (old, new) ledger state pairs, merging deltas per row first."""
+    batch = LedgerBatch()
+    for old, new in changes:
+        batch.add(old, new)
+    batch.apply()
+
+
+class LedgerBatch:
+    """
+    Accumulates merged deltas in memory so a bulk write touches each account
+    and rollup row once, however many transactions it inserts.
+    """
+
+    def __init__(self):
+        self.account_deltas = defaultdict(int)
+        self.checkpoint_deltas = defaultdict(int)
+        self.rollup_deltas = defaultdict(lambda: [0, 0])
+
+    def add(self, old, new):
+        for state, sign in ((old, -1), (new, 1)):
+            if not state:
+                continue
+            amount = to_cents(state['amount'] or 0)
+            delta = sign * signed_cents(state['type'], amount)
+            self.account_deltas[state['account_id']] += delta
+            self.checkpoint_deltas[(state['account_id'], month_start(state['date']))] += delta
+            key = (state['user_id'], month_start(state['date']), state['category_id'], state['type'],
+                   state['account_id'])
+            self.rollup_deltas[key][0] += sign * amount
+            self.rollup_deltas[key][1] += sign
+
+    def apply(self):
+        # Accounts first: their row locks order concurrent checkpoint creation
+        apply_account_deltas(self.account_deltas)
+        apply_checkpoint_deltas(self.checkpoint_deltas)
+        apply_rollup_deltas(self.rollup_deltas)
+        self.account_deltas.clear()
+        self.checkpoint_deltas.clear()
+        self.rollup_deltas.clear()
+
+
+def chunked(items, size=UPDATE_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def apply_account_deltas(deltas):
+    # One UPDATE per chunk of accounts; F() keeps concurrent writers from
+    # overwriting each other's deltas
+    for chunk in chunked((pk, delta) for pk, delta in deltas.items() if delta):
+        Account.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+            transaction_total=F('transaction_total') + _by_pk(chunk)
+        )
+
+
+def apply_archive_deltas(deltas):
+    # Rows leaving the live table: their sum moves to archived_total, so live
+    # balances do not change
+    for chunk in chunked((pk, delta) for pk, delta in deltas.items() if delta):
+        moved = _by_pk(chunk)
+        Account.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+            transaction_total=F('transaction_total') - moved,
+            archived_total=F('archived_total') + moved,
+        )
+
+
+def apply_checkpoint_deltas(deltas):
+    # Checkpoints only exist for closed months, so current-month changes skip the query
+    current_month = month_start(date.today())
+    for (account_id, month), delta in deltas.items():
+        if delta and month < current_month:
+            AccountCheckpoint.objects.filter(account_id=account_id, month__gte=month).update(
+                total=F('total') + cents_value(delta)
+            )
+
+
+def _by_pk(pairs):
+    # Raw ints: cents for the money columns, a plain number for counts. One simple
+    # CASE on the primary key written out directly: compiling a When() per row costs
+    # the ORM more than the UPDATE itself on large batches
+    whens = ' '.join(['WHEN %s THEN %s'] * len(pairs))
+    return RawSQL(f'CASE id {whens} END', [int(v) for pair in pairs for v in pair], output_field=BigIntegerField())
+
+
+def apply_rollup_deltas(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    for chunk in chunked(deltas):
+        existing = {
+            tuple(key): pk
+            for pk, *key in MonthlyCategoryTotal.objects.filter(
+                user_id__in={k[0] for k in chunk}, month__in={k[1] for k in chunk},
+                category_id__in={k[2] for k in chunk}, account_id__in={k[4] for k in chunk},
+            ).values_list('pk', *ROLLUP_KEY)
+        }
+        found = [(existing[key], deltas[key]) for key in chunk if key in existing]
+        if found:
+            MonthlyCategoryTotal.objects.filter(pk__in=[pk for pk, _ in found]).update(
+                total=F('total') + _by_pk([(pk, d[0]) for pk, d in found]),
+                count=F('count') + _by_pk([(pk, d[1]) for pk, d in found]),
+            )
+        missing = [key for key in chunk if key not in existing]
+        if not missing:
+            continue
+        try:
+            with sharding.atomic():
+                MonthlyCategoryTotal.objects.bulk_create([
+                    MonthlyCategoryTotal(**dict(zip(ROLLUP_KEY, key)),
+                                         total=from_cents(deltas[key][0]), count=deltas[key][1])
+                    for key in missing
+                ])
+        except IntegrityError:
+            # Another writer created some of these rows first; fall back to one row at a time
+            for key in missing:
+                _apply_rollup_delta(key, *deltas[key])
+
+
+def _apply_rollup_delta(key, total, count):
+    key = dict(zip(ROLLUP_KEY, key))
+    rows = MonthlyCategoryTotal.objects.filter(**key)
+    if rows.update(total=F('total') + cents_value(total), count=F('count') + count):
+        return
+    try:
+        with sharding.atomic():
+            MonthlyCategoryTotal.objects.create(**key, total=from_cents(total), count=count)
+    except IntegrityError:
+        # Lost the race to create the row; another writer inserted it first
+        rows.update(total=F('total') + cents_value(total), count=F('count') + count)
+
+
+def compute_account_totals(accounts):
+    """Recompute transaction_total from scratch for the given accounts."""
+    totals = {a.pk: 0 for a in accounts}
+    rows = (
+        Transaction.objects.filter(account__in=accounts)
+        .order_by()
+        .values('account_id', 'type')
+        .annotate(total=SumCents('amount'))
+    )
+    for row in rows:
+        totals[row['account_id']] += signed_cents(row['type'], row['total'])
+    return {pk: from_cents(total) for pk, total in totals.items()}
+
+
+def rebuild_account_totals(accounts, fix=True):
+    """
+    Compare stored totals against the transaction table.
+    Returns a list of (account, stored, actual) for every mismatch; when ``fix``
+    is set the stored values are corrected in the same database transaction.
+    """
+    with sharding.atomic():
+        accounts = list(accounts.select_for_update())
+        actual = compute_account_totals(accounts)
+        mismatches = []
+        for a in accounts:
+            if a.transaction_total != actual[a.pk]:
+                mismatches.append((a, a.transaction_total, actual[a.pk]))
+                a.transaction_total = actual[a.pk]
+        if fix and mismatches:
+            Account.objects.bulk_update([m[0] for m in mismatches], ['transaction_total'])
+    return mismatches
+
+
+def rebuild_rollups(user_ids, batch_size=1000):
+    """Recreate the MonthlyCategoryTotal rows of the given users from Transaction and the archive."""
+    with sharding.atomic():
+        MonthlyCategoryTotal.objects.filter(user_id__in=user_ids).delete()
+        merged = defaultdict(lambda: [0, 0])
+        for model in (Transaction, ArchivedTransaction):
+            rows = (
+                model.objects.filter(user_id__in=user_ids)
+                .order_by()
+                .annotate(month=TruncMonth('date'))
+                .values_list(*ROLLUP_KEY)
+                .annotate(total=SumCents('amount'), count=Count('id'))
+            )
+            for *key, total, count in rows.iterator(chunk_size=batch_size):
+                merged[tuple(key)][0] += total
+                merged[tuple(key)][1] += count
+        objs = [
+            MonthlyCategoryTotal(**dict(zip(ROLLUP_KEY, key)), total=from_cents(total), count=count)
+            for key, (total, count) in merged.items()
+        ]
+        MonthlyCategoryTotal.objects.bulk_create(objs, batch_size=batch_size)
+    return len(objs)
@@ -0,0 +1,46 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from money.archive import BATCH_SIZE, ArchiveResult, archive, archive_cutoff
+from money.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = 'Move transactions older than the archive cutoff to the archive table, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=date.fromisoformat,
+                            help='Archive rows dated before YYYY-MM-DD '
+                                 f'(default: {settings.ARCHIVE_AFTER_MONTHS} months back, see ARCHIVE_AFTER_MONTHS).')
+        parser.add_argument('--months', type=int, help='Archive rows older than this many months instead.')
+        parser.add_argument('--user', type=int, help='Only this user id.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Rows per database transaction.')
+        parser.add_argument('--after-pk', type=int, default=0,
+                            help='Skip rows up to this id (resume a run from its last reported id).')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches, to leave room for live traffic.')
+
+    def handle(self, *args, **options):
+        before = options['before'] or archive_cutoff(months=options['months'])
+
+        def progress(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'batch {result.batches}: {result.moved} row(s), last id {result.last_pk}')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        result = ArchiveResult()
+        for _ in each_shard(options['user']):
+            shard = archive(before, user_id=options['user'], batch_size=options['batch_size'],
+                            after_pk=options['after_pk'], on_batch=progress)
+            result.moved += shard.moved
+            result.batches += shard.batches
+            result.user_ids |= shard.user_ids
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {result.moved} transaction(s) dated before {before} '
+            f'in {result.batches} batch(es) for {len(result.user_ids)} user(s).'
+        ))
@@ -0,0 +1,122 @@
+"""
+Compare the sync dashboard with the concurrent one (money.async_dashboard).
+
+A throwaway user is seeded per scale, then both variants are timed twice:
+directly, with every dashboard loader (``dashboard_data`` vs
+``adashboard_data``), and end to end through Django's ASGI handler with the
+async test client (``dashboard`` vs ``dashboard_async``, which render the same
+context), so the sync view pays the sync-to-async hop just as it would under
+uvicorn or daphne::
+
+    python manage.py benchmark_dashboard_async --scales 10000,100000 --output bench_async.json
+
+The cache version is bumped before every run so both variants hit the
+database.
+"""
+import asyncio
+import json
+import platform
+import statistics
+import time
+from datetime import date
+
+import django
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient
+from django.urls import reverse
+
+from money import sharding
+from money.async_dashboard import adashboard_data
+from money.caching import bump_data_version
+from money.dashboard import dashboard_data
+from money.seeding import seed_user
+
+from .benchmark_views import drop_user, percentile
+
+
+def summarize(timings):
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the sync dashboard against the async one running its loaders concurrently.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000',
+                            help='Comma-separated transaction counts, e.g. 10000,100000.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--months', type=int, default=36)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Do not delete the benchmark users.')
+        parser.add_argument('--output', default='bench_results_async.json')
+
+    def handle(self, *args, **options):
+        results = {
+            'meta': {
+                'date': date.today().isoformat(),
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+            },
+            'scales': [],
+        }
+        for scale in [int(s) for s in options['scales'].split(',') if s.strip()]:
+            self.stdout.write(f'Seeding {scale} transactions...')
+            user = seed_user(f'bench_async_{scale}_{int(time.time())}', scale, options['months'], options['seed'])
+            try:
+                with sharding.use_user_shard(user.pk):
+                    results['scales'].append({'transactions': scale, **self.run_variants(user, options)})
+            finally:
+                if not options['keep']:
+                    drop_user(user)
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def run_variants(self, user, options):
+        repeat = options['repeat']
+        loaders = {
+            'sync': lambda: dashboard_data(user),
+            'async': lambda: async_to_sync(adashboard_data)(user),
+        }
+        direct = {}
+        for name, load in loaders.items():
+            timings = []
+            for _ in range(repeat):
+                bump_data_version(user.pk)
+                started = time.perf_counter()
+                load()
+                timings.append((time.perf_counter() - started) * 1000)
+            direct[name] = summarize(timings)
+            self.report(f'{name} data', direct[name])
+
+        asgi = asyncio.run(self.run_asgi(user, repeat))
+        for name, stats in asgi.items():
+            self.report(f'{name} asgi', stats)
+        return {'direct': direct, 'asgi': asgi}
+
+    async def run_asgi(self, user, repeat):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        out = {}
+        for name, url in (('sync', reverse('dashboard')), ('async', reverse('dashboard_async'))):
+            timings = []
+            for _ in range(repeat):
+                await sync_to_async(bump_data_version)(user.pk)
+                started = time.perf_counter()
+                response = await client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, f'{url}: HTTP {response.status_code}'
+            out[name] = summarize(timings)
+        return out
+
+    def report(self, label, stats):
+        self.stdout.write(f"  {label:<11} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms")
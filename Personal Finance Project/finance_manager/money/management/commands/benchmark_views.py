@@ -0,0 +1,126 @@
+"""
+Time the main views against synthetic ledgers of increasing size.
+
+For every scale a throwaway user is seeded (money.seeding), each view is
+requested ``--repeat`` times through the test client and the latency
+percentiles and query counts are written as JSON, e.g.::
+
+    python manage.py benchmark_views --scales 1000,10000,100000 --output bench.json
+
+Compare two result files to spot regressions between versions. By default the
+user's cache version is bumped before every request so cached dashboards do not
+hide the query cost; pass --warm to measure the cached path instead.
+"""
+import json
+import platform
+import statistics
+import time
+from contextlib import ExitStack
+from datetime import date
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from money import sharding
+from money.caching import bump_data_version
+from money.models import Account, Transaction
+from money.seeding import seed_user
+
+VIEWS = ('dashboard', 'transactions', 'accounts', 'budgets', 'account_transfer')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def drop_user(user):
+    # Plain DELETE: the user and all derived rows go away, so per-row
+    # ledger signals would only cost time. The rows are on the user's shard
+    with connections[sharding.shard_for_user(user.pk)].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {Transaction._meta.db_table} WHERE user_id = %s', [user.pk])
+    user.delete()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark dashboard, transaction/account/budget lists and transfers at several data sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000',
+                            help='Comma-separated transaction counts, e.g. 1000,100000,10000000.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--months', type=int, default=36)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--warm', action='store_true', help='Keep the dashboard cache warm.')
+        parser.add_argument('--keep', action='store_true', help='Do not delete the benchmark users.')
+        parser.add_argument('--output', default='bench_results.json')
+
+    def handle(self, *args, **options):
+        results = {
+            'meta': {
+                'date': date.today().isoformat(),
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'warm_cache': options['warm'],
+            },
+            'scales': [],
+        }
+        for scale in [int(s) for s in options['scales'].split(',') if s.strip()]:
+            self.stdout.write(f'Seeding {scale} transactions...')
+            user = seed_user(f'bench_{scale}_{int(time.time())}', scale, options['months'], options['seed'])
+            try:
+                with sharding.use_user_shard(user.pk):
+                    results['scales'].append({'transactions': scale, 'views': self.run_views(user, options)})
+            finally:
+                if not options['keep']:
+                    drop_user(user)
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def run_views(self, user, options):
+        client = Client()
+        client.force_login(user)
+        src, dst = Account.objects.filter(user=user).order_by('pk')[:2]
+        transfer = {'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '0',
+                    'form-0-from_account': src.pk, 'form-0-to_account': dst.pk, 'form-0-amount': '1.00',
+                    'form-0-date': date.today().isoformat(), 'form-0-note': 'benchmark'}
+        # auth/sessions on default, money rows on the user's shard (money.sharding)
+        aliases = sorted({DEFAULT_DB_ALIAS, sharding.db()})
+        out = {}
+        for name in VIEWS:
+            url = reverse(name)
+            timings, queries = [], []
+            for _ in range(options['repeat']):
+                if not options['warm']:
+                    bump_data_version(user.pk)
+                with ExitStack() as stack:
+                    captured = [stack.enter_context(CaptureQueriesContext(connections[a])) for a in aliases]
+                    started = time.perf_counter()
+                    if name == 'account_transfer':
+                        response = client.post(url, transfer)
+                    else:
+                        response = client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(sum(len(ctx.captured_queries) for ctx in captured))
+                expected = 302 if name == 'account_transfer' else 200
+                assert response.status_code == expected, f'{name}: HTTP {response.status_code}'
+            out[name] = {
+                'p50_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'max_ms': round(max(timings), 3),
+                'queries': max(queries),
+            }
+            self.stdout.write(
+                f"  {name:<17} p50 {out[name]['p50_ms']:>9.2f} ms  p95 {out[name]['p95_ms']:>9.2f} ms  "
+                f"{out[name]['queries']} queries"
+            )
+        return out
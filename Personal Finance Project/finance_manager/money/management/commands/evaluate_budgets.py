@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from money.budgets import USERS_PER_BATCH, evaluate
+from money.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = 'Evaluate budget vs actual for all users and store over/near-limit snapshots (run nightly).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Re-evaluate every user, not only those whose data changed.')
+        parser.add_argument('--user', type=int, help='Only this user id.')
+        parser.add_argument('--users-per-batch', type=int, default=USERS_PER_BATCH)
+
+    def handle(self, *args, **options):
+        user_ids = [options['user']] if options['user'] else None
+        users = written = 0
+        for _ in each_shard(options['user']):
+            shard_users, shard_written = evaluate(options['full'], user_ids, options['users_per_batch'])
+            users += shard_users
+            written += shard_written
+        self.stdout.write(self.style.SUCCESS(f'Evaluated {written} budget(s) for {users} user(s).'))
@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from money.export import CHUNK_SIZE, EXPORT_FORMATS, iter_export
+from money.search import filter_transactions
+from money.sharding import use_user_shard
+
+
+class Command(BaseCommand):
+    help = "Stream a user's transactions as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--q', default='', help='Same search as the transaction list.')
+        parser.add_argument('--account', type=int)
+        parser.add_argument('--start', type=date.fromisoformat, help='YYYY-MM-DD (inclusive)')
+        parser.add_argument('--end', type=date.fromisoformat, help='YYYY-MM-DD (inclusive)')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--archived', action='store_true',
+                            help='Export the archived transactions (see archive_transactions) instead.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+        with use_user_shard(user.pk):
+            self.export_for(user, options)
+
+    def export_for(self, user, options):
+        tx = filter_transactions(user, options['q'], options['account'], options['start'], options['end'],
+                                 archived=options['archived'])
+        chunks = iter_export(tx, options['format'], options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+            for chunk in chunks:
+                out.write(chunk)
@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from money.importer import CHUNK_SIZE, IMPORT_FORMATS, guess_format, import_transactions
+from money.models import Account
+from money.sharding import use_user_shard
+
+
+class Command(BaseCommand):
+    help = 'Bulk import transactions for a user from a CSV, QIF or OFX file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Default: from the file extension.')
+        parser.add_argument('--account', help='Account name for rows that do not name one.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+        with use_user_shard(user.pk):
+            self.import_for(user, options)
+
+    def import_for(self, user, options):
+        account = None
+        if options['account']:
+            try:
+                account = Account.objects.get(user=user, name=options['account'])
+            except Account.DoesNotExist:
+                raise CommandError(f"Account {options['account']!r} does not exist.")
+
+        fmt = options['format'] or guess_format(options['path'])
+        with open(options['path'], encoding='utf-8-sig', errors='replace', newline='') as f:
+            result = import_transactions(user, f, fmt, account, options['chunk_size'])
+
+        for line, message in result.errors:
+            self.stderr.write(f'line {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} row(s) in {result.seconds:.2f}s '
+            f'({result.rows_per_second:.0f} rows/s), {len(result.errors)} error(s).'
+        ))
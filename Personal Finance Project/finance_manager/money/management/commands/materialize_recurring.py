@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from money.recurring import DEFAULT_BATCH_SIZE, materialize
+from money.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = 'Create the transactions of every recurring schedule due up to a horizon (run nightly).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', type=date.fromisoformat, help='Horizon YYYY-MM-DD (default: today).')
+        parser.add_argument('--days-ahead', type=int, default=0,
+                            help='Also create occurrences this many days past the horizon.')
+        parser.add_argument('--user', type=int, help='Only this user id.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Schedules per database transaction.')
+
+    def handle(self, *args, **options):
+        until = (options['until'] or date.today()) + timedelta(days=options['days_ahead'])
+
+        created = schedules = finished = 0
+        for _ in each_shard(options['user']):
+            result = materialize(until, user_id=options['user'], batch_size=options['batch_size'])
+            created += result.created
+            schedules += result.schedules
+            finished += result.finished
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} transaction(s) from {schedules} due schedule(s) '
+            f'up to {until}; {finished} schedule(s) ended.'
+        ))
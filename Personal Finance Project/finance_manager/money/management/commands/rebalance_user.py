@@ -0,0 +1,31 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from money.caching import bump_data_version
+from money.sharding import BATCH_SIZE, move_user, shard_aliases, shard_for_user
+
+
+class Command(BaseCommand):
+    help = "Move a user's rows to another shard in batches (see money.sharding); safe to re-run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('target', help='Database alias listed in DATABASE_SHARDS.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per copy/delete statement.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+        if options['target'] not in shard_aliases():
+            raise CommandError(f"{options['target']!r} is not one of {', '.join(shard_aliases())}.")
+
+        source = shard_for_user(user.pk)
+        copied = move_user(user.pk, options['target'], options['batch_size'])
+        bump_data_version(user.pk)
+        for model, rows in copied.items():
+            self.stdout.write(f'{model}: {rows}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {user.username} from {source} to {options['target']} ({sum(copied.values())} row(s))."
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from money.checkpoints import rebuild_checkpoints
+from money.models import Account
+from money.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = 'Drop and recreate the month-end balance checkpoints of each account.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only process accounts of this user id.')
+        parser.add_argument('--account', type=int, help='Only process this account id.')
+
+    def handle(self, *args, **options):
+        created = 0
+        for _ in each_shard(options['user']):
+            accounts = Account.objects.order_by('pk')
+            if options['user']:
+                accounts = accounts.filter(user_id=options['user'])
+            if options['account']:
+                accounts = accounts.filter(pk=options['account'])
+            created += rebuild_checkpoints(accounts.iterator())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} checkpoint(s).'))
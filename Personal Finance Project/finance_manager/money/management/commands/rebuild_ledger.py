@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from money import ledger
+from money.caching import bump_data_version
+from money.models import Account
+from money.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or with --check, verify) the per-account running balances.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only process accounts of this user id.')
+        parser.add_argument('--check', action='store_true',
+                            help='Report mismatches without fixing them; exits non-zero if any are found.')
+
+    def handle(self, *args, **options):
+        mismatches = []
+        for _ in each_shard(options['user']):
+            accounts = Account.objects.order_by('pk')
+            if options['user']:
+                accounts = accounts.filter(user_id=options['user'])
+            mismatches += ledger.rebuild_account_totals(accounts, fix=not options['check'])
+        for account, stored, actual in mismatches:
+            self.stdout.write(f'{account.user_id}/{account.pk} {account.name}: stored {stored}, actual {actual}')
+        if not options['check']:
+            for user_id in {account.user_id for account, _, _ in mismatches}:
+                bump_data_version(user_id)
+
+        if options['check'] and mismatches:
+            raise CommandError(f'{len(mismatches)} account balance(s) out of sync.')
+        verb = 'Verified' if options['check'] else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(f'{verb} account balances ({len(mismatches)} mismatch(es)).'))
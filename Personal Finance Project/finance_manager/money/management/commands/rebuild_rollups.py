@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from money import ledger
+from money.caching import bump_data_version
+from money.sharding import each_shard, shard_user_ids
+
+
+class Command(BaseCommand):
+    help = 'Backfill the monthly (user, month, category, type) transaction rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild this user id.')
+        parser.add_argument('--users-per-batch', type=int, default=100)
+
+    def handle(self, *args, **options):
+        step = options['users_per_batch']
+        rows = users = 0
+        for alias in each_shard(options['user']):
+            user_ids = shard_user_ids(alias)
+            if options['user']:
+                user_ids = user_ids.filter(pk=options['user'])
+            user_ids = list(user_ids)
+
+            for i in range(0, len(user_ids), step):
+                rows += ledger.rebuild_rollups(user_ids[i:i + step])
+            for user_id in user_ids:
+                bump_data_version(user_id)
+            users += len(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup row(s) for {users} user(s).'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from money.models import CategoryRule
+from money.rules import BATCH_SIZE, recategorize
+from money.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = "Apply each user's categorization rules to their existing transactions, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only this user id.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Rows read and updated per database transaction.')
+        parser.add_argument('--uncategorized-only', action='store_true',
+                            help='Only touch rows in the Uncategorized categories.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the rows that would change without writing.')
+
+    def handle(self, *args, **options):
+        changed, users = 0, 0
+        for _ in each_shard(options['user']):
+            user_ids = CategoryRule.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+            if options['user']:
+                user_ids = user_ids.filter(user_id=options['user'])
+            for user_id in list(user_ids):
+                rows = recategorize(user_id, batch_size=options['batch_size'],
+                                    uncategorized_only=options['uncategorized_only'], dry_run=options['dry_run'])
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'user {user_id}: {rows} row(s)')
+                changed += rows
+                users += 1
+        verb = 'Would re-categorize' if options['dry_run'] else 'Re-categorized'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {changed} transaction(s) for {users} user(s).'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from money.seeding import seed_user
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users with accounts, categories, budgets and transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--transactions', type=int, default=1000, help='Transactions per user.')
+        parser.add_argument('--months', type=int, default=36, help='History length per user.')
+        parser.add_argument('--prefix', default='seed', help='Usernames are <prefix><n>.')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for repeatable data.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = 0
+        for i in range(options['users']):
+            username = f"{options['prefix']}{i}"
+            seed = None if options['seed'] is None else options['seed'] + i
+            seed_user(
+                username, options['transactions'], options['months'], seed,
+                options['password'], options['batch_size'],
+            )
+            total += options['transactions']
+            self.stdout.write(f'{username}: {options["transactions"]} transaction(s)')
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {options["users"]} user(s), {total} transaction(s) in {seconds:.1f}s '
+            f'({total / seconds if seconds else 0:.0f} rows/s).'
+        ))
@@ -0,0 +1,168 @@
+"""
+In-process request metrics, exported in Prometheus text format.
+
+RequestMetricsMiddleware records, per URL name, a latency histogram, the number
+of SQL queries and the time spent in the database (via
+``connection.execute_wrapper``), and counts requests that issue more than
+settings.METRICS_QUERY_BUDGET queries. Queries a request runs in worker threads
+of its own (money.async_dashboard) are counted through ``track_queries``. Everything lives in a dict guarded by a
+lock in the worker process, so it is cheap enough to leave on; each worker
+exposes its own numbers at /metrics/. The dashboard cache hit/miss counters
+(money.caching) are exported alongside; they live in the cache backend, so
+with a shared one they cover every worker.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from .caching import cache_stats
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_timer = ContextVar('money_query_timer', default=None)
+
+
+class ViewStats:
+    __slots__ = ('buckets', 'count', 'seconds', 'queries', 'db_seconds', 'over_budget')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.over_budget = 0
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, seconds, queries, db_seconds, over_budget):
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.buckets[bisect_left(BUCKETS, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.queries += queries
+            stats.db_seconds += db_seconds
+            stats.over_budget += over_budget
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {view: (list(s.buckets), s.count, s.seconds, s.queries, s.db_seconds, s.over_budget)
+                    for view, s in self.views.items()}
+
+
+registry = Registry()
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot=None, cache_counts=None):
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    cache_counts = cache_stats() if cache_counts is None else cache_counts
+    lines = [
+        '# HELP money_view_request_seconds Request latency by URL name.',
+        '# TYPE money_view_request_seconds histogram',
+    ]
+    for view, (buckets, count, seconds, *_) in sorted(snapshot.items()):
+        label = _label(view)
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float('inf'),), buckets):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'money_view_request_seconds_bucket{{view="{label}",le="{le}"}} {cumulative}')
+        lines.append(f'money_view_request_seconds_sum{{view="{label}"}} {seconds:.6f}')
+        lines.append(f'money_view_request_seconds_count{{view="{label}"}} {count}')
+
+    counters = (
+        ('money_view_queries_total', 'SQL queries issued by URL name.', 3, '{}'),
+        ('money_view_db_seconds_total', 'Time spent in SQL by URL name.', 4, '{:.6f}'),
+        ('money_view_over_query_budget_total', 'Requests over METRICS_QUERY_BUDGET queries.', 5, '{}'),
+    )
+    for name, help_text, index, fmt in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for view, values in sorted(snapshot.items()):
+            lines.append(f'{name}{{view="{_label(view)}"}} {fmt.format(values[index])}')
+
+    lines.append('# HELP money_dashboard_cache_requests_total Dashboard cache lookups by outcome.')
+    lines.append('# TYPE money_dashboard_cache_requests_total counter')
+    for outcome, count in sorted(cache_counts.items()):
+        lines.append(f'money_dashboard_cache_requests_total{{outcome="{outcome}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """execute_wrapper callable counting queries and their wall time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()  # shared with track_queries() threads
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.seconds += time.perf_counter() - started
+                self.queries += 1
+
+
+@contextmanager
+def track_queries():
+    """Count this thread's queries towards the current request (for work done off the request thread)."""
+    timer = _timer.get()
+    with ExitStack() as stack:
+        if timer is not None:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(timer))
+        yield
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        token = _timer.set(timer)  # copied into sync_to_async threads with the rest of the context
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            _timer.reset(token)
+        seconds = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        budget = getattr(settings, 'METRICS_QUERY_BUDGET', None)
+        over_budget = budget is not None and timer.queries > budget
+        if over_budget:
+            logger.warning('%s issued %d queries (budget %d) in %.1f ms',
+                           request.path, timer.queries, budget, seconds * 1000)
+        registry.observe(view, seconds, timer.queries, timer.seconds, over_budget)
+        return response
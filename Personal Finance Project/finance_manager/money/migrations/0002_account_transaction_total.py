@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:01
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_transaction_total(apps, schema_editor):
+    Account = apps.get_model('money', 'Account')
+    Transaction = apps.get_model('money', 'Transaction')
+    db = schema_editor.connection.alias
+    totals = {}
+    rows = (
+        Transaction.objects.using(db).order_by()
+        .values('account_id', 'type')
+        .annotate(total=Sum('amount'))
+    )
+    for row in rows:
+        amount = row['total'] or 0
+        totals[row['account_id']] = totals.get(row['account_id'], 0) + (amount if row['type'] == 'income' else -amount)
+    for account_id, total in totals.items():
+        Account.objects.using(db).filter(pk=account_id).update(transaction_total=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='transaction_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.RunPython(backfill_transaction_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    Transaction = apps.get_model('money', 'Transaction')
+    MonthlyCategoryTotal = apps.get_model('money', 'MonthlyCategoryTotal')
+    db = schema_editor.connection.alias
+    rows = (
+        Transaction.objects.using(db).order_by()
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'month', 'category_id', 'type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    MonthlyCategoryTotal.objects.using(db).bulk_create(
+        (MonthlyCategoryTotal(**row) for row in rows.iterator(chunk_size=1000)), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0002_account_transaction_total'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyCategoryTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=7)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='money.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-month'],
+                'unique_together': {('user', 'month', 'category', 'type')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Full-text index on Transaction.note, used by money.search.
+# MySQL gets a FULLTEXT index; SQLite (local/test runs) gets an external-content
+# FTS5 table kept in sync by triggers. Other backends fall back to LIKE.
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE money_transaction_fts USING fts5("
+    "note, content='money_transaction', content_rowid='id')",
+    "CREATE TRIGGER money_transaction_fts_ai AFTER INSERT ON money_transaction BEGIN "
+    "INSERT INTO money_transaction_fts(rowid, note) VALUES (new.id, new.note); END",
+    "CREATE TRIGGER money_transaction_fts_ad AFTER DELETE ON money_transaction BEGIN "
+    "INSERT INTO money_transaction_fts(money_transaction_fts, rowid, note) VALUES ('delete', old.id, old.note); END",
+    "CREATE TRIGGER money_transaction_fts_au AFTER UPDATE OF note ON money_transaction BEGIN "
+    "INSERT INTO money_transaction_fts(money_transaction_fts, rowid, note) VALUES ('delete', old.id, old.note); "
+    "INSERT INTO money_transaction_fts(rowid, note) VALUES (new.id, new.note); END",
+    "INSERT INTO money_transaction_fts(money_transaction_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS money_transaction_fts_ai",
+    "DROP TRIGGER IF EXISTS money_transaction_fts_ad",
+    "DROP TRIGGER IF EXISTS money_transaction_fts_au",
+    "DROP TABLE IF EXISTS money_transaction_fts",
+]
+MYSQL_FORWARD = ["ALTER TABLE money_transaction ADD FULLTEXT INDEX tx_note_fulltext (note)"]
+MYSQL_BACKWARD = ["ALTER TABLE money_transaction DROP INDEX tx_note_fulltext"]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'mysql': MYSQL_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'mysql': MYSQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0005_transaction_note_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='transfer_key',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:26
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# SQLite applies these schema changes by rebuilding money_transaction, which
+# drops the full-text sync triggers of 0005; recreate them (and the index)
+fulltext = import_module('money.migrations.0005_transaction_note_fulltext')
+restore_fulltext = fulltext.run({'sqlite': fulltext.SQLITE_BACKWARD[:3] + fulltext.SQLITE_FORWARD[1:]})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0006_transaction_transfer_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fulltext),
+        migrations.CreateModel(
+            name='RecurringTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=7)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], default='monthly', max_length=7)),
+                ('interval', models.PositiveSmallIntegerField(default=1, help_text='Every N days/weeks/months/years')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('next_date', models.DateField(editable=False, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='money.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='money.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['next_date', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='recurring',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='money.recurringtransaction'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('recurring', 'date'), name='tx_recurring_date_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringtransaction',
+            index=models.Index(fields=['next_date', 'id'], name='recurring_due_idx'),
+        ),
+        migrations.RunPython(restore_fulltext, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0007_recurringtransaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetSnapshot',
+            fields=[
+                ('budget', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='money.budget')),
+                ('month', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('spent', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('status', models.CharField(choices=[('ok', 'Within budget'), ('near', 'Near limit'), ('over', 'Over budget')], max_length=4)),
+                ('version', models.BigIntegerField()),
+                ('evaluated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'month', 'status'], name='budget_snapshot_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0008_budgetsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='money.account')),
+            ],
+            options={
+                'ordering': ['account', 'month'],
+                'unique_together': {('account', 'month')},
+            },
+        ),
+    ]
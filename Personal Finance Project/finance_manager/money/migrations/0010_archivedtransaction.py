@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0009_accountcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='archived_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=7)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateField()),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('transfer_key', models.UUIDField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_transactions', to='money.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_transactions', to='money.category')),
+                ('recurring', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_occurrences', to='money.recurringtransaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date', '-id'],
+                'indexes': [models.Index(fields=['user', '-date', '-id'], name='archive_user_date_id_idx'), models.Index(fields=['account', 'date'], name='archive_acct_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('money', '0010_archivedtransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('alias', models.CharField(max_length=64)),
+                ('locked', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
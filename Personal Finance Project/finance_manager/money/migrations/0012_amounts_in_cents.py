@@ -0,0 +1,66 @@
+# Money columns become integer cents (money.cents.CentsField). Each column is
+# widened so that value * 100 fits, scaled in place, then converted to BIGINT,
+# which is exact on every backend; reversing divides by 100 again.
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+import money.cents
+
+# SQLite applies these schema changes by rebuilding money_transaction, which
+# drops the full-text sync triggers of 0005; recreate them (and the index)
+fulltext = import_module('money.migrations.0005_transaction_note_fulltext')
+restore_fulltext = fulltext.run({'sqlite': fulltext.SQLITE_BACKWARD[:3] + fulltext.SQLITE_FORWARD[1:]})
+
+# (model, field, max_digits, other field options)
+COLUMNS = [
+    ('account', 'balance', 12, {'default': 0}),
+    ('account', 'transaction_total', 14, {'default': 0, 'editable': False}),
+    ('account', 'archived_total', 14, {'default': 0, 'editable': False}),
+    ('accountcheckpoint', 'total', 14, {'default': 0}),
+    ('transaction', 'amount', 12, {}),
+    ('archivedtransaction', 'amount', 12, {}),
+    ('budget', 'amount', 12, {}),
+    ('budgetsnapshot', 'amount', 12, {}),
+    ('budgetsnapshot', 'spent', 14, {}),
+    ('monthlycategorytotal', 'total', 14, {'default': 0}),
+    ('recurringtransaction', 'amount', 12, {}),
+]
+
+
+def scale(expression):
+    def apply(apps, schema_editor):
+        quote = schema_editor.quote_name
+        for model_name, name, _, _ in COLUMNS:
+            table = apps.get_model('money', model_name)._meta.db_table
+            column = quote(name)
+            schema_editor.execute(f'UPDATE {quote(table)} SET {column} = {expression.format(column)}')
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0011_usershard'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fulltext),
+        *[
+            migrations.AlterField(
+                model_name=model_name, name=name,
+                field=models.DecimalField(decimal_places=2, max_digits=20, **options),
+            )
+            for model_name, name, _, options in COLUMNS
+        ],
+        migrations.RunPython(scale('ROUND({} * 100)'), scale('{} / 100.0')),
+        *[
+            migrations.AlterField(
+                model_name=model_name, name=name,
+                field=money.cents.CentsField(max_digits=max_digits, **options),
+            )
+            for model_name, name, max_digits, options in COLUMNS
+        ],
+        migrations.RunPython(restore_fulltext, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Per-account currency, per-user base currency, and MonthlyCategoryTotal
+# rollups split by account (so totals can be converted by currency, money.fx).
+# The rollup rows are rebuilt from the transactions either way.
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+import money.models
+
+
+def rebuild_rollups(*key):
+    def apply(apps, schema_editor):
+        MonthlyCategoryTotal = apps.get_model('money', 'MonthlyCategoryTotal')
+        db = schema_editor.connection.alias
+        MonthlyCategoryTotal.objects.using(db).all().delete()
+        merged = {}
+        for model_name in ('Transaction', 'ArchivedTransaction'):
+            rows = (
+                apps.get_model('money', model_name).objects.using(db).order_by()
+                .annotate(month=TruncMonth('date'))
+                .values_list(*key)
+                .annotate(total=Sum('amount'), count=Count('id'))
+            )
+            for *values, total, count in rows.iterator():
+                found = merged.setdefault(tuple(values), [0, 0])
+                found[0] += total
+                found[1] += count
+        MonthlyCategoryTotal.objects.using(db).bulk_create([
+            MonthlyCategoryTotal(**dict(zip(key, values)), total=total, count=count)
+            for values, (total, count) in merged.items()
+        ], batch_size=1000)
+    return apply
+
+
+def delete_rollups(apps, schema_editor):
+    apps.get_model('money', 'MonthlyCategoryTotal').objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0012_amounts_in_cents'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('base_currency', models.CharField(default=money.models.default_currency, max_length=3)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='currency',
+            field=models.CharField(default=money.models.default_currency, max_length=3),
+        ),
+        migrations.RunPython(delete_rollups, rebuild_rollups('user_id', 'month', 'category_id', 'type')),
+        migrations.AddField(
+            model_name='monthlycategorytotal',
+            name='account',
+            field=models.ForeignKey(default=0, on_delete=django.db.models.deletion.CASCADE, to='money.account'),
+            preserve_default=False,
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlycategorytotal',
+            unique_together={('user', 'month', 'category', 'type', 'account')},
+        ),
+        migrations.RunPython(rebuild_rollups('user_id', 'month', 'category_id', 'type', 'account_id'), delete_rollups),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:38
+
+import django.db.models.deletion
+import money.cents
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0013_multi_currency'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('keyword', 'Note contains'), ('regex', 'Note matches regex')], default='keyword', max_length=7)),
+                ('pattern', models.CharField(max_length=255)),
+                ('min_amount', money.cents.CentsField(blank=True, max_digits=12, null=True)),
+                ('max_amount', money.cents.CentsField(blank=True, max_digits=12, null=True)),
+                ('priority', models.PositiveSmallIntegerField(default=100, help_text='Lower numbers are tried first')),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='money.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='money.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['priority', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0014_categoryrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
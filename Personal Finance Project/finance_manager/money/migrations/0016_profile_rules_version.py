@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0015_profile_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='rules_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
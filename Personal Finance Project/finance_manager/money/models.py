@@ -1,6 +1,12 @@
-from django.db import models
+import re
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 
+from .cents import CentsField
+
 class Category(models.Model):
     TYPE_CHOICES = (
         ('income', 'Income'),
@@ -17,10 +23,35 @@ class Category(models.Model):
     def __str__(self):
         return f"{self.name} ({self.type})"
 
+def default_currency():
+    return settings.DEFAULT_CURRENCY
+
+class Profile(models.Model):
+    # Per-user preferences; totals across accounts are shown in base_currency (money.fx)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='profile')
+    base_currency = models.CharField(max_length=3, default=default_currency)
+    # Bumped with every change of the user's data (money.caching.bump_data_version);
+    # budget snapshots are stamped with it, so it must outlive any cache
+    data_version = models.PositiveBigIntegerField(default=0, editable=False)
+    # Changes with the user's categorization rules: money.rules keys compiled sets on it
+    rules_version = models.BigIntegerField(default=0, editable=False)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.base_currency}"
+
 class Account(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=64)
-    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # ISO 4217 code; the balance and every transaction of the account are in it
+    currency = models.CharField(max_length=3, default=default_currency)
+    balance = CentsField(max_digits=12, default=0)
+    # Running income - expense over all transactions, maintained by money.ledger
+    transaction_total = CentsField(max_digits=14, default=0, editable=False)
+    # Income - expense of the rows moved to ArchivedTransaction (money.archive), carried forward
+    archived_total = CentsField(max_digits=14, default=0, editable=False)
+
+    # Only ever changed by F() deltas; see save()
+    LEDGER_COLUMNS = ('transaction_total', 'archived_total')
 
     class Meta:
         unique_together = ('user', 'name')
@@ -29,32 +60,287 @@ class Account(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Saving a loaded account (an edit) leaves the ledger columns alone: the values
+        # read with it would undo deltas other writers applied in the meantime
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name not in self.LEDGER_COLUMNS
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def live_balance(self):
+        # opening balance + income - expense, archived rows included
+        return Decimal(self.balance or 0) + Decimal(self.archived_total or 0) + Decimal(self.transaction_total or 0)
+
+class AccountCheckpoint(models.Model):
+    # Sum of the account's transactions up to the end of ``month``, kept exact by
+    # money.ledger; balance as of a date = opening + checkpoint + the rest (money.checkpoints)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='checkpoints')
+    month = models.DateField()  # 1st of the (closed) month
+    total = CentsField(max_digits=14, default=0)
+
+    class Meta:
+        unique_together = ('account', 'month')
+        ordering = ['account', 'month']
+
+    def __str__(self):
+        return f"{self.account_id} {self.month:%Y-%m}: {self.total}"
+
 class Transaction(models.Model):
     TYPE_CHOICES = Category.TYPE_CHOICES
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     account = models.ForeignKey(Account, on_delete=models.PROTECT)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
     type = models.CharField(max_length=7, choices=TYPE_CHOICES)
-    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount = CentsField(max_digits=12)
     date = models.DateField()
     note = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Shared by the outflow and inflow rows of one transfer (see money.transfers)
+    transfer_key = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
+    # Schedule this row was generated from (see money.recurring)
+    recurring = models.ForeignKey(
+        'RecurringTransaction', null=True, blank=True, editable=False,
+        on_delete=models.SET_NULL, related_name='occurrences',
+    )
+
+    # Fields the ledger aggregates depend on; see money.ledger
+    LEDGER_FIELDS = ('user_id', 'account_id', 'category_id', 'type', 'amount', 'date')
 
     class Meta:
         ordering = ['-date', '-id']
+        indexes = [
+            # month/day ranges per type (dashboard, daily series)
+            models.Index(fields=['user', 'date', 'type'], name='tx_user_date_type_idx'),
+            # keyset-paginated list, optionally filtered by account
+            models.Index(fields=['user', '-date', '-id'], name='tx_user_date_id_idx'),
+            models.Index(fields=['user', 'account', '-date', '-id'], name='tx_user_acct_date_id_idx'),
+            # per-account totals (ledger rebuild)
+            models.Index(fields=['user', 'account', 'type'], name='tx_user_acct_type_idx'),
+            # per-category spend over a date range (budgets)
+            models.Index(fields=['user', 'category', 'date'], name='tx_user_cat_date_idx'),
+        ]
+        constraints = [
+            # at most one row per schedule occurrence, so materializing is idempotent
+            models.UniqueConstraint(fields=['recurring', 'date'], name='tx_recurring_date_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.type} {self.amount} - {self.category}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance._ledger_fields_deferred():
+            instance._ledger_original = instance.ledger_state()
+        return instance
+
+    def _ledger_fields_deferred(self):
+        return bool(self.get_deferred_fields() & set(self.LEDGER_FIELDS))
+
+    def _stored_ledger_state(self):
+        return (
+            type(self)._base_manager.filter(pk=self.pk)
+            .values(*self.LEDGER_FIELDS).first()
+        )
+
+    def ledger_state(self):
+        if self._ledger_fields_deferred():
+            return self._stored_ledger_state() if self.pk else None
+        return {f: getattr(self, f) for f in self.LEDGER_FIELDS}
+
+    def original_ledger_state(self):
+        # State as last persisted, used by the ledger signals to compute deltas
+        if not self.pk:
+            return None
+        original = getattr(self, '_ledger_original', None)
+        if original is None:
+            original = self._stored_ledger_state()
+        return original
+
+    def _write_db(self, using=None):
+        # The database Django itself will write to (the user's shard, see money.sharding)
+        return using or router.db_for_write(type(self), instance=self)
+
+    def save(self, *args, **kwargs):
+        self._ledger_original = self.original_ledger_state()
+        with transaction.atomic(using=self._write_db(kwargs.get('using'))):
+            super().save(*args, **kwargs)
+        self._ledger_original = self.ledger_state()
+
+    def delete(self, *args, **kwargs):
+        self._ledger_original = self.original_ledger_state()
+        with transaction.atomic(using=self._write_db(kwargs.get('using'))):
+            return super().delete(*args, **kwargs)
+
+class ArchivedTransaction(models.Model):
+    # Transaction rows older than the archive cutoff, moved here by money.archive with
+    # their ids; read-only, already counted in rollups, checkpoints and Account.archived_total
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='archived_transactions')
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='archived_transactions')
+    type = models.CharField(max_length=7, choices=Category.TYPE_CHOICES)
+    amount = CentsField(max_digits=12)
+    date = models.DateField()
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+    transfer_key = models.UUIDField(null=True, blank=True)
+    recurring = models.ForeignKey(
+        'RecurringTransaction', null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='archived_occurrences',
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date', '-id']
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='archive_user_date_id_idx'),
+            models.Index(fields=['account', 'date'], name='archive_acct_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.amount} - {self.category} (archived)"
+
 class Budget(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     month = models.DateField(help_text='Use the 1st of month, e.g., 2025-08-01')
-    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount = CentsField(max_digits=12)
 
     class Meta:
         unique_together = ('user', 'category', 'month')
         ordering = ['-month']
+        indexes = [
+            models.Index(fields=['user', 'month'], name='budget_user_month_idx'),
+        ]
 
     def __str__(self):
         return f"{self.category.name} - {self.month:%Y-%m}"
+
+
+class BudgetSnapshot(models.Model):
+    # Budget vs actual as of the user's data version, written by money.budgets
+    STATUS_CHOICES = (
+        ('ok', 'Within budget'),
+        ('near', 'Near limit'),
+        ('over', 'Over budget'),
+    )
+    budget = models.OneToOneField(Budget, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    month = models.DateField()  # 1st of month
+    amount = CentsField(max_digits=12)
+    spent = CentsField(max_digits=14)
+    status = models.CharField(max_length=4, choices=STATUS_CHOICES)
+    version = models.BigIntegerField()  # Profile.data_version the figures belong to
+    evaluated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'month', 'status'], name='budget_snapshot_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.budget_id} {self.month:%Y-%m}: {self.spent}/{self.amount} {self.status}"
+
+
+class MonthlyCategoryTotal(models.Model):
+    # Materialized (user, month, category, type, account) rollup of Transaction, maintained by
+    # money.ledger; per account so readers can group totals by the account's currency
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    month = models.DateField()  # 1st of month
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    type = models.CharField(max_length=7, choices=Category.TYPE_CHOICES)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    total = CentsField(max_digits=14, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'month', 'category', 'type', 'account')
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.category_id} {self.type} {self.month:%Y-%m}: {self.total}"
+
+
+class CategoryRule(models.Model):
+    # Picks the category of rows imported or entered without one; a user's rules
+    # are compiled into a single matcher (money.rules)
+    KIND_CHOICES = (
+        ('keyword', 'Note contains'),
+        ('regex', 'Note matches regex'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='rules')
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES, default='keyword')
+    pattern = models.CharField(max_length=255)
+    # Optional conditions; the rule applies to rows of its category's type only
+    account = models.ForeignKey(Account, null=True, blank=True, on_delete=models.CASCADE)
+    min_amount = CentsField(max_digits=12, null=True, blank=True)
+    max_amount = CentsField(max_digits=12, null=True, blank=True)
+    priority = models.PositiveSmallIntegerField(default=100, help_text='Lower numbers are tried first')
+
+    class Meta:
+        ordering = ['priority', 'id']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.pattern!r} -> {self.category}"
+
+    def regex_source(self):
+        return self.pattern if self.kind == 'regex' else re.escape(self.pattern.strip())
+
+    def clean(self):
+        # The pattern becomes one alternative of the user's combined regex (money.rules)
+        try:
+            combined = re.compile(f'(?=({self.regex_source()}))')
+        except re.error as e:
+            raise ValidationError({'pattern': f'Invalid regular expression: {e}'})
+        if combined.groups > 1:
+            raise ValidationError({'pattern': 'Use non-capturing groups (?:...) in the pattern.'})
+        if self.min_amount is not None and self.max_amount is not None and self.min_amount > self.max_amount:
+            raise ValidationError('The minimum amount is above the maximum.')
+
+
+class RecurringTransaction(models.Model):
+    # Rule that money.recurring turns into Transaction rows, one per due date
+    FREQUENCY_CHOICES = (
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    type = models.CharField(max_length=7, choices=Category.TYPE_CHOICES)
+    amount = CentsField(max_digits=12)
+    note = models.CharField(max_length=255, blank=True)
+    frequency = models.CharField(max_length=7, choices=FREQUENCY_CHOICES, default='monthly')
+    interval = models.PositiveSmallIntegerField(default=1, help_text='Every N days/weeks/months/years')
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    # First occurrence not yet materialized; None once the schedule has ended
+    next_date = models.DateField(null=True, editable=False)
+
+    class Meta:
+        ordering = ['next_date', 'id']
+        indexes = [
+            # nightly scan of due schedules
+            models.Index(fields=['next_date', 'id'], name='recurring_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.amount} {self.frequency} - {self.category}"
+
+
+class UserShard(models.Model):
+    # Directory of which database holds a user's money rows (money.sharding); lives on `default`
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=64)
+    # Set while money.sharding.move_user copies the user; writes are refused meanwhile
+    locked = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}{' (locked)' if self.locked else ''}"
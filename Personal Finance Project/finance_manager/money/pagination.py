@@ -0,0 +1,88 @@
+"""
+Keyset (cursor) pagination over the Transaction ordering ``-date, -id``.
+
+A cursor is the ``date_id`` of a boundary row, e.g. ``2025-08-01_1234``. Pages
+are fetched with ``WHERE (date, id) < cursor ORDER BY -date, -id LIMIT n + 1``,
+so every page costs the same regardless of how deep it is (no OFFSET scan).
+"""
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+PAGE_SIZE_CHOICES = (25, 50, 100, 200)
+MAX_ID = 2 ** 63 - 1  # BIGINT; larger ids in a tampered cursor would fail in the database
+
+
+def encode_cursor(obj):
+    return f"{obj.date.isoformat()}_{obj.pk}"
+
+
+def decode_cursor(value):
+    """Return (date, id) or None for a missing/malformed cursor."""
+    if not value:
+        return None
+    try:
+        d, pk = value.split('_', 1)
+        d, pk = date.fromisoformat(d), int(pk)
+    except ValueError:
+        return None
+    return (d, pk) if 0 <= pk <= MAX_ID else None
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+@dataclass
+class KeysetPage:
+    items: list = field(default_factory=list)
+    next_cursor: str = None
+    prev_cursor: str = None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def older_than(qs, d, pk):
+    """Rows after the boundary row ``(d, pk)`` in the ``-date, -id`` ordering."""
+    return qs.filter(Q(date__lt=d) | Q(date=d, id__lt=pk))
+
+
+def keyset_page(qs, after=None, before=None, size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of ``qs`` (newest first). ``after`` continues towards older
+    rows, ``before`` goes back towards newer rows; both are cursor strings.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before and not after:
+        d, pk = before
+        rows = list(
+            qs.filter(Q(date__gt=d) | Q(date=d, id__gt=pk)).order_by('date', 'id')[:size + 1]
+        )
+        has_more = len(rows) > size
+        items = rows[:size][::-1]
+        return KeysetPage(
+            items=items,
+            next_cursor=encode_cursor(items[-1]) if items else None,
+            prev_cursor=encode_cursor(items[0]) if items and has_more else None,
+        )
+
+    if after:
+        qs = older_than(qs, *after)
+    rows = list(qs.order_by('-date', '-id')[:size + 1])
+    items = rows[:size]
+    return KeysetPage(
+        items=items,
+        next_cursor=encode_cursor(items[-1]) if len(rows) > size else None,
+        prev_cursor=encode_cursor(items[0]) if items and after else None,
+    )
@@ -0,0 +1,164 @@
+"""
+Recurring transactions (rent, salary, subscriptions).
+
+A RecurringTransaction is a rule anchored at ``start_date``: occurrence ``n``
+falls ``n * interval`` days/weeks/months/years later, month-based rules
+keeping the anchor day where the month has it (31st -> 30th/28th/29th).
+``next_date`` is the first occurrence not yet written.
+
+``materialize`` is the nightly pass over every user at once: due schedules are
+read in primary-key batches, their occurrences up to the horizon are computed
+in Python and inserted with one ``bulk_create`` per batch, ledger aggregates go
+through a LedgerBatch and the cursors move forward with an UPDATE per distinct new date.
+Each batch commits on its own, and the (recurring, date) unique constraint
+plus a per-batch lookup of already written dates make re-runs and overlapping
+runs harmless.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from . import ledger, sharding
+from .caching import bump_data_version
+from .ledger import add_months
+from .models import RecurringTransaction, Transaction
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def nth_occurrence(schedule, n):
+    step = n * schedule.interval
+    if schedule.frequency == 'daily':
+        return schedule.start_date + timedelta(days=step)
+    if schedule.frequency == 'weekly':
+        return schedule.start_date + timedelta(weeks=step)
+    if schedule.frequency == 'yearly':
+        return add_months(schedule.start_date, 12 * step)
+    return add_months(schedule.start_date, step)
+
+
+def occurrence_index(schedule, day):
+    """Index of the last occurrence on or before ``day`` (may undershoot by one)."""
+    start = schedule.start_date
+    if schedule.frequency == 'daily':
+        units = (day - start).days
+    elif schedule.frequency == 'weekly':
+        units = (day - start).days // 7
+    elif schedule.frequency == 'yearly':
+        units = day.year - start.year
+    else:
+        units = (day.year - start.year) * 12 + day.month - start.month
+    return max(0, units // schedule.interval)
+
+
+def first_occurrence_after(schedule, day):
+    """First occurrence strictly after ``day``, or None if the schedule has ended by then."""
+    n = occurrence_index(schedule, day)
+    occurrence = nth_occurrence(schedule, n)
+    while occurrence <= day:
+        n += 1
+        occurrence = nth_occurrence(schedule, n)
+    return occurrence if schedule.end_date is None or occurrence <= schedule.end_date else None
+
+
+def due_dates(schedule, until):
+    """Occurrences from ``next_date`` up to ``until``; returns (dates, new next_date)."""
+    dates = []
+    day = schedule.next_date
+    while day is not None and day <= until:
+        dates.append(day)
+        day = first_occurrence_after(schedule, day)
+    return dates, day
+
+
+def latest_occurrence(schedule):
+    """Date of the latest materialized row, live or archived (money.archive)."""
+    if schedule.pk is None:
+        return None
+    dates = [
+        rows.order_by('-date').values_list('date', flat=True).first()
+        for rows in (schedule.occurrences, schedule.archived_occurrences)
+    ]
+    return max(filter(None, dates), default=None)
+
+
+def reschedule(schedule):
+    """
+    Point ``next_date`` at the first occurrence after the latest materialized
+    row (or at the start), e.g. after the rule was edited.
+    """
+    latest = latest_occurrence(schedule)
+    if latest is not None and latest >= schedule.start_date:
+        schedule.next_date = first_occurrence_after(schedule, latest)
+    elif schedule.end_date is not None and schedule.start_date > schedule.end_date:
+        schedule.next_date = None
+    else:
+        schedule.next_date = schedule.start_date
+
+
+@dataclass
+class MaterializeResult:
+    schedules: int = 0
+    created: int = 0
+    finished: int = 0
+    user_ids: set = field(default_factory=set)
+
+
+def materialize(until=None, user_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Write every occurrence due on or before ``until`` (default today) for all users."""
+    until = until or date.today()
+    result = MaterializeResult()
+    due = RecurringTransaction.objects.filter(next_date__lte=until).order_by('pk')
+    if user_id is not None:
+        due = due.filter(user_id=user_id)
+
+    last_pk = 0
+    while True:
+        with sharding.atomic():
+            schedules = list(due.filter(pk__gt=last_pk).select_for_update()[:batch_size])
+            if not schedules:
+                break
+            last_pk = schedules[-1].pk
+            materialize_batch(schedules, until, result)
+    for uid in result.user_ids:
+        bump_data_version(uid)
+    return result
+
+
+def materialize_batch(schedules, until, result):
+    planned = {}
+    for schedule in schedules:
+        dates, schedule.next_date = due_dates(schedule, until)
+        planned[schedule.pk] = dates
+
+    # Dates already written by an earlier, interrupted or concurrent run
+    earliest = min((dates[0] for dates in planned.values() if dates), default=until)
+    written = set(
+        Transaction.objects.filter(recurring_id__in=planned, date__gte=earliest, date__lte=until)
+        .values_list('recurring_id', 'date')
+    )
+
+    rows = [
+        Transaction(
+            user_id=s.user_id, account_id=s.account_id, category_id=s.category_id, type=s.type,
+            amount=s.amount, date=day, note=s.note, recurring_id=s.pk,
+        )
+        for s in schedules for day in planned[s.pk] if (s.pk, day) not in written
+    ]
+    Transaction.objects.bulk_create(rows, batch_size=DEFAULT_BATCH_SIZE)
+    batch = ledger.LedgerBatch()
+    for row in rows:
+        batch.add(None, row.ledger_state())
+    batch.apply()
+    # Cursors share few distinct dates in a nightly run: one UPDATE per date
+    # is far cheaper than bulk_update's per-row CASE
+    by_next_date = defaultdict(list)
+    for s in schedules:
+        by_next_date[s.next_date].append(s.pk)
+    for next_date, pks in by_next_date.items():
+        RecurringTransaction.objects.filter(pk__in=pks).update(next_date=next_date)
+
+    result.schedules += len(schedules)
+    result.created += len(rows)
+    result.finished += sum(1 for s in schedules if s.next_date is None)
+    result.user_ids.update(row.user_id for row in rows)
@@ -0,0 +1,288 @@
+"""
+Income/expense reports over arbitrary date ranges, computed with NumPy.
+
+``load_ledger`` runs one ``values_list`` query per table and streams the raw rows
+into columnar arrays chunk by chunk (dates as ``datetime64[D]``, amounts as the
+stored int64 cents, see money.cents, so totals are exact), which keeps memory at a few dozen bytes per row
+even for multi-year ranges with millions of transactions. Everything after
+that is vectorized:
+
+* time groups (day/week/month) are dense axes built with ``np.bincount`` over
+  bucket offsets, so empty periods are present as zeros;
+* category/account groups use ``np.unique(..., return_inverse=True)``;
+* rolling averages are a cumulative-sum window over the dense axis;
+* year-over-year deltas compare each period with the same range a year
+  earlier (364 days back for day/week reports so weekdays line up, 12 months
+  for month reports); the single query simply starts a year earlier.
+
+Amounts are converted to the user's base currency (money.fx) at the rate of
+each transaction's day, a column at a time, before any grouping.
+"""
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import connections
+
+from .export import parse_date
+from .fx import Conversion
+from .ledger import add_months
+from .models import Account, ArchivedTransaction, Category, Transaction
+
+GROUPS = ('day', 'week', 'month', 'category', 'account')
+TIME_GROUPS = ('day', 'week', 'month')
+YOY_SHIFT = {'day': 364, 'week': 52, 'month': 12}  # periods in a year
+DEFAULT_WINDOW = 3
+MAX_WINDOW = 366
+MAX_REPORT_DAYS = 3660  # at most one point per day over ten years
+# Dates outside this range are rejected rather than clamped: the year-earlier
+# fetch and the period axis step past them
+MIN_REPORT_DATE = date(1900, 1, 1)
+MAX_REPORT_DATE = date(2199, 12, 31)
+FETCH_CHUNK = 50000
+
+
+@dataclass
+class Ledger:
+    dates: np.ndarray       # datetime64[D]
+    cents: np.ndarray       # int64, always positive
+    income: np.ndarray      # bool, True for income rows
+    category_ids: np.ndarray
+    account_ids: np.ndarray
+
+    def __len__(self):
+        return len(self.dates)
+
+    def select(self, mask):
+        return Ledger(self.dates[mask], self.cents[mask], self.income[mask],
+                      self.category_ids[mask], self.account_ids[mask])
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _dates(values):
+    if isinstance(values[0], str):  # backends returning ISO strings
+        return np.array(values, dtype='datetime64[D]')
+    # date objects: via ordinals, much faster than NumPy's per-object conversion
+    ordinals = np.fromiter(map(date.toordinal, values), np.int64, len(values))
+    return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+
+
+def _columns(rows):
+    dates, amounts, types, category_ids, account_ids = zip(*rows)
+    return (
+        _dates(dates),
+        np.array(amounts, dtype=np.int64),
+        np.array(types) == 'income',
+        np.array(category_ids, dtype=np.int64),
+        np.array(account_ids, dtype=np.int64),
+    )
+
+
+def load_ledger(user, start, end, account_id=None, chunk_size=FETCH_CHUNK):
+    """
+    All of the user's transactions with start <= date <= end, as arrays (one
+    query on the live table, one on the archive, see money.archive).
+    """
+    parts = []
+    for model in (Transaction, ArchivedTransaction):
+        qs = model.objects.filter(user=user, date__gte=start, date__lte=end)
+        if account_id:
+            qs = qs.filter(account_id=account_id)
+        qs = qs.order_by().values_list('date', 'amount', 'type', 'category_id', 'account_id')
+        # Raw driver rows: NumPy parses whole columns of dates/amounts at once,
+        # several times faster than Django's per-value converters
+        sql, params = qs.query.sql_with_params()
+        with connections[qs.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            while chunk := cursor.fetchmany(chunk_size):
+                parts.append(_columns(chunk))
+    if not parts:
+        return Ledger(np.array([], dtype='datetime64[D]'), np.zeros(0, np.int64), np.zeros(0, bool),
+                      np.zeros(0, np.int64), np.zeros(0, np.int64))
+    return Ledger(*(np.concatenate(column) for column in zip(*parts)))
+
+
+def convert_ledger(ledger, currency_of, conversion):
+    """The ledger with its amounts in ``conversion.base``; ``currency_of``: account id -> currency."""
+    if set(currency_of.values()) <= {conversion.base}:
+        return ledger
+    # Currencies coded per account, not per row: the rows only carry integer codes
+    account_ids, rows = np.unique(ledger.account_ids, return_inverse=True)
+    currencies, per_account = np.unique(
+        [currency_of.get(a, conversion.base) for a in account_ids.tolist()] or [conversion.base], return_inverse=True,
+    )
+    return replace(ledger, cents=conversion.cents(ledger.cents, currencies, ledger.dates, codes=per_account[rows]))
+
+
+# ---------- Grouping ----------
+
+def period_starts(dates, group):
+    """Start of the day/week/month each date falls in, as datetime64[D]."""
+    if group == 'month':
+        return dates.astype('datetime64[M]').astype('datetime64[D]')
+    if group == 'week':
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday
+        days = dates.astype(np.int64)
+        return (days - (days + 3) % 7).astype('datetime64[D]')
+    return dates
+
+
+def period_axis(start, end, group):
+    """Every period start from the one containing ``start`` to the one containing ``end``."""
+    first, last = period_starts(np.array([start, end], dtype='datetime64[D]'), group)
+    if group == 'month':
+        months = np.arange(first.astype('datetime64[M]'), last.astype('datetime64[M]') + 1)
+        return months.astype('datetime64[D]')
+    step = 7 if group == 'week' else 1
+    return np.arange(first, last + 1, step)
+
+
+def period_index(dates, axis, group):
+    starts = period_starts(dates, group)
+    if group == 'month':
+        return (starts.astype('datetime64[M]') - axis[0].astype('datetime64[M]')).astype(np.int64)
+    step = 7 if group == 'week' else 1
+    return (starts - axis[0]).astype(np.int64) // step
+
+
+def sum_by(index, ledger, size):
+    """(income, expense) cents per bucket; ``index`` maps each row to a bucket."""
+    income = np.bincount(index, weights=np.where(ledger.income, ledger.cents, 0), minlength=size)
+    expense = np.bincount(index, weights=np.where(ledger.income, 0, ledger.cents), minlength=size)
+    return income, expense
+
+
+def rolling_mean(values, window):
+    """Trailing mean over ``window`` periods; NaN until a full window is available."""
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        out[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return out
+
+
+def _money(cents):
+    return [None if np.isnan(c) else round(c / 100, 2) for c in cents.tolist()]
+
+
+def _labels(axis, group):
+    unit = 'M' if group == 'month' else 'D'
+    return np.datetime_as_string(axis.astype(f'datetime64[{unit}]')).tolist()
+
+
+def year_earlier(d, group):
+    # Same weekday a year back for day/week reports, same day of month otherwise
+    if group == 'month':
+        return add_months(d, -12)
+    return d - timedelta(days=364)
+
+
+def time_report(ledger, start, end, group, window):
+    axis = period_axis(start, end, group)
+    size, shift = len(axis), YOY_SHIFT[group]
+    idx = period_index(ledger.dates, axis, group)
+    current = ledger.dates >= np.datetime64(start)
+    # A year earlier, binned one year forward onto the same axis
+    previous = (ledger.dates >= np.datetime64(year_earlier(start, group))) & \
+               (ledger.dates <= np.datetime64(year_earlier(end, group)))
+    income, expense = sum_by(idx[current], ledger.select(current), size)
+    prev_income, prev_expense = sum_by(idx[previous] + shift, ledger.select(previous), size)
+    series = {'income': income, 'expense': expense, 'net': income - expense}
+    before = {'income': prev_income, 'expense': prev_expense, 'net': prev_income - prev_expense}
+    return {
+        'labels': _labels(axis, group),
+        **{name: _money(values) for name, values in series.items()},
+        'rolling': {
+            'window': window,
+            **{name: _money(rolling_mean(values, window)) for name, values in series.items()},
+        },
+        'previous_year': {name: _money(values) for name, values in before.items()},
+        'yoy': {name: _money(series[name] - before[name]) for name in series},
+    }
+
+
+def key_report(ledger, group, names):
+    keys = ledger.category_ids if group == 'category' else ledger.account_ids
+    unique, idx = np.unique(keys, return_inverse=True)
+    income, expense = sum_by(idx, ledger, len(unique))
+    order = np.argsort(-(income + expense), kind='stable')  # biggest first
+    return {
+        'labels': [names.get(k, str(k)) for k in unique[order].tolist()],
+        'ids': unique[order].tolist(),
+        'income': _money(income[order]),
+        'expense': _money(expense[order]),
+        'net': _money((income - expense)[order]),
+    }
+
+
+def build_report(user, start, end, group='month', account_id=None, window=DEFAULT_WINDOW):
+    """Report dict for the JSON API; see the module docstring for the series."""
+    time_group = group in TIME_GROUPS
+    fetch_start = year_earlier(start, group) if time_group else start
+    accounts = list(Account.objects.filter(user=user).select_related('user__profile'))
+    conversion = Conversion.for_user(user, accounts)
+    ledger = load_ledger(user, fetch_start, end, account_id)
+    ledger = convert_ledger(ledger, {a.pk: a.currency for a in accounts}, conversion)
+    current = ledger.select(ledger.dates >= np.datetime64(start)) if time_group else ledger
+    income_cents = int(current.cents[current.income].sum())
+    expense_cents = int(current.cents[~current.income].sum())
+    report = {
+        'start': start.isoformat(), 'end': end.isoformat(), 'group': group, 'currency': conversion.base,
+        'totals': {
+            'income': income_cents / 100, 'expense': expense_cents / 100,
+            'net': (income_cents - expense_cents) / 100, 'count': len(current),
+        },
+    }
+    if time_group:
+        report.update(time_report(ledger, start, end, group, window))
+    else:
+        if group == 'category':
+            names = dict(Category.objects.filter(user=user).values_list('id', 'name'))
+        else:
+            names = {a.pk: a.name for a in accounts}
+        report.update(key_report(current, group, names))
+    report['missing_rates'] = sorted(conversion.missing)
+    return report
+
+
+def default_range(today=None):
+    """The last twelve months including the current one."""
+    today = today or date.today()
+    return add_months(today.replace(day=1), -11), today
+
+
+class ReportRangeError(ValueError):
+    pass
+
+
+def report_params(query, today=None):
+    """
+    Normalized report arguments from request.GET; bad values fall back to
+    defaults, ranges longer than MAX_REPORT_DAYS keep their end. Raise
+    ReportRangeError for dates outside MIN_REPORT_DATE..MAX_REPORT_DATE.
+    """
+    default_start, default_end = default_range(today)
+    start = parse_date(query.get('start')) or default_start
+    end = parse_date(query.get('end')) or default_end
+    for d in (start, end):
+        if not MIN_REPORT_DATE <= d <= MAX_REPORT_DATE:
+            raise ReportRangeError(f'Dates must be between {MIN_REPORT_DATE} and {MAX_REPORT_DATE}.')
+    if start > end:
+        start, end = end, start
+    start = max(start, end - timedelta(days=MAX_REPORT_DAYS - 1))
+    group = query.get('group') if query.get('group') in GROUPS else 'month'
+    try:
+        window = min(MAX_WINDOW, max(1, int(query.get('window', DEFAULT_WINDOW))))
+    except (TypeError, ValueError):
+        window = DEFAULT_WINDOW
+    try:
+        account_id = int(query['account']) if query.get('account') else None
+    except ValueError:
+        account_id = None
+    return {'start': start, 'end': end, 'group': group, 'account_id': account_id, 'window': window}
+
+
+def params_key(params):
+    return 'report:{start}:{end}:{group}:{account_id}:{window}'.format(**params)
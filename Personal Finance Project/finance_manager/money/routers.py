@@ -0,0 +1,150 @@
+"""
+Read-replica routing with read-your-writes.
+
+``settings.DATABASE_REPLICAS`` lists database aliases that mirror ``default``,
+or maps primaries to theirs, e.g. ``{'default': ['replica1'], 'shard2':
+['shard2_replica1']}`` with user sharding (money.sharding). Views decorated
+with ``replica_reads`` (dashboard, charts, reports, account and transaction
+lists) send their GET/HEAD queries to a replica of the database they would
+read: ``default`` here, the user's shard in ShardRouter, which asks
+``read_alias`` for money models. The replica is picked once per request and
+primary, so every query of a page sees the same snapshot. Everything else --
+writes, other views, management commands -- stays on the primary.
+
+Replicas lag behind, so a user who just wrote must not read from one:
+``ReadYourWritesMiddleware`` sets a short-lived cookie on any response whose
+request wrote to the database, and requests carrying it read from the primary
+until it expires (``settings.REPLICA_PIN_SECONDS``). Reads after a write in the
+same request, and reads inside a transaction on the primary, also stay there.
+A request counts as writing if its method is not GET/HEAD or if a model was
+saved or deleted while it ran (``record_write``, from money.signals) -- not
+from ``db_for_write``, which ShardRouter answers first for money models.
+"""
+import random
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+@dataclass
+class RequestDatabases:
+    pinned: bool = False     # the client wrote recently (cookie)
+    wrote: bool = False      # this request wrote
+    replicas: dict = None    # primary -> replica its reads go to, while a replica_reads view runs
+
+
+_request = ContextVar('money_request_databases', default=None)
+
+
+def replica_map():
+    replicas = getattr(settings, 'DATABASE_REPLICAS', None) or {}
+    if not isinstance(replicas, dict):
+        replicas = {DEFAULT_DB_ALIAS: replicas}
+    return {primary: list(aliases) for primary, aliases in replicas.items()}
+
+
+def replica_aliases(primary=DEFAULT_DB_ALIAS):
+    return replica_map().get(primary, [])
+
+
+def primary_of(alias):
+    """The database ``alias`` mirrors; ``alias`` itself if it is not a replica."""
+    for primary, aliases in replica_map().items():
+        if alias in aliases:
+            return primary
+    return alias
+
+
+def read_alias(primary=DEFAULT_DB_ALIAS):
+    """Where a read meant for ``primary`` goes: one of its replicas inside replica_reads, else ``primary``."""
+    state = _request.get()
+    if state is None or state.replicas is None or state.wrote:
+        return primary
+    if connections[primary].in_atomic_block:
+        return primary  # locking reads and read-modify-write
+    aliases = replica_aliases(primary)
+    if not aliases:
+        return primary
+    # setdefault: worker threads of an async view may ask at the same time
+    return state.replicas.setdefault(primary, random.choice(aliases))
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would write an instance back to the alias it was read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS}
+        for primary, aliases in replica_map().items():
+            databases.update([primary, *aliases])
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def record_write():
+    """Pin the current request (and, via the cookie, its client) to the primary."""
+    state = _request.get()
+    if state is not None:
+        state.wrote = True
+
+
+def _use_replica(request):
+    state = _request.get()
+    if state is None or state.pinned or state.wrote or not replica_map() or request.method not in SAFE_METHODS:
+        return None, None
+    previous, state.replicas = state.replicas, {}
+    return state, previous
+
+
+def replica_reads(view):
+    """Route the view's reads to a replica unless the client is pinned to the primary."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state, previous = _use_replica(request)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                if state is not None:
+                    state.replicas = previous
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state, previous = _use_replica(request)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                if state is not None:
+                    state.replicas = previous
+    return wrapper
+
+
+class ReadYourWritesMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestDatabases(pinned=PIN_COOKIE in request.COOKIES, wrote=request.method not in SAFE_METHODS)
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,242 @@
+"""
+Auto-categorization rules.
+
+A CategoryRule gives a category to transactions whose note contains a keyword
+or matches a regex, optionally only on one account and/or within an amount
+range. Rules apply to rows of their category's type and are tried by
+priority; the first one that applies wins.
+
+A user's rules are compiled into one ``RuleSet`` that finds the candidate
+rules of a note in one pass, whatever the number of rules:
+
+* keywords go into an Aho-Corasick automaton over the lowercased note, which
+  reports every keyword occurring in it;
+* regexes become the alternatives of a single case-insensitive regex inside a
+  lookahead, whose ``finditer`` reports, at each position, the first regex
+  rule (by priority) matching there. One that is not reported can only match
+  where an earlier one was, so it is searched on its own only in that case.
+
+The conditions (type, account, amount) are then checked in priority order.
+
+Compiled sets are kept per process (LRU) under the user's rules version,
+``Profile.rules_version``, which moves (to the current time in nanoseconds)
+whenever one of the user's rules or categories changes (money.signals). It
+lives in the database, so every process recompiles on its next use, and
+never depends on what a cache kept.
+
+Rules categorize imported rows without a category (money.importer), rows
+entered without one, and existing rows through ``manage.py recategorize``.
+"""
+import re
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.db.models import BigIntegerField, ExpressionWrapper, F, Value
+from django.db.models.functions import Greatest
+
+from . import ledger, sharding
+from .caching import bump_data_version
+from .cents import from_cents, to_cents
+from .models import Category, CategoryRule, Profile, Transaction
+
+DEFAULT_CATEGORY = 'Uncategorized'
+BATCH_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    category_id: int
+    type: str
+    account_id: int | None
+    min_cents: int | None
+    max_cents: int | None
+    keyword: str | None  # lowercased; None for a regex rule
+    regex: re.Pattern
+
+    @classmethod
+    def from_rule(cls, rule):
+        return cls(
+            rule.category_id, rule.category.type, rule.account_id,
+            None if rule.min_amount is None else to_cents(rule.min_amount),
+            None if rule.max_amount is None else to_cents(rule.max_amount),
+            rule.pattern.strip().lower() if rule.kind == 'keyword' else None,
+            re.compile(rule.regex_source(), re.IGNORECASE),
+        )
+
+    def applies(self, type, account_id, cents):
+        return (
+            type == self.type
+            and self.account_id in (None, account_id)
+            and (self.min_cents is None or cents >= self.min_cents)
+            and (self.max_cents is None or cents <= self.max_cents)
+        )
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton: ``find`` returns the ids of every keyword occurring in a text."""
+
+    def __init__(self, keywords):
+        # keywords: (lowercased keyword, id) pairs
+        self.goto, self.fail, self.out = [{}], [0], [set()]
+        for word, id in keywords:
+            state = 0
+            for ch in word:
+                if ch not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(set())
+                    self.goto[state][ch] = len(self.goto) - 1
+                state = self.goto[state][ch]
+            self.out[state].add(id)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                if state:
+                    self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.out[child] |= self.out[self.fail[child]]
+
+    def find(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        found, state = set(), 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = list(rules)  # priority order
+        keywords = [(rule.keyword, i) for i, rule in enumerate(self.rules) if rule.keyword]
+        self.keywords = KeywordAutomaton(keywords) if keywords else None
+        self.combined = None
+        self.rule_of_group = {}
+        regexes = [i for i, rule in enumerate(self.rules) if rule.keyword is None]
+        if regexes:
+            group = 1
+            for i in regexes:
+                self.rule_of_group[group] = i
+                group += 1 + self.rules[i].regex.groups
+            alternatives = '|'.join(f'({self.rules[i].regex.pattern})' for i in regexes)
+            self.combined = re.compile(f'(?=(?:{alternatives}))', re.IGNORECASE)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, note, type, account_id, cents):
+        """Category id of the first rule that applies to the row, or None."""
+        if not self.rules or not note:
+            return None
+        found = self.keywords.find(note.lower()) if self.keywords else set()
+        # The outer group of an alternative closes last, so lastindex names it
+        reported = {self.rule_of_group[m.lastindex] for m in self.combined.finditer(note)} if self.combined else set()
+        if not found and not reported:
+            return None
+        found |= reported
+        first_reported = min(reported, default=len(self.rules))
+        for i in range(min(found), len(self.rules)):
+            rule = self.rules[i]
+            if not rule.applies(type, account_id, cents):
+                continue
+            # A regex not reported can only match where an earlier regex was
+            if i in found or (rule.keyword is None and i > first_reported and rule.regex.search(note)):
+                return rule.category_id
+        return None
+
+
+# ---------- Per-user cache ----------
+
+def rules_version(user_id):
+    profiles = Profile.objects.using(sharding.db_for_user(user_id))
+    return profiles.filter(user_id=user_id).values_list('rules_version', flat=True).first() or 0
+
+
+def forget_rules(user_id):
+    # A timestamp rather than a counter: a user id reused by a new user (or a
+    # test database) never gets the version of an older compiled set
+    now = time.time_ns()
+    profiles = Profile.objects.using(sharding.db_for_user(user_id))
+    if not profiles.filter(user_id=user_id).update(rules_version=Greatest(F('rules_version') + 1, Value(now))):
+        profiles.bulk_create([Profile(user_id=user_id, rules_version=now)], ignore_conflicts=True)
+
+
+@lru_cache(maxsize=256)
+def _compile(user_id, version):
+    rules = CategoryRule.objects.filter(user_id=user_id).select_related('category').order_by('priority', 'pk')
+    return RuleSet(CompiledRule.from_rule(rule) for rule in rules)
+
+
+def rule_set(user_id):
+    """The user's compiled rules; one version lookup unless they changed."""
+    return _compile(user_id, rules_version(user_id))
+
+
+def matching_category(user, note, type, account_id, amount):
+    """Category id of the first rule that applies, or None; never writes."""
+    return rule_set(user.pk).match(note, type, account_id, to_cents(amount))
+
+
+def default_category(user, type):
+    """The category of rows no rule applies to, created on first use."""
+    return Category.objects.get_or_create(user=user, name=DEFAULT_CATEGORY, type=type)[0]
+
+
+def categorize(user, note, type, account_id, amount):
+    """Category id for a row entered without one: the first rule that applies, else the default."""
+    return matching_category(user, note, type, account_id, amount) or default_category(user, type).pk
+
+
+# ---------- Existing rows ----------
+
+def recategorize(user_id, batch_size=BATCH_SIZE, uncategorized_only=False, dry_run=False):
+    """
+    Apply the user's rules to their live transactions in primary-key batches;
+    rows no rule applies to keep their category. Returns the rows changed.
+
+    Each batch is read, matched and written in one transaction: an UPDATE per
+    category the batch's rows move to (rather than bulk_update's per-row CASE)
+    and the rollup deltas merged by a LedgerBatch.
+    """
+    rules = rule_set(user_id)
+    if not rules:
+        return 0
+    rows = Transaction.objects.filter(user_id=user_id)
+    if uncategorized_only:
+        rows = rows.filter(category__name=DEFAULT_CATEGORY)
+    rows = rows.annotate(cents=ExpressionWrapper(F('amount'), output_field=BigIntegerField()))
+    changed, last = 0, 0
+    while True:
+        with sharding.atomic():
+            batch = list(
+                rows.filter(pk__gt=last).order_by('pk').select_for_update(of=('self',))
+                .values_list('pk', 'note', 'type', 'account_id', 'cents', 'category_id', 'date')[:batch_size]
+            )
+            if not batch:
+                break
+            last = batch[-1][0]
+            moves, deltas = defaultdict(list), ledger.LedgerBatch()
+            for pk, note, type, account_id, cents, category_id, day in batch:
+                found = rules.match(note, type, account_id, cents)
+                if found and found != category_id:
+                    moves[found].append(pk)
+                    old = {'user_id': user_id, 'account_id': account_id, 'category_id': category_id,
+                           'type': type, 'amount': from_cents(cents), 'date': day}
+                    deltas.add(old, {**old, 'category_id': found})
+            if moves and not dry_run:
+                for category_id, pks in moves.items():
+                    Transaction.objects.filter(pk__in=pks).update(category_id=category_id)
+                deltas.apply()  # moves the amounts between category rollups
+            changed += sum(len(pks) for pks in moves.values())
+    if changed and not dry_run:
+        bump_data_version(user_id)
+    return changed
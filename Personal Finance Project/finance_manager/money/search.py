@@ -0,0 +1,87 @@
+"""
+Transaction search backed by the full-text index from migration 0005.
+
+``search_transactions(qs, q)`` keeps rows whose note contains every term of
+``q`` (each term also matches as a prefix, e.g. ``groc`` -> ``groceries``), or
+whose category name contains ``q``. Notes are matched through MySQL FULLTEXT
+(boolean mode) or the SQLite FTS5 table; other backends fall back to LIKE.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import ArchivedTransaction, Category, Transaction
+
+# InnoDB's default innodb_ft_min_token_size; shorter terms are never indexed
+MYSQL_MIN_TOKEN = 3
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(q):
+    return TERM_RE.findall(q.lower())
+
+
+def note_match(terms, user_id, vendor):
+    """
+    Q matching the user's notes that contain every term (as a prefix), or None
+    if ``vendor`` has no full-text index. The subquery is scoped to the user,
+    so it only reads their share of the index.
+    """
+    if vendor == 'sqlite':
+        expr = ' '.join(f'"{t}"*' for t in terms)
+        return Q(id__in=RawSQL(
+            'SELECT money_transaction_fts.rowid FROM money_transaction_fts '
+            'JOIN money_transaction ON money_transaction.id = money_transaction_fts.rowid '
+            'WHERE money_transaction_fts MATCH %s AND money_transaction.user_id = %s', [expr, user_id]
+        ))
+    if vendor == 'mysql':
+        if any(len(t) < MYSQL_MIN_TOKEN for t in terms):
+            return None
+        expr = ' '.join(f'+{t}*' for t in terms)
+        return Q(id__in=RawSQL(
+            'SELECT id FROM money_transaction WHERE user_id = %s AND MATCH (note) AGAINST (%s IN BOOLEAN MODE)',
+            [user_id, expr],
+        ))
+    return None
+
+
+def search_transactions(qs, q, user):
+    q = q.strip()
+    if not q:
+        return qs
+    terms = search_terms(q)
+    # The full-text index only covers the live table; the archive is scanned with LIKE
+    notes = note_match(terms, user.pk, connections[qs.db].vendor) if terms and qs.model is Transaction else None
+    if notes is None:
+        notes = Q()
+        for t in terms or [q]:
+            notes &= Q(note__icontains=t)
+
+    # Category names are a handful of rows per user: resolve them first
+    category_ids = list(
+        Category.objects.filter(user=user, name__icontains=q).values_list('id', flat=True)
+    )
+    return qs.filter(notes | Q(category_id__in=category_ids))
+
+
+def filter_transactions(user, q='', account_id=None, start=None, end=None, archived=False):
+    """
+    The user's transactions narrowed by the transaction list filters; with
+    ``archived`` the rows moved to the archive table instead (money.archive).
+    """
+    model = ArchivedTransaction if archived else Transaction
+    tx = model.objects.filter(user=user)
+    if q:
+        tx = search_transactions(tx, q, user)
+    if account_id:
+        try:
+            tx = tx.filter(account_id=int(account_id))
+        except ValueError:
+            pass
+    if start:
+        tx = tx.filter(date__gte=start)
+    if end:
+        tx = tx.filter(date__lte=end)
+    return tx
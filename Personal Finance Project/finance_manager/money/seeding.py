@@ -0,0 +1,118 @@
+"""
+Synthetic ledgers for demos and benchmarks.
+
+``seed_user`` creates one user with a realistic set of accounts, categories,
+monthly budgets and ``transactions`` rows spread over the last ``months``
+months: a salary and rent every month plus day-to-day expenses. Rows are
+generated lazily and written with ``bulk_create``; the ledger aggregates are
+updated through a LedgerBatch, so seeding 10M rows needs neither per-row
+queries nor the whole data set in memory.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from . import ledger, sharding
+from .caching import bump_data_version
+from .models import Account, Budget, Category, Transaction
+
+ACCOUNTS = (('Cash', 500), ('Bank', 3000), ('Savings', 10000), ('Credit Card', 0))
+INCOME = {'Salary': (4500, 300), 'Bonus': (800, 400), 'Interest': (25, 10)}
+# name: (typical amount, spread, relative frequency)
+EXPENSE = {
+    'Food': (25, 12, 30), 'Transport': (15, 8, 15), 'Groceries': (90, 40, 10),
+    'Shopping': (120, 80, 6), 'Entertainment': (45, 25, 5), 'Utilities': (150, 40, 2),
+    'Health': (70, 50, 2), 'Rent': (1400, 0, 1),
+}
+NOTES = ('', '', 'weekly', 'online', 'with friends', 'monthly', 'card', 'refund pending')
+
+
+def month_starts(today, months):
+    d = today.replace(day=1)
+    out = []
+    for _ in range(months):
+        out.append(d)
+        d = (d - timedelta(days=1)).replace(day=1)
+    return out[::-1]
+
+
+def amount(rng, mean, spread):
+    return Decimal(max(1.0, rng.gauss(mean, spread))).quantize(Decimal('0.01'))
+
+
+def generate_transactions(rng, user, accounts, categories, count, months, today):
+    """Yield unsaved Transaction objects: fixed monthly items first, then random spend."""
+    starts = month_starts(today, months)
+    span = (today - starts[0]).days + 1
+    produced = 0
+    for m in starts:
+        for name, typ, day in (('Rent', 'expense', 1), ('Salary', 'income', 25)):
+            if produced >= count:
+                return
+            mean, spread = INCOME[name] if typ == 'income' else EXPENSE[name][:2]
+            yield Transaction(
+                user=user, account=accounts['Bank'], category=categories[(name, typ)], type=typ,
+                amount=amount(rng, mean, spread), date=min(m.replace(day=day), today),
+                note=f'{name} {m:%Y-%m}',
+            )
+            produced += 1
+
+    names = list(EXPENSE)
+    weights = [EXPENSE[n][2] for n in names]
+    account_list = list(accounts.values())
+    while produced < count:
+        if rng.random() < 0.05:
+            name = rng.choice(('Bonus', 'Interest'))
+            typ, (mean, spread) = 'income', INCOME[name]
+        else:
+            name = rng.choices(names, weights)[0]
+            typ, (mean, spread, _) = 'expense', EXPENSE[name]
+        yield Transaction(
+            user=user, account=rng.choice(account_list), category=categories[(name, typ)], type=typ,
+            amount=amount(rng, mean, spread), date=today - timedelta(days=rng.randrange(span)),
+            note=rng.choice(NOTES),
+        )
+        produced += 1
+
+
+def seed_user(username, transactions=1000, months=36, seed=None, password='password',
+              batch_size=5000, today=None):
+    rng = random.Random(seed)
+    today = today or date.today()
+    user = User.objects.create_user(username, password=password)
+    with sharding.use_user_shard(user.pk), sharding.atomic():
+        accounts = {
+            name: Account.objects.create(user=user, name=name, balance=opening)
+            for name, opening in ACCOUNTS
+        }
+        categories = {}
+        for name in INCOME:
+            categories[(name, 'income')] = Category.objects.create(user=user, name=name, type='income')
+        for name in EXPENSE:
+            categories[(name, 'expense')] = Category.objects.create(user=user, name=name, type='expense')
+        Budget.objects.bulk_create([
+            Budget(user=user, category=categories[(name, 'expense')], month=m,
+                   amount=Decimal(EXPENSE[name][0] * EXPENSE[name][2] * 1.1).quantize(Decimal('1')))
+            for m in month_starts(today, min(months, 12)) for name in ('Food', 'Transport', 'Groceries', 'Rent')
+        ])
+
+        batch = ledger.LedgerBatch()
+        chunk = []
+        for tx in generate_transactions(rng, user, accounts, categories, transactions, months, today):
+            chunk.append(tx)
+            if len(chunk) >= batch_size:
+                _insert(chunk, batch)
+                chunk = []
+        if chunk:
+            _insert(chunk, batch)
+        batch.apply()
+    bump_data_version(user.pk)
+    return user
+
+
+def _insert(chunk, batch):
+    Transaction.objects.bulk_create(chunk)
+    for tx in chunk:
+        batch.add(None, tx.ledger_state())
@@ -0,0 +1,362 @@
+"""
+User-sharded storage.
+
+``settings.DATABASE_SHARDS`` lists the database aliases that hold user data.
+auth, sessions and the UserShard directory always stay on ``default``; every
+other money model lives on its user's shard. With the single default shard
+(the default setting) everything below is a no-op.
+
+* Placement: a new user goes to ``DATABASE_SHARDS[user_id % N]`` and gets a
+  UserShard row. Users without one (everyone who signed up before sharding was
+  switched on) live on the first shard. The shard also gets a copy of the
+  auth_user row, so foreign keys and joins to User keep working there.
+* Routing: money code runs inside a shard context. ShardMiddleware opens the
+  signed-in user's; management commands use ``each_shard()`` or
+  ``use_user_shard()``. ShardRouter sends every money query to the context's
+  shard and refuses writes outside one; use ``atomic()`` so transactions open
+  on the same database. Reads of ``replica_reads`` views go to a replica of
+  that shard when DATABASE_REPLICAS lists some (money.routers.read_alias).
+* Rebalancing: ``move_user`` (``manage.py rebalance_user``) locks the user's
+  directory entry, which refuses their writes, copies their rows to the
+  target shard in primary-key batches (under new primary keys, since the
+  target may already use the old ones), flips the directory and deletes the
+  old copy. An interrupted move is simply run again.
+
+Directory entries are read from the UserShard table on ``default`` (a
+primary-key lookup) and memoized for the rest of the request by
+ShardMiddleware -- never kept across requests, so every process sees a lock or
+a flipped entry from its next request on.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import HttpResponse
+
+from .models import (
+    Account, AccountCheckpoint, ArchivedTransaction, Budget, BudgetSnapshot, Category, CategoryRule,
+    MonthlyCategoryTotal, Profile, RecurringTransaction, Transaction, UserShard,
+)
+from .routers import primary_of, read_alias
+
+BATCH_SIZE = 2000
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Parents first; deleted in reverse
+USER_MODELS = (
+    Profile, Category, Account, CategoryRule, RecurringTransaction, Budget, Transaction, ArchivedTransaction,
+    MonthlyCategoryTotal, AccountCheckpoint, BudgetSnapshot,
+)
+
+_current = ContextVar('money_shard', default=None)
+_memo = ContextVar('money_shard_placements', default=None)  # {user_id: Placement}, per request
+
+
+class ShardContextRequired(RuntimeError):
+    """A money model was written with no shard to route it to."""
+
+
+@dataclass(frozen=True)
+class Placement:
+    alias: str
+    locked: bool = False
+
+
+def shard_aliases():
+    return list(getattr(settings, 'DATABASE_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def sharding_enabled():
+    return shard_aliases() != [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'money' and model is not UserShard
+
+
+# ---------- Directory ----------
+
+def placement(user_id):
+    if not sharding_enabled():
+        return Placement(DEFAULT_DB_ALIAS)
+    memo = _memo.get()
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+    row = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('alias', 'locked').first()
+    found = Placement(*row) if row else Placement(shard_aliases()[0])
+    if memo is not None:
+        memo[user_id] = found
+    return found
+
+
+def shard_for_user(user_id):
+    return placement(user_id).alias
+
+
+def _set_placement(user_id, alias, locked):
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={'alias': alias, 'locked': locked},
+    )
+    memo = _memo.get()
+    if memo is not None:
+        memo.pop(user_id, None)
+
+
+def assign_shard(user):
+    """Place a new user (called on User creation) and copy their auth row there."""
+    aliases = shard_aliases()
+    alias = aliases[user.pk % len(aliases)]
+    _set_placement(user.pk, alias, False)
+    mirror_user(user, alias)
+    return alias
+
+
+def mirror_user(user, alias):
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    fields = {f.attname: getattr(user, f.attname) for f in User._meta.concrete_fields if not f.primary_key}
+    User.objects.using(alias).update_or_create(pk=user.pk, defaults=fields)
+
+
+# ---------- Context ----------
+
+def db():
+    """Alias of the current shard (the first shard outside any context)."""
+    return _current.get() or shard_aliases()[0]
+
+
+def atomic(**kwargs):
+    return transaction.atomic(using=db(), **kwargs)
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current.set(alias)
+    try:
+        yield alias
+    finally:
+        _current.reset(token)
+
+
+def db_for_user(user_id):
+    """The current shard inside a context, the user's otherwise."""
+    return _current.get() or shard_for_user(user_id)
+
+
+def use_user_shard(user_id):
+    return use_shard(shard_for_user(user_id))
+
+
+def each_shard(user_id=None):
+    """Run the loop body once per shard (only the user's, if given) inside its context."""
+    for alias in [shard_for_user(user_id)] if user_id else shard_aliases():
+        with use_shard(alias):
+            yield alias
+
+
+def shard_user_ids(alias=None):
+    """Ids of the users whose rows live on ``alias`` (default: the current shard)."""
+    alias = alias or db()
+    users = User.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+    if sharding_enabled():
+        users = users.exclude(pk__in=UserShard.objects.exclude(alias=alias).values('user_id'))
+        if alias != shard_aliases()[0]:  # only the first shard has users without an entry
+            users = users.filter(shard__alias=alias)
+    return users.values_list('pk', flat=True)
+
+
+class ShardRouter:
+    def _from_hints(self, hints):
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db is not None and is_sharded(type(instance)):
+            return primary_of(instance._state.db)  # read from a replica: its shard
+        user_id = instance.pk if isinstance(instance, User) else getattr(instance, 'user_id', None)
+        return shard_for_user(user_id) if user_id is not None else None
+
+    def db_for_read(self, model, **hints):
+        if model is UserShard:
+            return DEFAULT_DB_ALIAS
+        if not is_sharded(model) or not sharding_enabled():
+            return None
+        return read_alias(_current.get() or self._from_hints(hints) or shard_aliases()[0])
+
+    def db_for_write(self, model, **hints):
+        if model is UserShard:
+            return DEFAULT_DB_ALIAS
+        if not is_sharded(model) or not sharding_enabled():
+            return None
+        alias = _current.get() or self._from_hints(hints)
+        if alias is None:
+            raise ShardContextRequired(
+                f'{model.__name__} written outside a shard context; wrap it in money.sharding.use_user_shard()'
+            )
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding_enabled():
+            databases = {DEFAULT_DB_ALIAS, *shard_aliases()}
+            if obj1._state.db in databases and obj2._state.db in databases:
+                return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'money' and model_name == 'usershard':
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+class ShardMiddleware:
+    """Runs each signed-in request inside its user's shard (after AuthenticationMiddleware)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sharding_enabled():
+            return self.get_response(request)
+        token = _memo.set({})
+        try:
+            if not request.user.is_authenticated:
+                return self.get_response(request)
+            where = placement(request.user.pk)
+            if where.locked and request.method not in SAFE_METHODS:
+                return HttpResponse('Your data is being moved; please try again in a minute.', status=503)
+            with use_shard(where.alias):
+                return self.get_response(request)
+        finally:
+            _memo.reset(token)
+
+
+# ---------- Rebalancing ----------
+
+def _user_rows(model, alias, user_id):
+    manager = model._base_manager.using(alias)
+    if model is AccountCheckpoint:
+        return manager.filter(account__user_id=user_id)
+    return manager.filter(user_id=user_id)
+
+
+def _delete_pks(model, alias, pks):
+    # Raw DELETE: signals/cascades would re-run the ledger for rows that are going away
+    conn = connections[alias]
+    table = conn.ops.quote_name(model._meta.db_table)
+    column = conn.ops.quote_name(model._meta.pk.column)
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(pks))})', pks)
+
+
+def _references(model):
+    # Foreign keys to the user's other rows (auth ids are the same on every shard)
+    return {f.attname: f.related_model for f in model._meta.concrete_fields if f.is_relation and f.related_model is not User}
+
+
+# Models other copied rows point at, whose old -> new ids copy_rows keeps
+PARENT_MODELS = {parent for model in USER_MODELS for parent in _references(model).values()}
+
+
+def _insert(model, alias, objs, with_pk):
+    """
+    INSERT ``objs`` as they are (raw: auto_now fields keep their values); without
+    ``with_pk`` the database picks the primary keys, which are set on ``objs``.
+    """
+    conn = connections[alias]
+    fields = [f for f in model._meta.concrete_fields if with_pk or not f.primary_key]
+    returning = None if with_pk else model._meta.db_returning_fields
+    if with_pk or conn.features.can_return_rows_from_bulk_insert:
+        size = conn.ops.bulk_batch_size(fields, objs) or len(objs)
+        chunks = [objs[i:i + size] for i in range(0, len(objs), size)]
+    else:
+        chunks = [[obj] for obj in objs]  # MySQL only reports the id of a single-row INSERT
+    manager = model._base_manager.using(alias)
+    for chunk in chunks:
+        rows = manager._insert(chunk, fields=fields, returning_fields=returning, raw=True, using=alias)
+        if not with_pk:
+            for obj, row in zip(chunk, rows):
+                obj.pk = row[0]
+
+
+def copy_rows(model, source, target, user_id, batch_size=BATCH_SIZE, ids=None):
+    """
+    Copy the user's rows of ``model`` in primary-key batches; returns rows copied.
+
+    The target shard hands out new primary keys -- the old ones may belong to
+    another user there -- and foreign keys are rewritten through ``ids``,
+    {model: {old pk: new pk}}, filled in by copying the parent models first.
+    Archived rows take their ids from the target's Transaction table, the id
+    space money.archive moves them out of.
+    """
+    ids = {} if ids is None else ids
+    fields = [f.attname for f in model._meta.concrete_fields]
+    pk = model._meta.pk.attname
+    references = _references(model)
+    keep_pk = model._meta.pk.is_relation  # Profile, BudgetSnapshot: keyed by their parent
+    copied, last = 0, None
+    while True:
+        rows = _user_rows(model, source, user_id).order_by(pk)
+        if last is not None:
+            rows = rows.filter(pk__gt=last)
+        batch = list(rows.values(*fields)[:batch_size])
+        if not batch:
+            return copied
+        old_pks = [row[pk] for row in batch]
+        for row in batch:
+            for attname, parent in references.items():
+                if row[attname] is not None:
+                    row[attname] = ids[parent][row[attname]]
+            if not keep_pk:
+                del row[pk]
+        objs = [model(**row) for row in batch]
+        with transaction.atomic(using=target):
+            if model is ArchivedTransaction:
+                live = [Transaction(**{f: v for f, v in row.items() if f != 'archived_at'}) for row in batch]
+                _insert(Transaction, target, live, with_pk=False)
+                for obj, tx in zip(objs, live):
+                    obj.pk = tx.pk
+                _insert(model, target, objs, with_pk=True)
+                _delete_pks(Transaction, target, [tx.pk for tx in live])
+            else:
+                _insert(model, target, objs, with_pk=keep_pk)
+        if model in PARENT_MODELS:
+            ids.setdefault(model, {}).update(zip(old_pks, (obj.pk for obj in objs)))
+        copied += len(batch)
+        last = old_pks[-1]
+
+
+def purge_user(alias, user_id, batch_size=BATCH_SIZE):
+    """Delete the user's money rows (and mirrored auth row) from one shard."""
+    for model in reversed(USER_MODELS):
+        while pks := list(_user_rows(model, alias, user_id).values_list('pk', flat=True)[:batch_size]):
+            with transaction.atomic(using=alias):
+                _delete_pks(model, alias, pks)
+    if alias != DEFAULT_DB_ALIAS:
+        _delete_pks(User, alias, [user_id])  # no UserShard table to cascade to there
+
+
+def move_user(user_id, target, batch_size=BATCH_SIZE):
+    """Move a user's rows to ``target``; returns {model name: rows copied}."""
+    if target not in shard_aliases():
+        raise ValueError(f'{target!r} is not in DATABASE_SHARDS')
+    source = shard_for_user(user_id)
+    copied = {}
+    if source != target:
+        _set_placement(user_id, source, True)
+        try:
+            purge_user(target, user_id, batch_size)  # leftovers of an interrupted move
+            # After the purge, which drops the target's copy of the auth row
+            mirror_user(User.objects.using(DEFAULT_DB_ALIAS).get(pk=user_id), target)
+            ids = {}
+            for model in USER_MODELS:
+                copied[model.__name__] = copy_rows(model, source, target, user_id, batch_size, ids)
+        except BaseException:
+            _set_placement(user_id, source, False)
+            raise
+        _set_placement(user_id, target, False)
+    # The old copy -- or leftovers of an earlier move that stopped after the flip
+    for alias in shard_aliases():
+        if alias != target:
+            purge_user(alias, user_id, batch_size)
+    return copied
@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import ledger, routers, rules, sharding
+from .caching import bump_data_version
+from .models import Account, Budget, Category, CategoryRule, Profile, Transaction
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def model_written(sender, raw=False, **kwargs):
+    # Any model, sharded or not: the client reads from the primary for a while
+    if not raw:
+        routers.record_write()
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:  # loaddata: let rebuild_ledger reconcile
+        return
+    old = None if created else instance.original_ledger_state()
+    new = instance.ledger_state()
+    ledger.record_change(old, new)
+    bump_data_version(new['user_id'])
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    old = instance.original_ledger_state()
+    ledger.record_change(old, None)
+    bump_data_version(old['user_id'])
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+@receiver(post_save, sender=Profile)
+def user_data_changed(sender, instance, **kwargs):
+    # Invalidates the user's cached dashboard (money.caching)
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=CategoryRule)
+@receiver(post_delete, sender=CategoryRule)
+@receiver(post_save, sender=Category)
+def rules_changed(sender, instance, **kwargs):
+    # Recompile the user's categorization rules on next use (money.rules)
+    rules.forget_rules(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, using, update_fields=None, raw=False, **kwargs):
+    # Place new users on a shard and keep their mirrored auth row current (money.sharding)
+    if raw or using != DEFAULT_DB_ALIAS or not sharding.sharding_enabled():
+        return
+    if created:
+        sharding.assign_shard(instance)
+    elif update_fields is None or set(update_fields) != {'last_login'}:
+        sharding.mirror_user(instance, sharding.shard_for_user(instance.pk))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, using, **kwargs):
+    # Their rows live on the shard, out of reach of the cascade on `default`
+    if using == DEFAULT_DB_ALIAS and sharding.sharding_enabled():
+        sharding.purge_user(sharding.shard_for_user(instance.pk), instance.pk)
@@ -1,3 +1,1315 @@
-from django.test import TestCase
+import csv
+import json
+import re
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import budgets, fx, importer, ledger, recurring, rules, sharding
+from .archive import archive
+from .cents import SumCents, cents_value, from_cents, to_cents
+from .checkpoints import balance_as_of, balance_history, rebuild_checkpoints
+from .dashboard import dashboard_data
+from .export import iter_export
+from .forecast import build_forecast
+from .importer import import_transactions
+from .metrics import Registry, registry, render_prometheus
+from .reports import MAX_REPORT_DAYS, build_report
+from .routers import PIN_COOKIE
+from .search import filter_transactions, note_match
+from .models import (
+    Account, AccountCheckpoint, ArchivedTransaction, Budget, BudgetSnapshot, Category, CategoryRule,
+    MonthlyCategoryTotal, Profile, RecurringTransaction, Transaction, UserShard,
+)
+
+
+class DashboardQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.accounts = [
+            Account.objects.create(user=self.user, name=name, balance=100) for name in ('Cash', 'Bank')
+        ]
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.salary = Category.objects.create(user=self.user, name='Salary', type='income')
+        self.today = date.today()
+        Budget.objects.create(user=self.user, category=self.food, month=self.today.replace(day=1), amount=500)
+
+    def add_transactions(self, count):
+        for i in range(count):
+            Transaction.objects.create(
+                user=self.user, account=self.accounts[i % 2],
+                category=self.food if i % 3 else self.salary,
+                type='expense' if i % 3 else 'income',
+                amount=Decimal('10.50'), date=self.today - timedelta(days=i * 7),
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            dashboard_data(self.user, self.today)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.add_transactions(3)
+        small = self.count_queries()
+        self.add_transactions(60)
+        self.assertEqual(self.count_queries(), small)
+        self.assertLessEqual(small, 4)
+
+    def test_figures_match_transactions(self):
+        self.add_transactions(30)
+        data = dashboard_data(self.user, self.today)
+        month = Transaction.objects.filter(user=self.user, date__gte=self.today.replace(day=1))
+        expense = sum(t.amount for t in month if t.type == 'expense')
+        income = sum(t.amount for t in month if t.type == 'income')
+        live = 200 + sum(t.amount if t.type == 'income' else -t.amount for t in Transaction.objects.all())
+        self.assertEqual(data['expense'], expense)
+        self.assertEqual(data['income'], income)
+        self.assertEqual(data['live_total'], live)
+        self.assertEqual(data['spent_values'], [float(expense)])
+        self.assertEqual(sum(data['exp_daily_values']), float(expense))
+
+    def test_view_renders(self):
+        self.add_transactions(5)
+        self.client.login(username='alice', password='pw')
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['live_total'], dashboard_data(self.user, self.today)['live_total'])
+
+
+class ChartApiTests(DashboardQueryBudgetTests):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.login(username='alice', password='pw')
+
+    def test_series_match_dashboard(self):
+        self.add_transactions(10)
+        data = dashboard_data(self.user, self.today)
+        trend = self.client.get('/api/charts/monthly-trend/').json()
+        self.assertEqual(trend, {'labels': data['chart_labels'], 'values': data['chart_values']})
+        daily = self.client.get('/api/charts/daily-expense/').json()
+        self.assertEqual(daily['values'], data['exp_daily_values'])
+        budgets = self.client.get('/api/charts/budgets/').json()
+        self.assertEqual(budgets['spent'], data['spent_values'])
+        self.assertEqual(self.client.get('/api/charts/nope/').status_code, 404)
+
+    def test_cache_counters_exported(self):
+        self.client.get('/')
+        self.client.get('/')
+        staff = User.objects.create_user('ops', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('money_dashboard_cache_requests_total{outcome="hit"} 1', body)
+        self.assertIn('money_dashboard_cache_requests_total{outcome="miss"} 1', body)
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/charts/accounts/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/charts/accounts/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.add_transactions(1)
+        response = self.client.get('/api/charts/accounts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('met', password='pw')
+        self.client.force_login(self.user)
+        registry.reset()
+
+    def test_histogram_buckets(self):
+        stats = Registry()
+        for seconds in (0.001, 0.005, 0.3, 0.3, 20):  # a bucket holds durations up to its bound
+            stats.observe('v', seconds, 2, 0.001, False)
+        buckets, count, seconds, queries, *_ = stats.snapshot()['v']
+        self.assertEqual(buckets, [2, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 1])
+        self.assertEqual((count, round(seconds, 3), queries), (5, 20.606, 10))
+        body = render_prometheus(stats.snapshot(), {})
+        self.assertIn('money_view_request_seconds_bucket{view="v",le="0.005"} 2', body)
+        self.assertIn('money_view_request_seconds_bucket{view="v",le="0.5"} 4', body)
+        self.assertIn('money_view_request_seconds_bucket{view="v",le="+Inf"} 5', body)
+        self.assertIn('money_view_request_seconds_count{view="v"} 5', body)
+
+    def test_request_queries_recorded(self):
+        ran = []  # counted here too (CaptureQueriesContext loses them: request_started resets the log)
+        with connection.execute_wrapper(lambda execute, sql, *args: ran.append(sql) or execute(sql, *args)):
+            self.client.get('/accounts/')
+        self.client.get('/accounts/')
+        buckets, count, _, queries, db_seconds, over_budget = registry.snapshot()['accounts']
+        self.assertEqual((count, sum(buckets), queries), (2, 2, 2 * len(ran)))
+        self.assertGreater(db_seconds, 0)
+        self.assertEqual(over_budget, 0)
+
+    def test_over_budget(self):
+        with override_settings(METRICS_QUERY_BUDGET=1), self.assertLogs('money.metrics', 'WARNING') as logs:
+            self.client.get('/accounts/')
+        self.assertIn('/accounts/ issued', logs.output[0])
+        with override_settings(METRICS_QUERY_BUDGET=1000), self.assertNoLogs('money.metrics', 'WARNING'):
+            self.client.get('/accounts/')
+        self.assertEqual(registry.snapshot()['accounts'][5], 1)
+        self.assertIn('money_view_over_query_budget_total{view="accounts"} 1', render_prometheus(cache_counts={}))
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN every money_* query issued by the hot views; none may scan a whole table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'user{i}', password='pw') for i in range(3)]
+        today = date.today()
+        for user in cls.users:
+            accounts = [Account.objects.create(user=user, name=n) for n in ('Cash', 'Bank')]
+            food = Category.objects.create(user=user, name='Food', type='expense')
+            salary = Category.objects.create(user=user, name='Salary', type='income')
+            Budget.objects.create(user=user, category=food, month=today.replace(day=1), amount=300)
+            Transaction.objects.bulk_create([
+                Transaction(
+                    user=user, account=accounts[i % 2], category=food if i % 4 else salary,
+                    type='expense' if i % 4 else 'income', amount=Decimal('12.00'),
+                    date=today - timedelta(days=i), note=f'tx {i}',
+                )
+                for i in range(200)
+            ])
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+        cls.account = Account.objects.filter(user=cls.users[0]).first()
+
+    def setUp(self):
+        cache.clear()  # the dashboard must actually query
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+                return [d for d in details if d.startswith('SCAN money_') and 'USING' not in d]
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql)
+                columns = [c[0] for c in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                return [r for r in rows if (r['table'] or '').startswith('money_') and r['type'] == 'ALL']
+        self.skipTest(f'no EXPLAIN parser for {connection.vendor}')
+
+    def assert_no_full_scans(self, url):
+        self.client.login(username='user0', password='pw')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        queries = [q['sql'] for q in ctx.captured_queries if 'money_' in q['sql'] and q['sql'].startswith('SELECT')]
+        self.assertTrue(queries)
+        for sql in queries:
+            self.assertEqual(self.full_scans(sql), [], sql)
+
+    def test_dashboard(self):
+        self.assert_no_full_scans('/')
+        for series in ('daily-expense', 'monthly-trend', 'budgets', 'accounts'):
+            self.assert_no_full_scans(f'/api/charts/{series}/')
+
+    def test_transaction_list(self):
+        self.assert_no_full_scans('/transactions/')
+        self.assert_no_full_scans(f'/transactions/?account={self.account.pk}')
+
+    def test_budget_list(self):
+        self.assert_no_full_scans('/budgets/')
+
+    def test_account_list(self):
+        self.assert_no_full_scans('/accounts/')
+
+
+class CentsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cents', password='pw')
+        self.account = Account.objects.create(user=self.user, name='Cash', balance='10.50')
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+
+    def spend(self, *amounts):
+        for amount in amounts:
+            Transaction.objects.create(user=self.user, account=self.account, category=self.food,
+                                       type='expense', amount=amount, date=date(2025, 1, 1))
+
+    def test_conversions(self):
+        for units, cents in [('0', 0), ('0.01', 1), ('-0.01', -1), ('12.34', 1234), ('-12.34', -1234),
+                             (3, 300), (0.1, 10), ('9999999999.99', 999999999999)]:
+            self.assertEqual(to_cents(units), cents, units)
+            self.assertEqual(from_cents(cents), Decimal(str(units)).quantize(Decimal('0.01')), units)
+        # A third decimal place rounds half to even, as DecimalField stored it
+        self.assertEqual([to_cents(v) for v in ('0.005', '0.015', '-1.235', '2.675')], [0, 2, -124, 268])
+        self.assertEqual(from_cents(Decimal('150')), Decimal('1.50'))
+
+    def test_field_round_trip(self):
+        self.spend('0.10', '-0.20', Decimal('1234567890.99'), 3)
+        rows = Transaction.objects.order_by('pk')
+        self.assertEqual(list(rows.values_list('amount', flat=True)),
+                         [Decimal('0.10'), Decimal('-0.20'), Decimal('1234567890.99'), Decimal('3.00')])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT amount FROM money_transaction ORDER BY id')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [10, -20, 123456789099, 300])
+        self.assertEqual(rows.filter(amount__gte=Decimal('0.1')).count(), 3)
+        self.assertEqual(rows.filter(amount=0.1).count(), 1)
+        Account.objects.filter(pk=self.account.pk).update(balance=F('balance') + cents_value(5))
+        self.assertEqual(Account.objects.get().balance, Decimal('10.55'))
+
+    def test_validation(self):
+        tx = Transaction(user=self.user, account=self.account, category=self.food, type='expense',
+                         amount='1.234', date=date(2025, 1, 1))
+        for amount in ('1.234', 'abc', '12345678901.00'):
+            tx.amount = amount
+            with self.assertRaises(ValidationError):
+                tx.full_clean()
+        field = Transaction._meta.get_field('amount').formfield()
+        self.assertEqual((type(field).__name__, field.max_digits, field.decimal_places), ('DecimalField', 12, 2))
+
+    def test_sums_are_exact(self):
+        self.spend(*['0.10'] * 10, '-0.30')
+        totals = Transaction.objects.aggregate(cents=SumCents('amount'), units=Sum('amount'))
+        self.assertEqual((totals['cents'], totals['units']), (70, Decimal('0.70')))
+        # Past 2**53 cents, where a float sum would lose the last cent
+        MonthlyCategoryTotal.objects.bulk_create(
+            MonthlyCategoryTotal(user=self.user, month=date(2000 + i // 12, i % 12 + 1, 1), category=self.food,
+                                 type='expense', account=self.account, total=Decimal('999999999999.99'))
+            for i in range(100)
+        )
+        total = MonthlyCategoryTotal.objects.filter(month__year__lt=2025).aggregate(total=SumCents('total'))['total']
+        self.assertEqual(total, 99999999999999 * 100)
+        self.assertGreater(total, 2 ** 53)
+
+
+class CentsMigrationTests(TransactionTestCase):
+    before = [('money', '0011_usershard')]
+    after = [('money', '0012_amounts_in_cents')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('money'))
+
+    def test_amounts_scaled_to_cents_and_back(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('auth', 'User').objects.create(username='old')
+        account = apps.get_model('money', 'Account').objects.create(
+            user_id=user.pk, name='Cash', balance=Decimal('-12.34'), transaction_total=Decimal('1234567890.05'))
+        category = apps.get_model('money', 'Category').objects.create(user_id=user.pk, name='Food', type='expense')
+        apps.get_model('money', 'Transaction').objects.create(
+            user_id=user.pk, account_id=account.pk, category_id=category.pk, type='expense',
+            amount=Decimal('0.07'), date=date(2025, 1, 1))
+
+        self.migrate(self.after)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT balance, transaction_total, archived_total FROM money_account')
+            self.assertEqual(cursor.fetchone(), (-1234, 123456789005, 0))
+            cursor.execute('SELECT amount FROM money_transaction')
+            self.assertEqual(cursor.fetchone(), (7,))
+
+        apps = self.migrate(self.before)
+        account = apps.get_model('money', 'Account').objects.get()
+        self.assertEqual((account.balance, account.transaction_total), (Decimal('-12.34'), Decimal('1234567890.05')))
+        self.assertEqual(apps.get_model('money', 'Transaction').objects.get().amount, Decimal('0.07'))
+
+
+class LedgerTests(TestCase):
+    """Balances, rollups and checkpoints kept by money.ledger must equal a rebuild from scratch."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('led', password='pw')
+        self.cash = Account.objects.create(user=self.user, name='Cash', balance=100)
+        self.bank = Account.objects.create(user=self.user, name='Bank', balance=0)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.rent = Category.objects.create(user=self.user, name='Rent', type='expense')
+        self.salary = Category.objects.create(user=self.user, name='Salary', type='income')
+        self.old = date.today().replace(day=1) - timedelta(days=40)  # in a closed month
+
+    def add(self, amount, account=None, category=None, type='expense', day=None):
+        return Transaction.objects.create(
+            user=self.user, account=account or self.cash, category=category or self.food,
+            type=type, amount=Decimal(amount), date=day or self.old,
+        )
+
+    def rollups(self):
+        return sorted(
+            MonthlyCategoryTotal.objects.filter(count__gt=0)
+            .values_list('month', 'category_id', 'type', 'account_id', 'total', 'count')
+        )
+
+    def checkpoints(self):
+        # A zero checkpoint and a missing one mean the same
+        return sorted(AccountCheckpoint.objects.exclude(total=0).values_list('account_id', 'month', 'total'))
+
+    def assert_consistent(self):
+        accounts = Account.objects.filter(user=self.user)
+        self.assertEqual(ledger.rebuild_account_totals(accounts, fix=False), [])
+        maintained = self.rollups()
+        ledger.rebuild_rollups([self.user.pk])
+        self.assertEqual(self.rollups(), maintained)
+        maintained = self.checkpoints()
+        rebuild_checkpoints(accounts.filter(checkpoints__isnull=False).distinct())  # created lazily
+        self.assertEqual(self.checkpoints(), maintained)
+
+    def balance(self, account):
+        return Account.objects.get(pk=account.pk).live_balance
+
+    def test_create_edit_delete(self):
+        tx = self.add('10.50')
+        for account in (self.cash, self.bank):
+            balance_as_of(account, date.today())  # checkpoints exist, so edits must shift them
+        self.add('3000', category=self.salary, type='income', day=date.today())
+        self.assertEqual(self.balance(self.cash), Decimal('3089.50'))
+        self.assert_consistent()
+        tx.amount = Decimal('20')
+        tx.save()
+        tx.account = self.bank
+        tx.save()
+        tx.category, tx.type = self.salary, 'income'
+        tx.save()
+        tx.date = date.today()
+        tx.save()
+        self.assertEqual(self.balance(self.cash), Decimal('3100'))
+        self.assertEqual(self.balance(self.bank), Decimal('20'))
+        self.assert_consistent()
+        tx.delete()
+        self.assertEqual(self.balance(self.bank), Decimal('0'))
+        self.assert_consistent()
+
+    def test_deferred_and_queryset_paths(self):
+        tx = self.add('5')
+        deferred = Transaction.objects.only('pk', 'note').get(pk=tx.pk)
+        deferred.note = 'no ledger fields loaded'
+        deferred.save()
+        deferred = Transaction.objects.defer('amount').get(pk=tx.pk)
+        deferred.category = self.rent
+        deferred.save()
+        self.assert_consistent()
+        Transaction.objects.filter(pk=tx.pk).delete()
+        self.assertEqual(self.balance(self.cash), Decimal('100'))
+        self.assert_consistent()
+
+    def test_bulk_import(self):
+        result = import_transactions(self.user, [
+            'date,account,category,amount,note\n',
+            f'{self.old},Cash,Food,-12.25,lunch\n',
+            f'{self.old},Bank,Salary,500,pay\n',
+            f'{date.today()},Bank,Rent,-200,\n',
+        ])
+        self.assertEqual(result.created, 3, result.errors)
+        self.assertEqual(self.balance(self.cash), Decimal('87.75'))
+        self.assertEqual(self.balance(self.bank), Decimal('300'))
+        self.assert_consistent()
+
+    def test_account_edit_keeps_ledger_columns(self):
+        stale = Account.objects.get(pk=self.cash.pk)  # loaded before the transaction below
+        self.add('30')
+        stale.balance = Decimal('150')
+        stale.save()
+        self.client.login(username='led', password='pw')
+        response = self.client.post(f'/accounts/{self.cash.pk}/edit/', {'name': 'Wallet', 'balance': '150'})
+        self.assertEqual(response.status_code, 302)
+        account = Account.objects.get(pk=self.cash.pk)
+        self.assertEqual((account.name, account.transaction_total), ('Wallet', Decimal('-30')))
+        self.assertEqual(account.live_balance, Decimal('120'))
+        self.assert_consistent()
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('se', password='pw')
+        self.cash = Account.objects.create(user=self.user, name='Cash', balance=0)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.rows = {
+            note: Transaction.objects.create(
+                user=self.user, account=self.cash, category=self.food, type='expense', amount=1,
+                date=date.today(), note=note,
+            )
+            for note in ('Weekly groceries', 'Corner shop snacks', 'Train ticket')
+        }
+
+    def notes(self, q, user=None):
+        return sorted(filter_transactions(user or self.user, q).values_list('note', flat=True))
+
+    def test_full_text_match(self):
+        self.assertEqual(self.notes('weekly groceries'), ['Weekly groceries'])
+        self.assertEqual(self.notes('groceries train'), [])  # every term must match
+        self.assertEqual(self.notes('food'), sorted(self.rows))  # or the category name
+        sql = str(filter_transactions(self.user, 'train').query)
+        self.assertIn('money_transaction_fts', sql)
+
+    def test_terms_match_as_word_prefixes(self):
+        # Token prefixes, not substrings: 'ocer' matched groceries under icontains
+        self.assertEqual(self.notes('groc'), ['Weekly groceries'])
+        self.assertEqual(self.notes('ocer'), [])
+        self.assertEqual(self.notes('snack corn'), ['Corner shop snacks'])
+
+    def test_index_follows_updates_and_deletes(self):
+        row = self.rows['Train ticket']
+        row.note = 'Bus pass'
+        row.save()
+        self.assertEqual(self.notes('train'), [])
+        self.assertEqual(self.notes('bus'), ['Bus pass'])
+        row.delete()
+        self.assertEqual(self.notes('bus'), [])
+        Transaction.objects.filter(note='Weekly groceries').update(note='Market')
+        self.assertEqual((self.notes('groceries'), self.notes('market')), ([], ['Market']))
+
+    def test_other_users_notes_not_matched(self):
+        other = User.objects.create_user('se2', password='pw')
+        account = Account.objects.create(user=other, name='Cash', balance=0)
+        category = Category.objects.create(user=other, name='Misc', type='expense')
+        Transaction.objects.create(
+            user=other, account=account, category=category, type='expense', amount=1, date=date.today(),
+            note='Train ticket',
+        )
+        self.assertEqual(self.notes('train'), ['Train ticket'])
+        self.assertEqual(self.notes('train', other), ['Train ticket'])
+        self.assertEqual(filter_transactions(other, 'train').get().user, other)
+        # The index subquery itself is scoped to the user
+        scoped = Transaction.objects.filter(note_match(['train'], other.pk, connection.vendor))
+        self.assertEqual(list(scoped.values_list('user', flat=True)), [other.pk])
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pg', password='pw')
+        self.cash = Account.objects.create(user=self.user, name='Cash', balance=0)
+        self.bank = Account.objects.create(user=self.user, name='Bank', balance=0)
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        today = date.today()
+        # Runs of equal dates, so page boundaries fall between rows of the same day
+        for i, days in enumerate([0, 0, 0, 1, 1, 1, 1, 3, 5, 5]):
+            Transaction.objects.create(
+                user=self.user, account=self.bank if i % 2 else self.cash, category=food, type='expense',
+                amount=1, date=today - timedelta(days=days), note='coffee' if i % 3 else 'rent',
+            )
+        self.client.login(username='pg', password='pw')
+
+    def page(self, **params):
+        page = self.client.get('/transactions/', {'size': 3, **params}).context['page']
+        return [t.pk for t in page], page
+
+    def walk(self, **params):
+        # Forwards with the next cursors, then back with the previous ones
+        pages, (ids, page) = [], self.page(**params)
+        pages.append(ids)
+        while page.next_cursor:
+            ids, page = self.page(after=page.next_cursor, **params)
+            pages.append(ids)
+        back = [ids]
+        while page.prev_cursor:
+            ids, page = self.page(before=page.prev_cursor, **params)
+            back.append(ids)
+        self.assertEqual(back[::-1], pages)
+        return [pk for ids in pages for pk in ids]
+
+    def expected(self, **filters):
+        return list(Transaction.objects.filter(user=self.user, **filters).order_by('-date', '-id')
+                    .values_list('pk', flat=True))
+
+    def test_cursors_across_equal_dates(self):
+        self.assertEqual(self.walk(), self.expected())
+
+    def test_with_search_and_account(self):
+        self.assertEqual(self.walk(q='coffee'), self.expected(note='coffee'))
+        self.assertEqual(self.walk(account=self.bank.pk), self.expected(account=self.bank))
+        self.assertEqual(self.walk(q='coffee', account=self.cash.pk), self.expected(note='coffee', account=self.cash))
+
+    def test_bad_cursors_give_the_first_page(self):
+        first, _ = self.page()
+        for cursor in ('junk', '_', '2025-01-01', '2025-13-01_5', '2025-01-01_x', '2025-01-01_-1',
+                       f'2025-01-01_{2 ** 64}', '9' * 40):
+            for direction in ('after', 'before'):
+                response = self.client.get('/transactions/', {'size': 3, direction: cursor})
+                self.assertEqual(response.status_code, 200, cursor)
+                self.assertEqual([t.pk for t in response.context['page']], first, cursor)
+
+
+class CheckpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cp', password='pw')
+        self.bank = Account.objects.create(user=self.user, name='Bank', balance=1000)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.this_month = ledger.month_start(date.today())
+        self.first_day = ledger.add_months(self.this_month, -4) + timedelta(days=4)
+        self.month_end = ledger.add_months(self.this_month, -2) - timedelta(days=1)
+        self.first = self.add('income', 100, self.first_day)
+        self.add('expense', 30, self.month_end)
+        self.add('expense', 20, self.month_end + timedelta(days=1))
+
+    def add(self, type, amount, day):
+        return Transaction.objects.create(user=self.user, account=self.bank, category=self.food, type=type,
+                                          amount=amount, date=day)
+
+    def balances(self, *days):
+        return [balance_as_of(self.bank, day) for day in days]
+
+    def test_before_the_first_checkpoint(self):
+        self.balances(date.today())  # creates the checkpoints
+        first = AccountCheckpoint.objects.filter(account=self.bank).order_by('month').first()
+        self.assertEqual(first.month, ledger.month_start(self.first_day))
+        before = self.first_day - timedelta(days=1)
+        self.assertEqual(self.balances(before, self.first_day, date(2000, 1, 1)), [1000, 1100, 1000])
+
+    def test_on_a_month_end(self):
+        after = self.month_end + timedelta(days=1)
+        self.assertEqual(self.balances(self.month_end - timedelta(days=1), self.month_end, after), [1100, 1070, 1050])
+        checkpoint = AccountCheckpoint.objects.get(account=self.bank, month=ledger.month_start(self.month_end))
+        self.assertEqual(checkpoint.total, Decimal('70'))
+        history = balance_history(self.bank, self.month_end, after)
+        self.assertEqual(history['values'], [1070, 1050])
+
+    def test_after_edits_to_older_rows(self):
+        self.assertEqual(self.balances(date.today()), [1050])  # creates the checkpoints
+        self.first.amount = 150
+        self.first.save()
+        Transaction.objects.get(date=self.month_end).delete()
+        self.add('expense', 5, self.first_day)
+        expected = [1145, 1145, 1125]
+        self.assertEqual(self.balances(self.first_day, self.month_end, date.today()), expected)
+        rebuild_checkpoints([self.bank])
+        self.assertEqual(self.balances(self.first_day, self.month_end, date.today()), expected)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exp', password='pw')
+        account = Account.objects.create(user=self.user, name='Cash')
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        today = date.today()
+        for i in range(7):  # two rows per day: the batches must break ties on id
+            Transaction.objects.create(user=self.user, account=account, category=food, type='expense',
+                                       amount=Decimal(i + 1), date=today - timedelta(days=i // 2), note=f'row {i}')
+        self.expected = list(
+            Transaction.objects.order_by('-date', '-id').values_list('note', flat=True)
+        )
+
+    def test_csv_in_batches(self):
+        with CaptureQueriesContext(connection) as ctx:
+            lines = list(iter_export(Transaction.objects.filter(user=self.user), 'csv', chunk_size=3))
+        self.assertEqual(len(ctx.captured_queries), 3)
+        rows = list(csv.reader(lines))
+        self.assertEqual(rows[0], ['id', 'date', 'account', 'category', 'type', 'amount', 'note'])
+        self.assertEqual([r[-1] for r in rows[1:]], self.expected)
+        self.assertEqual(rows[-1][2:6], ['Cash', 'Food', 'expense', '7.00'])
+
+    def test_view_streams(self):
+        self.client.login(username='exp', password='pw')
+        response = self.client.get('/transactions/export/?format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r['note'] for r in records], self.expected)
+        response = self.client.get('/transactions/export/?q=row&start=' + date.today().isoformat())
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 1 + 2)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('imp', password='pw')
+        self.cash = Account.objects.create(user=self.user, name='Cash', balance=0)
+
+    def run_import(self, *rows, **kwargs):
+        return import_transactions(self.user, ['date,account,category,amount,note\n', *rows], **kwargs)
+
+    def test_bad_rows_are_reported(self):
+        result = self.run_import(
+            '2026-01-02,Cash,Food,-10,ok\n',
+            '2026-01-03,Cash,Food,NaN,nan\n',
+            '2026-01-03,Cash,Food,sNaN,snan\n',
+            '2026-01-03,Cash,Food,-Infinity,inf\n',
+            '2026-01-03,Cash,Food,abc,text\n',
+            '2026-01-03,Cash,Food,0,zero\n',
+            '2026-13-03,Cash,Food,-1,bad date\n',
+            '2026-01-03,Wallet,Food,-1,unknown account\n',
+            '2026-01-04,Cash,Pay,25,ok\n',
+        )
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 5, 6, 7, 8, 9])
+        self.assertIn("invalid amount 'NaN'", result.errors[0][1])
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).live_balance, Decimal('15'))
+
+    def test_duplicate_names_resolve_once(self):
+        result = self.run_import(
+            '2026-01-02,cash,Food,-1,\n',
+            '2026-01-02,CASH,food,-1,\n',
+            '2026-01-02,Cash,FOOD,-1,\n',
+        )
+        self.assertEqual(result.created, 3, result.errors)
+        self.assertEqual(list(Category.objects.filter(user=self.user).values_list('name', flat=True)), ['Food'])
+        self.assertEqual(Transaction.objects.filter(account=self.cash).count(), 3)
+
+    def test_failure_rolls_back_everything(self):
+        insert = importer.insert_chunk
+        calls = []
+
+        def failing(objs, batch):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            insert(objs, batch)
+
+        with mock.patch('money.importer.insert_chunk', failing), self.assertRaises(RuntimeError):
+            self.run_import('2026-01-02,Cash,Food,-1,\n', '2026-01-03,Cash,Food,-2,\n', chunk_size=1)
+        self.assertEqual(calls, [1, 1])
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(MonthlyCategoryTotal.objects.exists())
+        self.assertEqual(Account.objects.get(pk=self.cash.pk).transaction_total, 0)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tr', password='pw')
+        self.cash = Account.objects.create(user=self.user, name='Cash', balance=100)
+        self.bank = Account.objects.create(user=self.user, name='Bank', balance=0)
+        other = User.objects.create_user('other', password='pw')
+        self.foreign = Account.objects.create(user=other, name='Theirs', balance=0)
+        self.client.login(username='tr', password='pw')
+
+    def post(self, *rows):
+        data = {'form-TOTAL_FORMS': len(rows), 'form-INITIAL_FORMS': 0}
+        for i, (src, dst, amount) in enumerate(rows):
+            data.update({f'form-{i}-from_account': src.pk, f'form-{i}-to_account': dst.pk,
+                         f'form-{i}-amount': amount, f'form-{i}-date': date.today().isoformat()})
+        return self.client.post(f'/accounts/transfer/?rows={len(rows)}', data)
+
+    def balances(self):
+        return [Account.objects.get(pk=a.pk).live_balance for a in (self.cash, self.bank)]
+
+    def test_both_legs(self):
+        self.assertEqual(self.post((self.cash, self.bank, '30'), (self.bank, self.cash, '5')).status_code, 302)
+        self.assertEqual(self.balances(), [Decimal('75'), Decimal('25')])
+        legs = Transaction.objects.filter(amount=Decimal('30'))
+        self.assertEqual(sorted(legs.values_list('type', 'account__name', 'category__name')),
+                         [('expense', 'Cash', 'Transfer'), ('income', 'Bank', 'Transfer')])
+        self.assertEqual(len({t.transfer_key for t in legs}), 1)
+        # Deleting one leg deletes the other
+        self.client.post(f'/transactions/{legs[0].pk}/delete/')
+        self.assertFalse(Transaction.objects.filter(amount=Decimal('30')).exists())
+        self.assertEqual(self.balances(), [Decimal('105'), Decimal('-5')])
+
+    def test_all_or_nothing(self):
+        with mock.patch.object(ledger.LedgerBatch, 'apply', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.post((self.cash, self.bank, '30'), (self.bank, self.cash, '5'))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.balances(), [Decimal('100'), Decimal('0')])
+
+    def test_invalid_rows_rejected(self):
+        for rows in [((self.cash, self.cash, '10'),), ((self.cash, self.foreign, '10'),),
+                     ((self.cash, self.bank, '10'), (self.foreign, self.bank, '10'))]:
+            response = self.post(*rows)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['formset'].errors)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_queries_independent_of_rows(self):
+        counts = set()
+        for n in (1, 5, 10):
+            with CaptureQueriesContext(connection) as get:
+                self.assertContains(self.client.get(f'/accounts/transfer/?rows={n}'), 'Bank', count=2 * n)
+            with CaptureQueriesContext(connection) as post:
+                response = self.post(*[(self.cash, self.cash, '10')] * n)  # invalid: re-rendered
+            self.assertEqual(len(response.context['formset'].errors), n)
+            counts.add((len(get), len(post)))
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_renamed_transfer_category(self):
+        self.post((self.cash, self.bank, '1'))
+        Category.objects.filter(user=self.user, name='Transfer').update(name='Moves')
+        self.assertEqual(self.post((self.cash, self.bank, '2')).status_code, 302)
+        Transaction.objects.filter(user=self.user).delete()
+        Category.objects.filter(user=self.user).delete()
+        self.assertEqual(self.post((self.cash, self.bank, '3')).status_code, 302)
+        self.assertEqual(self.balances(), [Decimal('97'), Decimal('3')])
+
+
+class ReportRangeTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('rep', password='pw')
+        self.client.login(username='rep', password='pw')
+
+    def test_long_range_keeps_its_end(self):
+        data = self.client.get('/api/reports/?start=1900-01-01&end=2020-12-31&group=day').json()
+        self.assertEqual((data['start'], data['end']), ('2010-12-25', '2020-12-31'))
+        self.assertEqual(len(data['labels']), MAX_REPORT_DAYS)
+
+    def test_out_of_range_dates_rejected(self):
+        for query in ['start=0001-01-01', 'end=9999-12-31', 'start=1899-12-31&end=2000-01-01']:
+            self.assertEqual(self.client.get(f'/api/reports/?{query}').status_code, 400)
+            self.assertEqual(self.client.get(f'/reports/?{query}').status_code, 400)
+
+    def test_edges(self):
+        for group in ('day', 'week', 'month'):
+            for query in ['start=1900-01-01&end=1900-02-01', 'start=2199-11-01&end=2199-12-31']:
+                self.assertEqual(self.client.get(f'/api/reports/?{query}&group={group}').status_code, 200)
+
+
+RATES_DIR = tempfile.mkdtemp()
+(Path(RATES_DIR) / 'rates.csv').write_text('date,currency,rate\n2000-01-01,USD,0.25\n2000-01-01,EUR,0.20\n')
+
+
+@override_settings(FX_RATES_DIR=RATES_DIR, DEFAULT_CURRENCY='MYR', FX_REFERENCE_CURRENCY='MYR')
+class CurrencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fx', password='pw')
+        self.myr = Account.objects.create(user=self.user, name='Cash', balance=100)
+        self.usd = Account.objects.create(user=self.user, name='US', balance=10, currency='USD')
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.client.force_login(self.user)
+        for account, amount in ((self.myr, 10), (self.usd, 5)):
+            Transaction.objects.create(user=self.user, account=account, category=self.food, type='expense',
+                                       amount=amount, date=date.today())
+
+    def transfer(self, src, dst, amount):
+        return self.client.post('/accounts/transfer/?rows=1', {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 0, 'form-0-from_account': src.pk,
+            'form-0-to_account': dst.pk, 'form-0-amount': amount, 'form-0-date': date.today().isoformat(),
+        })
+
+    def test_totals_in_base_currency(self):
+        context = dashboard_data(self.user, date.today())
+        self.assertEqual((context['expense'], context['live_total']), (Decimal('30.00'), Decimal('110.00')))
+        self.assertEqual(context['missing_rates'], [])
+        today = date.today()
+        self.assertEqual(build_report(self.user, today.replace(day=1), today)['totals']['expense'], 30.0)
+        Profile.objects.update_or_create(user=self.user, defaults={'base_currency': 'USD'})
+        self.assertEqual(dashboard_data(self.user, date.today())['expense'], Decimal('7.50'))
+
+    def test_transfer_converts(self):
+        self.assertEqual(self.transfer(self.myr, self.usd, '40').status_code, 302)
+        self.assertEqual(Transaction.objects.get(account=self.usd, type='income').amount, Decimal('10.00'))
+
+    def test_missing_rate(self):
+        with self.assertRaises(fx.MissingRate):
+            fx.rate_table().convert([100], ['GBP'], [date.today()], 'MYR')
+        gbp = Account.objects.create(user=self.user, name='UK', balance=50, currency='GBP')
+        Transaction.objects.create(user=self.user, account=gbp, category=self.food, type='expense',
+                                   amount=20, date=date.today())
+        Budget.objects.create(user=self.user, category=self.food, month=date.today().replace(day=1), amount=100)
+        # Left out of the totals, with a warning, instead of a server error
+        with self.assertLogs('money.fx', 'WARNING'):
+            response = self.client.get('/')
+        self.assertContains(response, 'No exchange rate for GBP')
+        self.assertEqual((response.context['expense'], response.context['live_total']),
+                         (Decimal('30.00'), Decimal('110.00')))
+        with self.assertLogs('money.fx', 'WARNING'):
+            report = self.client.get('/api/reports/').json()
+            forecast = build_forecast(self.user)
+        self.assertEqual((report['totals']['expense'], report['missing_rates']), (30.0, ['GBP']))
+        self.assertEqual(forecast['missing_rates'], ['GBP'])
+        self.assertEqual(self.client.get('/budgets/').status_code, 200)
+        with self.assertLogs('money.budgets', 'WARNING'):
+            budgets.evaluate(full=True)
+        self.assertEqual(BudgetSnapshot.objects.get().spent, Decimal('30.00'))
+        response = self.transfer(self.myr, gbp, '10')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('No exchange rate for GBP.', str(response.context['formset'].errors))
+
+    def test_factors(self):
+        table, day = fx.rate_table(), date(2020, 1, 1)
+        currencies = ['USD', 'MYR', 'EUR', 'USD', 'GBP']
+        expected = [4.0, 1.0, 5.0, 4.0, 0.0]  # to MYR; GBP has no quote
+        missing = set()
+        self.assertEqual(table.factors(currencies, [day] * 5, 'MYR', missing).tolist(), expected)
+        self.assertEqual(missing, {'GBP'})
+        # Coded: the distinct currencies once, an integer per amount
+        coded = table.factors(['EUR', 'GBP', 'MYR', 'USD'], [day] * 5, 'MYR', set(), codes=[3, 2, 0, 3, 1])
+        self.assertEqual(coded.tolist(), expected)
+        # One base per amount
+        factors = table.factors(['USD', 'USD', 'EUR'], [day] * 3, ['EUR', 'USD', 'USD'])
+        self.assertEqual(factors.round(6).tolist(), [0.8, 1.0, 1.25])
+
+    def test_rate_files_checked_at_most_every_few_seconds(self):
+        fx.rate_table()
+        with mock.patch.object(fx, 'rate_files', wraps=fx.rate_files) as listed:
+            fx.rate_table()
+            fx.table_version()
+            self.assertEqual(listed.call_count, 0)
+            with override_settings(FX_RATES_CHECK_SECONDS=0):
+                fx.rate_table()
+            self.assertEqual(listed.call_count, 1)
+
+
+def compiled(category_id, pattern, regex=False, account_id=None, max_cents=None):
+    return rules.CompiledRule(category_id, 'expense', account_id, None, max_cents,
+                              None if regex else pattern.lower(),
+                              re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE))
+
+
+class RuleSetTests(TestCase):
+    def test_priority(self):
+        rule_set = rules.RuleSet([compiled(1, 'coffee bean'), compiled(2, 'bean'), compiled(3, 'coffee')])
+        self.assertEqual(rule_set.match('COFFEE BEAN shop', 'expense', 1, 100), 1)
+        self.assertEqual(rule_set.match('bean', 'expense', 1, 100), 2)
+        self.assertIsNone(rule_set.match('tea', 'expense', 1, 100))
+        self.assertIsNone(rule_set.match('coffee', 'income', 1, 100))
+        rule_set = rules.RuleSet([compiled(1, 'x', account_id=9), compiled(2, 'x')])
+        self.assertEqual([rule_set.match('x', 'expense', a, 1) for a in (9, 8)], [1, 2])
+
+    def test_combined_lookahead(self):
+        # Both alternatives match at the same position; the lookahead reports
+        # only the first, so the second is searched on its own when the first
+        # does not apply
+        for regex in (False, True):
+            rule_set = rules.RuleSet([compiled(1, 'coffee bean', regex, max_cents=50), compiled(2, 'coffee', regex)])
+            self.assertEqual(rule_set.match('coffee bean', 'expense', 1, 100), 2)
+            self.assertEqual(rule_set.match('coffee bean', 'expense', 1, 10), 1)
+        # Groups inside a pattern do not shift the rule an alternative maps to
+        rule_set = rules.RuleSet([compiled(1, 'b(?:e)an', True), compiled(2, 'an b'), compiled(3, r'b[e]an\s+x', True)])
+        self.assertEqual(rule_set.rule_of_group, {1: 0, 2: 2})
+        self.assertEqual(rule_set.match('a bean x', 'expense', 1, 1), 1)
+        self.assertEqual(rule_set.match('an bx', 'expense', 1, 1), 2)
+        rule_set = rules.RuleSet([compiled(1, 'bean', True, max_cents=0), compiled(2, r'b[e]an\s+x', True)])
+        self.assertEqual(rule_set.match('a bean x', 'expense', 1, 1), 2)
+
+    def test_keyword_automaton(self):
+        automaton = rules.KeywordAutomaton([('he', 1), ('she', 2), ('his', 3), ('hers', 4)])
+        self.assertEqual(automaton.find('ushers'), {1, 2, 4})
+        self.assertEqual(automaton.find('ahis'), {3})
+
+
+class RulesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rules', password='pw')
+        self.bank = Account.objects.create(user=self.user, name='Bank', balance=0)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.other = Category.objects.create(user=self.user, name='Other', type='expense')
+        self.client.force_login(self.user)
+
+    def test_categorize(self):
+        CategoryRule.objects.create(user=self.user, category=self.food, kind='regex', pattern=r'mc ?donald')
+        CategoryRule.objects.create(user=self.user, category=self.other, pattern='KL', max_amount=5)
+        self.assertEqual(rules.categorize(self.user, 'McDonald KL', 'expense', self.bank.pk, 3), self.food.pk)
+        self.assertEqual(rules.categorize(self.user, 'Taxi KL', 'expense', self.bank.pk, 3), self.other.pk)
+        fallback = rules.categorize(self.user, 'Taxi KL', 'expense', self.bank.pk, 10)
+        self.assertEqual(Category.objects.get(pk=fallback).name, rules.DEFAULT_CATEGORY)
+        self.assertEqual(rules.categorize(self.user, 'McDonald', 'income', self.bank.pk, 3),
+                         Category.objects.get(name=rules.DEFAULT_CATEGORY, type='income').pk)
+
+    def test_form_without_category(self):
+        CategoryRule.objects.create(user=self.user, category=self.food, pattern='lunch')
+        for amount in ('7', '0'):
+            response = self.client.post('/transactions/new/', {
+                'account': self.bank.pk, 'category': '', 'type': 'expense', 'amount': amount,
+                'date': '2026-01-05', 'note': 'Lunch',
+            })
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Transaction.objects.filter(category=self.food).count(), 2)
+
+    def test_invalid_form_writes_nothing(self):
+        row = {'account': self.bank.pk, 'category': '', 'type': 'expense', 'amount': '7', 'note': 'Taxi'}
+        response = self.client.post('/transactions/new/', {**row, 'date': 'not a date'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Category.objects.filter(name=rules.DEFAULT_CATEGORY).exists())
+        self.assertEqual(self.client.post('/transactions/new/', {**row, 'date': '2026-01-05'}).status_code, 302)
+        self.assertEqual(Transaction.objects.get().category.name, rules.DEFAULT_CATEGORY)
+
+    def test_version_lives_in_the_database(self):
+        self.assertFalse(rules.rule_set(self.user.pk))
+        rule = CategoryRule.objects.create(user=self.user, category=self.food, pattern='grab')
+        compiled_set = rules.rule_set(self.user.pk)
+        self.assertEqual(compiled_set.match('GrabFood', 'expense', self.bank.pk, 100), self.food.pk)
+        cache.clear()
+        self.assertIs(rules.rule_set(self.user.pk), compiled_set)
+        rule.pattern = 'uber'
+        rule.save()
+        self.assertIsNone(rules.rule_set(self.user.pk).match('GrabFood', 'expense', self.bank.pk, 100))
+        self.food.name = 'Meals'
+        self.food.save()
+        self.assertIsNot(rules.rule_set(self.user.pk), compiled_set)
+        rule.delete()
+        self.assertFalse(rules.rule_set(self.user.pk))
+
+    def test_recategorize(self):
+        for i in range(25):
+            Transaction.objects.create(user=self.user, account=self.bank, category=self.other, type='expense',
+                                       amount=Decimal('1.50'), date=date(2026, 1, 1 + i), note=f'shop {i} grocer')
+        Transaction.objects.create(user=self.user, account=self.bank, category=self.other, type='expense',
+                                   amount=1, date=date(2026, 1, 1), note='rent')
+        CategoryRule.objects.create(user=self.user, category=self.food, pattern='grocer')
+        self.assertEqual(rules.recategorize(self.user.pk, dry_run=True), 25)
+        self.assertFalse(Transaction.objects.filter(category=self.food).exists())
+        self.assertEqual(rules.recategorize(self.user.pk, batch_size=7), 25)
+        self.assertEqual(Transaction.objects.filter(category=self.food).count(), 25)
+        totals = dict(MonthlyCategoryTotal.objects.values_list('category_id', 'total'))
+        self.assertEqual(totals, {self.food.pk: Decimal('37.50'), self.other.pk: Decimal('1.00')})
+        self.assertEqual(rules.recategorize(self.user.pk), 0)
+        self.assertEqual(rules.recategorize(self.user.pk, uncategorized_only=True), 0)
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('fc', password='pw')
+        self.cash = Account.objects.create(user=self.user, name='Cash', balance=1000)
+        Account.objects.create(user=self.user, name='Savings', balance=50)  # no history: stays flat
+        self.bills = Category.objects.create(user=self.user, name='Bills', type='expense')
+
+    def spend(self, amount, *days):
+        for day in days:
+            Transaction.objects.create(user=self.user, account=self.cash, category=self.bills, type='expense',
+                                       amount=amount, date=day)
+
+    def test_month_ends(self):
+        # Three months of rent on the 1st: too short a history for seasonality
+        self.spend(300, date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1))
+        forecast = build_forecast(self.user, today=date(2025, 3, 15), horizon_months=2)
+        self.assertEqual(forecast['month_end_labels'], ['2025-03-31', '2025-04-30', '2025-05-31'])
+        self.assertEqual(forecast['total_month_end'], [150.0, -150.0, -450.0])
+        self.assertEqual(forecast['accounts'][0]['month_end'], [100.0, -200.0, -500.0])
+        self.assertEqual(forecast['accounts'][1]['month_end'], [50.0, 50.0, 50.0])
+        self.assertEqual(forecast['month_end_balance'], 150.0)
+        # On the last day of a month the projection starts with the next one
+        forecast = build_forecast(self.user, today=date(2025, 3, 31), horizon_months=1)
+        self.assertEqual((forecast['labels'][0], forecast['total'][0]), ('2025-04-01', -150.0))
+        self.assertEqual((forecast['month_end_labels'], forecast['total_month_end']), (['2025-04-30'], [-150.0]))
+        self.assertEqual(forecast['month_end_balance'], 150.0)
+
+    def test_short_months_take_the_missing_days(self):
+        self.spend(50, date(2024, 12, 31), date(2025, 1, 31))
+        forecast = build_forecast(self.user, today=date(2025, 2, 10), horizon_months=2)
+        self.assertEqual(forecast['total_month_end'], [900.0, 850.0, 800.0])  # Feb 28, Mar 31, Apr 30
+        self.assertEqual(forecast['total'][forecast['labels'].index('2025-02-27')], 950.0)
+
+    def test_no_history(self):
+        forecast = build_forecast(self.user, today=date(2025, 3, 15), horizon_months=1)
+        self.assertEqual(forecast['total_month_end'], [1050.0, 1050.0])
+        self.assertEqual(forecast['horizon_balance'], 1050.0)
+
+
+class RecurringTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rec', password='pw')
+        account = Account.objects.create(user=self.user, name='Cash', balance=0)
+        rent = Category.objects.create(user=self.user, name='Rent', type='expense')
+        self.schedule = RecurringTransaction(
+            user=self.user, account=account, category=rent, type='expense', amount=500,
+            start_date=date(2020, 1, 31),
+        )
+        recurring.reschedule(self.schedule)
+        self.schedule.save()
+
+    def test_materialize(self):
+        result = recurring.materialize(until=date(2020, 4, 30))
+        self.assertEqual((result.created, result.user_ids), (4, {self.user.pk}))
+        self.assertEqual(sorted(Transaction.objects.values_list('date', flat=True)),
+                         [date(2020, 1, 31), date(2020, 2, 29), date(2020, 3, 31), date(2020, 4, 30)])
+        self.assertEqual(recurring.materialize(until=date(2020, 4, 30)).created, 0)
+
+    def test_reschedule_after_archiving(self):
+        recurring.materialize(until=date(2020, 3, 31))
+        archive(before=date(2020, 3, 1))
+        self.assertEqual(Transaction.objects.count(), 1)
+        archive(before=date(2020, 4, 1))
+        # An edit must not start over and write the archived months again
+        schedule = RecurringTransaction.objects.get()
+        recurring.reschedule(schedule)
+        self.assertEqual(schedule.next_date, date(2020, 4, 30))
+        schedule.save()
+        recurring.materialize(until=date(2020, 4, 30))
+        self.assertEqual(Transaction.objects.count() + ArchivedTransaction.objects.count(), 4)
+
+
+class BudgetEvaluationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bud', password='pw')
+        account = Account.objects.create(user=self.user, name='Cash', balance=0)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        Budget.objects.create(user=self.user, category=self.food, month=date.today().replace(day=1), amount=100)
+        self.spend = lambda amount: Transaction.objects.create(
+            user=self.user, account=account, category=self.food, type='expense',
+            amount=amount, date=date.today())
+        self.spend(95)
+
+    def test_snapshots(self):
+        self.assertEqual(budgets.evaluate(full=True), (1, 1))
+        snapshot = BudgetSnapshot.objects.get()
+        self.assertEqual((snapshot.spent, snapshot.status), (Decimal('95'), 'near'))
+        self.assertEqual(snapshot.version, self.user.profile.data_version)
+
+    def test_incremental_run_uses_persisted_version(self):
+        budgets.evaluate(full=True)
+        self.assertEqual(budgets.evaluate(), (0, 0))
+        # A cold cache (restart, eviction, another process) changes nothing
+        cache.clear()
+        self.assertEqual(budgets.evaluate(), (0, 0))
+        self.spend(10)
+        self.assertEqual(budgets.evaluate(), (1, 1))
+        self.assertEqual(BudgetSnapshot.objects.get().status, 'over')
+
+    def test_readers_ignore_stale_snapshots(self):
+        budgets.evaluate(full=True)
+        self.spend(10)
+        self.client.login(username='bud', password='pw')
+        [budget] = self.client.get('/budgets/').context['budgets']
+        self.assertEqual((budget.spent, budget.status), (Decimal('105'), 'over'))
+
+
+class AsyncDashboardTests(TransactionTestCase):
+    # Transaction-level isolation: the async loaders query from threads with their own connections
+
+    SUMMARY_KEYS = ('live_total', 'live_money', 'income', 'expense', 'net', 'accounts', 'budget_alerts', 'base_currency')
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('async', password='pw')
+        account = Account.objects.create(user=self.user, name='Cash', balance=100)
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        today = date.today()
+        Budget.objects.create(user=self.user, category=food, month=today.replace(day=1), amount=10)
+        for day in range(1, today.day + 1, 3):
+            Transaction.objects.create(user=self.user, account=account, category=food, type='expense',
+                                       amount=Decimal('4.25'), date=today.replace(day=day))
+
+    async def test_same_context_as_sync_view(self):
+        await self.async_client.aforce_login(self.user)
+        sync_response = await self.async_client.get('/')
+        await cache.aclear()
+        async_response = await self.async_client.get('/dashboard/async/')
+        self.assertEqual(async_response.status_code, 200)
+        for key in self.SUMMARY_KEYS:
+            self.assertEqual(async_response.context[key], sync_response.context[key], key)
+        self.assertTrue(async_response.context['budget_alerts'])
+
+    def test_worker_queries_counted(self):
+        self.client.force_login(self.user)
+        registry.reset()
+        for url in ('/', '/dashboard/async/'):
+            cache.clear()
+            self.assertEqual(self.client.get(url).status_code, 200)
+        queries = {view: stats[3] for view, stats in registry.snapshot().items()}
+        self.assertGreater(queries['dashboard'], 3)
+        # The loaders' queries, from worker threads, plus the session and user
+        # lookups (the async view may load the user once more for the template)
+        self.assertIn(queries['dashboard_async'] - queries['dashboard'], (0, 1))
+
+
+@skipUnless('replica1' in settings.DATABASES, 'needs a replica1 alias (finance_manager.test_settings)')
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # The test replica is not a mirror: it only has what a test puts there.
+    # Only aliases that exist, or the runner fails even with the class skipped
+    databases = {'default', 'replica1'} & settings.DATABASES.keys()
+
+    def setUp(self):
+        self.user = User.objects.create_user('rr', password='pw')
+        self.account = Account.objects.create(user=self.user, name='Primary only', balance=100)
+        self.client.force_login(self.user)
+        self.client.cookies.pop(PIN_COOKIE, None)
+
+    def replicate(self):
+        User.objects.using('replica1').create(pk=self.user.pk, username='rr')
+        Account.objects.using('replica1').create(pk=999, user_id=self.user.pk, name='Replicated', balance=1)
+
+    def test_decorated_views_read_the_replica(self):
+        response = self.client.get('/accounts/')
+        self.assertNotContains(response, 'Primary only')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.replicate()
+        self.assertContains(self.client.get('/accounts/'), 'Replicated')
+        self.assertEqual(self.client.get('/api/charts/accounts/').json()['labels'], ['Replicated'])
+        # Views without replica_reads stay on the primary
+        self.assertEqual(self.client.get(f'/accounts/{self.account.pk}/edit/').status_code, 200)
+
+    def test_writes_pin_the_client(self):
+        response = self.client.post('/accounts/', {'name': 'New', 'balance': '5'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = self.client.get('/accounts/')
+        self.assertContains(response, 'Primary only')
+        self.assertContains(response, 'New')
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertNotContains(self.client.get('/accounts/'), 'Primary only')
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard2'])
+    def test_sharded_writes_pin_the_client(self):
+        # Money writes are routed by ShardRouter; the pin must not depend on
+        # PrimaryReplicaRouter seeing them
+        with mock.patch('money.routers.SAFE_METHODS', ('GET', 'HEAD', 'POST')):
+            response = self.client.post('/accounts/', {'name': 'New', 'balance': '5'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    async def test_async_view(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/dashboard/async/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['live_total'], 0)  # no accounts on the replica yet
+
+
+@skipUnless({'replica1', 'shard2'} <= settings.DATABASES.keys(), 'needs replica1 and shard2 aliases')
+@override_settings(DATABASE_SHARDS=['default', 'shard2'], DATABASE_REPLICAS={'shard2': ['replica1']})
+class ShardReplicaRoutingTests(TransactionTestCase):
+    # replica1 stands in for a replica of shard2 (and, again, lags behind it)
+    databases = {'default', 'replica1', 'shard2'} & settings.DATABASES.keys()
+
+    def setUp(self):
+        self.user = User.objects.create_user('srr', password='pw')
+        sharding.move_user(self.user.pk, 'shard2')
+        with sharding.use_shard('shard2'):
+            self.account = Account.objects.create(user=self.user, name='Primary only', balance=100)
+        self.client.force_login(self.user)
+        self.client.cookies.pop(PIN_COOKIE, None)
+
+    def test_reads_go_to_the_shards_replica(self):
+        self.assertNotContains(self.client.get('/accounts/'), 'Primary only')
+        User.objects.using('replica1').create(pk=self.user.pk, username='srr')
+        Account.objects.using('replica1').create(pk=999, user_id=self.user.pk, name='Replicated', balance=1)
+        self.assertContains(self.client.get('/accounts/'), 'Replicated')
+        # Views without replica_reads read the shard itself
+        self.assertEqual(self.client.get(f'/accounts/{self.account.pk}/edit/').status_code, 200)
+        with sharding.use_shard('shard2'):
+            self.assertEqual(Account.objects.get().name, 'Primary only')  # no request: no replica
+
+    def test_writes_pin_the_client_to_the_shard(self):
+        response = self.client.post('/accounts/', {'name': 'New', 'balance': '5'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(Account.objects.using('shard2').filter(user=self.user).count(), 2)
+        response = self.client.get('/accounts/')
+        self.assertContains(response, 'Primary only')
+        self.assertContains(response, 'New')
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertNotContains(self.client.get('/accounts/'), 'Primary only')
+
+
+@skipUnless('shard2' in settings.DATABASES, 'needs a shard2 alias (finance_manager.test_settings)')
+@override_settings(DATABASE_SHARDS=['default', 'shard2'])
+class ShardingTests(TransactionTestCase):
+    databases = {'default', 'shard2'} & settings.DATABASES.keys()
+
+    def setUp(self):
+        self.user = User.objects.create_user('sh', password='pw')
+        self.home = sharding.shard_for_user(self.user.pk)
+        self.other = 'default' if self.home == 'shard2' else 'shard2'
+        with sharding.use_user_shard(self.user.pk):
+            self.cash = Account.objects.create(user=self.user, name='Cash', balance=100)
+            self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.client.force_login(self.user)
+
+    def reload(self):
+        # A move gives the rows new primary keys on the target
+        alias = sharding.shard_for_user(self.user.pk)
+        self.cash = Account.objects.using(alias).get(user=self.user, name='Cash')
+        self.food = Category.objects.using(alias).get(user=self.user, name='Food')
+
+    def spend(self, amount, note='lunch'):
+        return self.client.post('/transactions/new/', {
+            'account': self.cash.pk, 'category': self.food.pk, 'type': 'expense',
+            'amount': amount, 'date': date.today().isoformat(), 'note': note,
+        })
+
+    def test_routing(self):
+        self.assertEqual(self.home, ['default', 'shard2'][self.user.pk % 2])
+        self.assertTrue(User.objects.using(self.home).filter(pk=self.user.pk).exists())
+        with self.assertRaises(sharding.ShardContextRequired):
+            Account.objects.filter(user=self.user).update(balance=1)
+        self.assertEqual(self.spend('10').status_code, 302)
+        self.assertEqual(Transaction.objects.using(self.home).count(), 1)
+        self.assertFalse(Transaction.objects.using(self.other).exists())
+        self.assertEqual(self.client.get('/').context['live_total'], Decimal('90'))
+        self.assertContains(self.client.get('/transactions/?q=lunch'), 'lunch')
+
+    def test_export_streams_from_the_shard(self):
+        sharding.move_user(self.user.pk, 'shard2')  # off the default alias, whatever the pk
+        self.reload()
+        self.spend('10')
+        response = self.client.get('/transactions/export/?format=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['note'] for row in rows], ['lunch'])
+
+    def test_move_user(self):
+        self.spend('10')
+        self.spend('5', note='coffee')
+        copied = sharding.move_user(self.user.pk, self.other, batch_size=1)
+        self.assertEqual((copied['Transaction'], copied['Account']), (2, 1))
+        # Read from the directory table: no cache to go stale in other processes
+        self.assertEqual(sharding.shard_for_user(self.user.pk), self.other)
+        self.assertEqual(Transaction.objects.using(self.other).filter(user=self.user).count(), 2)
+        self.assertFalse(Transaction.objects.using(self.home).exists())
+        if self.home != 'default':
+            self.assertFalse(User.objects.using(self.home).filter(pk=self.user.pk).exists())
+        self.assertEqual(self.client.get('/').context['live_total'], Decimal('85'))
+        self.reload()
+        self.assertEqual(self.spend('1').status_code, 302)
+        self.assertEqual(Transaction.objects.using(self.other).count(), 3)
+        self.assertEqual(sharding.move_user(self.user.pk, self.other), {})  # nothing left to do
+
+    def test_move_into_a_populated_shard(self):
+        old_day = date.today() - timedelta(days=400)
+        with sharding.use_user_shard(self.user.pk):
+            bank = Account.objects.create(user=self.user, name='Bank', balance=0)
+            rent = RecurringTransaction.objects.create(
+                user=self.user, account=bank, category=self.food, type='expense', amount=30, start_date=old_day,
+            )
+            Transaction.objects.create(
+                user=self.user, account=bank, category=self.food, type='expense', amount=30, date=old_day,
+                recurring=rent,
+            )
+            archive(before=old_day + timedelta(days=1), user_id=self.user.pk)
+            CategoryRule.objects.create(user=self.user, category=self.food, account=self.cash, pattern='lunch')
+            budget = Budget.objects.create(user=self.user, category=self.food, month=date.today().replace(day=1), amount=50)
+            balance_as_of(bank, date.today())  # checkpoints
+            self.spend('10')
+            budgets.evaluate(full=True, user_ids=[self.user.pk])
+        # Another user on the target, holding rows under the moving user's primary keys
+        neighbour = User.objects.create_user('nb', password='pw')
+        sharding.move_user(neighbour.pk, self.other)
+        with sharding.use_shard(self.other):
+            rows = [Category.objects.create(pk=self.food.pk, user=neighbour, name='Rent', type='expense')]
+            for account in (self.cash, bank):
+                rows.append(Account.objects.create(pk=account.pk, user=neighbour, name=account.name, balance=7))
+            Transaction.objects.create(
+                user=neighbour, account=rows[1], category=rows[0], type='expense', amount=1, date=date.today(),
+            )
+            Budget.objects.create(pk=budget.pk, user=neighbour, category=rows[0], month=budget.month, amount=1)
+
+        sharding.move_user(self.user.pk, self.other, batch_size=1)
+        with sharding.use_shard(self.other):
+            bank, cash = Account.objects.filter(user=self.user).order_by('name')
+            food = Category.objects.get(user=self.user)
+            self.assertNotEqual(food.pk, self.food.pk)
+            self.assertEqual(Transaction.objects.get(user=self.user).account, cash)
+            archived = ArchivedTransaction.objects.get(user=self.user)
+            self.assertEqual((archived.account, archived.category), (bank, food))
+            self.assertEqual(archived.recurring, RecurringTransaction.objects.get(user=self.user, account=bank))
+            self.assertEqual(CategoryRule.objects.get(user=self.user).account, cash)
+            snapshot = BudgetSnapshot.objects.get(user=self.user)
+            self.assertEqual((snapshot.budget.category, snapshot.spent), (food, Decimal('10')))
+            self.assertTrue(AccountCheckpoint.objects.filter(account=bank).exists())
+            self.assertFalse(AccountCheckpoint.objects.filter(account__user=neighbour).exists())
+            self.assertEqual(
+                set(MonthlyCategoryTotal.objects.filter(user=self.user).values_list('category', 'account')),
+                {(food.pk, cash.pk), (food.pk, bank.pk)},
+            )
+            self.assertEqual(balance_as_of(bank, date.today()), Decimal('-30'))
+            # The neighbour's rows are untouched
+            self.assertEqual(Account.objects.filter(user=neighbour).aggregate(Sum('balance'))['balance__sum'], 14)
+            self.assertEqual(Transaction.objects.get(user=neighbour).category_id, self.food.pk)
+        self.assertEqual(self.client.get('/').context['live_total'], Decimal('60'))
+
+    def test_locked_user(self):
+        UserShard.objects.filter(user=self.user).update(locked=True)
+        self.assertEqual(self.spend('10').status_code, 503)
+        self.assertEqual(self.client.get('/accounts/').status_code, 200)
+        UserShard.objects.filter(user=self.user).update(locked=False)
+        self.assertEqual(self.spend('10').status_code, 302)
+
+    def test_interrupted_move_unlocks(self):
+        self.spend('10')
+        with mock.patch.object(sharding, 'copy_rows', side_effect=RuntimeError('connection lost')):
+            with self.assertRaises(RuntimeError):
+                sharding.move_user(self.user.pk, self.other)
+        self.assertEqual(sharding.placement(self.user.pk), sharding.Placement(self.home))
+        self.assertEqual(Transaction.objects.using(self.home).count(), 1)
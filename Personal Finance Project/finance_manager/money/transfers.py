@@ -0,0 +1,78 @@
+"""
+Transfers between accounts.
+
+A transfer is an expense row on the source account and an income row on the
+destination, linked by a shared ``transfer_key``. Any number of transfers are
+written with one ``bulk_create`` inside a transaction, so they are applied
+completely or not at all; the per-user "Transfer" categories are looked up
+with one query per call instead of two get_or_create round trips per transfer.
+Between accounts of different currencies the income row receives the amount
+converted at the rate of the transfer's date (money.fx).
+"""
+import uuid
+
+from . import fx, ledger, sharding
+from .caching import bump_data_version
+from .cents import from_cents, to_cents
+from .models import Category, Transaction
+
+TRANSFER_CATEGORY = 'Transfer'
+MAX_TRANSFER_ROWS = 20
+
+
+def transfer_categories(user):
+    """(expense category id, income category id) used for the user's transfers."""
+    # Read fresh every time: the user may rename or delete them between two transfers
+    found = dict(Category.objects.filter(user=user, name=TRANSFER_CATEGORY).values_list('type', 'id'))
+    for type in ('expense', 'income'):
+        if type not in found:
+            found[type] = Category.objects.get_or_create(user=user, name=TRANSFER_CATEGORY, type=type)[0].pk
+    return found['expense'], found['income']
+
+
+def create_transfers(user, transfers):
+    """
+    ``transfers`` is an iterable of dicts with from_account, to_account, amount,
+    date and optional note. Returns the created Transaction rows.
+    """
+    transfers = list(transfers)
+    cat_out, cat_in = transfer_categories(user)
+    received = fx.rate_table().convert(
+        [to_cents(t['amount']) for t in transfers],
+        [t['from_account'].currency for t in transfers],
+        [t['date'] for t in transfers],
+        [t['to_account'].currency for t in transfers],
+    ).tolist()
+    rows = []
+    for t, cents in zip(transfers, received):
+        src, dst, note = t['from_account'], t['to_account'], t.get('note') or ''
+        key = uuid.uuid4()
+        rows.append(Transaction(
+            user=user, account=src, category_id=cat_out, type='expense', amount=t['amount'],
+            date=t['date'], note=f'Transfer to {dst.name}. {note}'.strip(), transfer_key=key,
+        ))
+        rows.append(Transaction(
+            user=user, account=dst, category_id=cat_in, type='income', amount=from_cents(cents),
+            date=t['date'], note=f'Transfer from {src.name}. {note}'.strip(), transfer_key=key,
+        ))
+    if not rows:
+        return rows
+
+    with sharding.atomic():
+        Transaction.objects.bulk_create(rows)
+        batch = ledger.LedgerBatch()
+        for row in rows:
+            batch.add(None, row.ledger_state())
+        batch.apply()
+    bump_data_version(user.pk)
+    return rows
+
+
+def delete_transaction(obj):
+    """Delete a transaction; for a transfer leg, delete both legs together."""
+    with sharding.atomic():
+        if obj.transfer_key is None:
+            obj.delete()
+            return
+        for leg in Transaction.objects.filter(user_id=obj.user_id, transfer_key=obj.transfer_key):
+            leg.delete()
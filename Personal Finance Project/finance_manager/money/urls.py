@@ -4,6 +4,11 @@ from . import views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/async/', views.dashboard_async, name='dashboard_async'),
+    path('api/charts/<slug:series>/', views.chart_data, name='chart_data'),
+    path('reports/', views.report, name='report'),
+    path('api/reports/', views.report_data, name='report_data'),
+    path('metrics/', views.metrics, name='metrics'),
 
     # Auth
     path('login/', auth_views.LoginView.as_view(template_name='auth/login.html'), name='login'),
@@ -12,6 +17,8 @@ urlpatterns = [
 
     # Transactions
     path('transactions/', views.transaction_list, name='transactions'),
+    path('transactions/export/', views.transaction_export, name='transaction_export'),
+    path('transactions/import/', views.transaction_import, name='transaction_import'),
     path('transactions/new/', views.transaction_create, name='transaction_create'),
     path('transactions/<int:pk>/edit/', views.transaction_update, name='transaction_update'),
     path('transactions/<int:pk>/delete/', views.transaction_delete, name='transaction_delete'),
@@ -27,11 +34,23 @@ urlpatterns = [
     path('accounts/new/', views.account_create, name='account_create'),
     path('accounts/<int:pk>/edit/', views.account_update, name='account_update'),
     path('accounts/<int:pk>/delete/', views.account_delete, name='account_delete'),
+    path('accounts/<int:pk>/history/', views.account_history, name='account_history'),
     path('accounts/transfer/', views.account_transfer, name='account_transfer'),
+    path('accounts/currency/', views.base_currency_update, name='base_currency'),
 
     # Budgets
     path('budgets/', views.budget_list, name='budgets'),
     path('budgets/new/', views.budget_create, name='budget_create'),
     path('budgets/<int:pk>/edit/', views.budget_update, name='budget_update'),
     path('budgets/<int:pk>/delete/', views.budget_delete, name='budget_delete'),
+
+    # Rules
+    path('rules/', views.rule_list, name='rules'),
+    path('rules/<int:pk>/edit/', views.rule_update, name='rule_update'),
+    path('rules/<int:pk>/delete/', views.rule_delete, name='rule_delete'),
+
+    # Recurring
+    path('recurring/', views.recurring_list, name='recurring'),
+    path('recurring/<int:pk>/edit/', views.recurring_update, name='recurring_update'),
+    path('recurring/<int:pk>/delete/', views.recurring_delete, name='recurring_delete'),
 ]
\ No newline at end of file
@@ -1,17 +1,34 @@
-from django.shortcuts import render
-from datetime import date
-from calendar import monthrange
+import io
+from datetime import date, timedelta
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Value, DecimalField
-from decimal import Decimal
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
+from django.forms import formset_factory
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from .forms import SignUpForm, TransactionForm, CategoryForm, AccountForm, BudgetForm, TransferForm
-from .models import Transaction, Category, Account, Budget
+from django.views.decorators.http import condition
+from asgiref.sync import sync_to_async
+from .forms import SignUpForm, TransactionForm, CategoryForm, AccountForm, BudgetForm, TransferForm, ImportForm, RecurringForm, ProfileForm, CategoryRuleForm
+from .models import Transaction, Category, CategoryRule, Account, Budget, Profile, RecurringTransaction
 from django.db.models.deletion import ProtectedError
-from django.db.models.functions import TruncDate, Coalesce, Cast
-from django.utils import timezone
+from .recurring import reschedule
+from .budgets import attach_status, live_spend
+from .checkpoints import MAX_HISTORY_DAYS, balance_as_of, balance_history
+from .reports import GROUPS, ReportRangeError, build_report, params_key, report_params
+from .caching import cached_dashboard_summary, cached_for_user, user_etag
+from .dashboard import CHART_SERIES
+from .fx import Conversion
+from .search import filter_transactions
+from .export import EXPORT_FORMATS, export_response, parse_date
+from .importer import guess_format, import_transactions
+from .transfers import MAX_TRANSFER_ROWS, create_transfers, delete_transaction
+from .pagination import PAGE_SIZE_CHOICES, keyset_page, parse_page_size
+from .metrics import render_prometheus
+from .routers import replica_reads
+from . import sharding
+from .sharding import use_user_shard
+from .async_dashboard import acached_dashboard_summary
 
 # ---------- Auth ----------
 
@@ -22,10 +39,11 @@ def signup(request):
             user = form.save(commit=False)
             user.set_password(form.cleaned_data['password'])
             user.save()
-            # Create starter account & categories
-            Account.objects.create(user=user, name='Cash', balance=0)
-            Category.objects.get_or_create(user=user, name='Salary', type='income')
-            Category.objects.get_or_create(user=user, name='Food', type='expense')
+            # Create starter account & categories (on the shard the new user was placed on)
+            with use_user_shard(user.pk):
+                Account.objects.create(user=user, name='Cash', balance=0)
+                Category.objects.get_or_create(user=user, name='Salary', type='income')
+                Category.objects.get_or_create(user=user, name='Food', type='expense')
             login(request, user)
             return redirect('dashboard')
     else:
@@ -35,149 +53,133 @@ def signup(request):
 # ---------- Dashboard ----------
 
 @login_required
+@replica_reads
 def dashboard(request):
-    user = request.user
-    today = date.today()
-    first_day = today.replace(day=1)
-    last_day = today.replace(day=monthrange(today.year, today.month)[1])
-
-    month_tx = Transaction.objects.filter(user=user, date__range=[first_day, last_day])
-    income = month_tx.filter(type='income').aggregate(total=Sum('amount'))['total'] or 0
-    expense = month_tx.filter(type='expense').aggregate(total=Sum('amount'))['total'] or 0
-    net = income - expense
-    spent = expense
-
-    # NEW: Live Money = opening balances + all-time income - all-time expense
-    opening_sum = Account.objects.filter(user=user).aggregate(total=Sum('balance'))['total'] or Decimal('0')
-    all_tx = (
-        Transaction.objects
-        .filter(user=user)
-        .values('type')
-        .annotate(total=Sum('amount'))
-    )
-    in_total = Decimal('0'); out_total = Decimal('0')
-    for row in all_tx:
-        if row['type'] == 'income':
-            in_total += row['total'] or 0
-        else:
-            out_total += row['total'] or 0
-    live_total = Decimal(opening_sum) + in_total - out_total
-
-    # --- Daily expenses for current month ---
-    # Month bounds: [start, next_month_start)
-    start = date(today.year, today.month, 1)
-    next_month_start = date(today.year + (1 if today.month == 12 else 0),
-                            1 if today.month == 12 else today.month + 1, 1)
-
-    # Pull only what we need (no DB functions)
-    qs = (
-        Transaction.objects
-        .filter(
-            user=user,                      # remove if you don't filter per-user
-            type__iexact='expense',
-            date__gte=start,
-            date__lt=next_month_start,
-            date__isnull=False,
-        )
-        .values_list('date', 'amount')
-    )
-
-    # Sum per day in Python (works for DateField or DateTimeField)
-    totals_by_day = {}
-    for d, amt in qs:
-        if d is None:
-            continue
-        day_num = (d.day if hasattr(d, "day") else int(str(d)[8:10]))  # super defensive
-        totals_by_day[day_num] = totals_by_day.get(day_num, 0) + float(amt or 0)
-
-    last_day = (next_month_start - start).days
-    exp_daily_labels = [f"{i:02d}" for i in range(1, last_day + 1)]
-    exp_daily_values = [totals_by_day.get(i, 0.0) for i in range(1, last_day + 1)]
-
-    # Chart data: last 6 months expense by month
-    chart_labels = []
-    chart_values = []
-    m, y = today.month, today.year
-    for _ in range(6):
-        chart_labels.append(f"{y}-{m:02d}")
-        start = date(y, m, 1)
-        end = date(y, m, monthrange(y, m)[1])
-        total = Transaction.objects.filter(user=user, type='expense', date__range=[start, end]).aggregate(Sum('amount'))['amount__sum'] or 0
-        chart_values.append(float(total))
-        # prev month
-        m -= 1
-        if m == 0:
-            m = 12
-            y -= 1
-    chart_labels.reverse(); chart_values.reverse()
-
-    # Budgets status for this month
-    budgets = Budget.objects.filter(user=user, month__year=today.year, month__month=today.month).select_related('category')
-    spent_by_cat = (
-        month_tx.filter(type='expense')
-        .values('category__id', 'category__name')
-        .annotate(total=Sum('amount'))
-    )
-    spent_map = {row['category__id']: row['total'] for row in spent_by_cat}
+    # Only the summary cards are computed here; the charts fetch their series
+    # from chart_data below once the page has rendered
+    context = cached_dashboard_summary(request.user)
+    return render(request, 'dashboard.html', context)
 
-    live_after_month_expense = Decimal(live_total) - Decimal(expense or 0)
-    live_money = live_after_month_expense + income
+@login_required
+@replica_reads
+async def dashboard_async(request):
+    # ASGI-native variant of dashboard: same context and cache entry, its loaders
+    # run concurrently on a miss (money.async_dashboard)
+    context = await acached_dashboard_summary(await request.auser())
+    return await sync_to_async(render)(request, 'dashboard.html', context)
+
+def _chart_etag(request, series):
+    if not request.user.is_authenticated or series not in CHART_SERIES:
+        return None
+    return user_etag(request.user, f'chart:{series}')
 
-    budget_labels = [b.category.name for b in budgets]
-    budget_values = [float(b.amount or 0) for b in budgets]
-    spent_values = [float(spent_map.get(b.category_id, 0) or 0) for b in budgets]
-    total=Coalesce(Sum('amount'), Cast(Value(0), DecimalField(max_digits=12, decimal_places=2)))
+@login_required
+@replica_reads
+@condition(etag_func=_chart_etag)
+def chart_data(request, series):
+    # JSON for one dashboard chart; answers 304 while the user's data is unchanged
+    if series not in CHART_SERIES:
+        raise Http404('Unknown chart series')
+    data = cached_for_user(request.user, f'chart:{series}', CHART_SERIES[series])
+    response = JsonResponse(data)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+# ---------- Reports ----------
 
+@login_required
+@replica_reads
+def report(request):
+    # Page shell; the figures come from report_data with the same query string
+    try:
+        params = report_params(request.GET)
+    except ReportRangeError as e:
+        return HttpResponseBadRequest(str(e))
     accounts = Account.objects.filter(user=request.user).order_by('name')
-    # Compute live balances: opening + income - expense per account
-    tx = Transaction.objects.filter(user=request.user)
-    totals = (
-        tx.values('account_id', 'type')
-          .annotate(total=Sum('amount'))
-    )
-    acc_totals = {}
-    for row in totals:
-        aid = row['account_id']
-        typ = row['type']
-        acc_totals.setdefault(aid, {'in': Decimal('0'), 'out': Decimal('0')})
-        if typ == 'income':
-            acc_totals[aid]['in'] += row['total'] or 0
-        else:
-            acc_totals[aid]['out'] += row['total'] or 0
-    for a in accounts:
-        opening = Decimal(a.balance or 0)
-        in_sum = acc_totals.get(a.id, {}).get('in', Decimal('0'))
-        out_sum = acc_totals.get(a.id, {}).get('out', Decimal('0'))
-        a.live_balance = opening + in_sum - out_sum
-
-    context = {
-        'income': income, 'expense': expense, 'net': net, 'spent':spent,
-        'live_total': live_total, 'live_money':live_money,
-        'exp_daily_labels': exp_daily_labels, 'exp_daily_values': exp_daily_values,
-        'live_after_month_expense': live_after_month_expense, 
-        'chart_labels': chart_labels, 'chart_values': chart_values,
-        'budgets': budgets, 'spent_map': spent_map,
-        'budget_labels': budget_labels, 'budget_values': budget_values, 'spent_values': spent_values,
-        'accounts':accounts,
-    }
-    return render(request, 'dashboard.html', context)
+    return render(request, 'reports.html', {'params': params, 'groups': GROUPS, 'accounts': accounts})
+
+def _report_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    try:
+        return user_etag(request.user, params_key(report_params(request.GET)))
+    except ReportRangeError:
+        return None
+
+@login_required
+@replica_reads
+@condition(etag_func=_report_etag)
+def report_data(request):
+    # Grouped totals, rolling averages and year-over-year deltas (money.reports)
+    try:
+        params = report_params(request.GET)
+    except ReportRangeError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    data = cached_for_user(request.user, params_key(params), lambda user, today: build_report(user, **params))
+    response = JsonResponse(data)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@staff_member_required
+def metrics(request):
+    # Prometheus scrape target for this worker's RequestMetricsMiddleware numbers
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # ---------- Transactions ----------
 
 @login_required
+@replica_reads
 def transaction_list(request):
-    tx = Transaction.objects.filter(user=request.user).select_related('account','category')
     q = request.GET.get('q', '').strip()
     account_id = request.GET.get('account')
-    if q:
-        tx = tx.filter(note__icontains=q) | tx.filter(category__name__icontains=q)
-    if account_id:
-        try:
-            tx = tx.filter(account_id=int(account_id))
-        except ValueError:
-            pass
+    # ?archived=1 browses the rows moved out by archive_transactions (read-only)
+    archived = request.GET.get('archived') == '1'
+    tx = filter_transactions(request.user, q, account_id, archived=archived).select_related('account','category')
+    # Keyset pagination on (-date, -id): constant cost per page, see money.pagination
+    size = parse_page_size(request.GET.get('size'))
+    page = keyset_page(tx, after=request.GET.get('after'), before=request.GET.get('before'), size=size)
     accounts = Account.objects.filter(user=request.user).order_by('name')
-    return render(request, 'transactions/list.html', {'tx': tx, 'q': q, 'accounts': accounts, 'account_id': account_id})
+    return render(request, 'transactions/list.html', {
+        'tx': page, 'page': page, 'size': size, 'page_sizes': PAGE_SIZE_CHOICES,
+        'q': q, 'accounts': accounts, 'account_id': account_id, 'archived': archived,
+    })
+
+@login_required
+def transaction_export(request):
+    # Streams every matching row (CSV or NDJSON); same filters as the list plus a date range
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    tx = filter_transactions(
+        request.user, request.GET.get('q', '').strip(), request.GET.get('account'),
+        parse_date(request.GET.get('start')), parse_date(request.GET.get('end')),
+        archived=request.GET.get('archived') == '1',
+    )
+    # Bound now: the response streams after ShardMiddleware has left the shard context
+    return export_response(tx.using(sharding.db()), fmt)
+
+@login_required
+def transaction_import(request):
+    result = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES, user=request.user)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data['format']
+            if fmt == 'auto':
+                fmt = guess_format(upload.name)
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline='')
+            result = import_transactions(request.user, lines, fmt, form.cleaned_data['account'])
+            messages.success(
+                request,
+                f'Imported {result.created} transaction(s) in {result.seconds:.2f}s '
+                f'({result.rows_per_second:.0f} rows/s), {len(result.errors)} error(s).'
+            )
+            if not result.errors:
+                return redirect('transactions')
+    else:
+        form = ImportForm(user=request.user)
+    return render(request, 'transactions/import.html', {'form': form, 'result': result, 'title': 'Import Transactions'})
 
 @login_required
 def transaction_create(request):
@@ -211,7 +213,7 @@ def transaction_update(request, pk):
 def transaction_delete(request, pk):
     obj = get_object_or_404(Transaction, pk=pk, user=request.user)
     if request.method == 'POST':
-        obj.delete()
+        delete_transaction(obj)  # both legs for a transfer
         return redirect('transactions')
     return render(request, 'transactions/confirm_delete.html', {'obj': obj})
 
@@ -260,29 +262,11 @@ def category_delete(request, pk):
 # ---------- Accounts ----------
 
 @login_required
+@replica_reads
 def account_list(request):
     accounts = Account.objects.filter(user=request.user).order_by('name')
 
-    # Compute live balances: opening + income - expense per account
-    tx = Transaction.objects.filter(user=request.user)
-    totals = (
-        tx.values('account_id', 'type')
-          .annotate(total=Sum('amount'))
-    )
-    acc_totals = {}
-    for row in totals:
-        aid = row['account_id']
-        typ = row['type']
-        acc_totals.setdefault(aid, {'in': Decimal('0'), 'out': Decimal('0')})
-        if typ == 'income':
-            acc_totals[aid]['in'] += row['total'] or 0
-        else:
-            acc_totals[aid]['out'] += row['total'] or 0
-    for a in accounts:
-        opening = Decimal(a.balance or 0)
-        in_sum = acc_totals.get(a.id, {}).get('in', Decimal('0'))
-        out_sum = acc_totals.get(a.id, {}).get('out', Decimal('0'))
-        a.live_balance = opening + in_sum - out_sum
+    # Live balances come from the maintained Account.transaction_total (see money.ledger)
 
     if request.method == 'POST':
         form = AccountForm(request.POST, user=request.user)
@@ -295,6 +279,7 @@ def account_list(request):
     return render(request, 'budgets/list.html', {
         'accounts': accounts,
         'form': form,
+        'profile_form': ProfileForm(instance=Profile.objects.filter(user=request.user).first()),
         'type': 'account',
     })
 
@@ -302,6 +287,15 @@ def account_list(request):
 def account_create(request):
     return redirect('accounts')
 
+@login_required
+def base_currency_update(request):
+    # Currency the dashboard, budgets and reports convert every account to (money.fx)
+    if request.method == 'POST':
+        form = ProfileForm(request.POST)
+        if form.is_valid():
+            Profile.objects.update_or_create(user=request.user, defaults=form.cleaned_data)
+    return redirect('accounts')
+
 @login_required
 def account_update(request, pk):
     obj = get_object_or_404(Account, pk=pk, user=request.user)
@@ -324,44 +318,56 @@ def account_delete(request, pk):
             error = "You can't delete this account because it is used by one or more transactions."
     return render(request, 'accounts/confirm_delete.html', {'obj': obj, 'error': error})
 
+@login_required
+def account_history(request, pk):
+    # Daily closing balances; each range starts from the nearest month-end checkpoint
+    obj = get_object_or_404(Account, pk=pk, user=request.user)
+    today = date.today()
+    end = min(parse_date(request.GET.get('end')) or today, today)
+    start = parse_date(request.GET.get('start')) or end - timedelta(days=89)
+    if start > end:
+        start, end = end, start
+    start = max(start, end - timedelta(days=MAX_HISTORY_DAYS - 1))
+    as_of = parse_date(request.GET.get('as_of'))
+    return render(request, 'accounts/history.html', {
+        'obj': obj, 'start': start, 'end': end, 'as_of': as_of,
+        'as_of_balance': balance_as_of(obj, as_of) if as_of else None,
+        'history': balance_history(obj, start, end),
+    })
+
 @login_required
 def account_transfer(request):
-    # Create paired expense/income transactions
+    # Create paired expense/income transactions, several transfers per submit
+    try:
+        rows = min(max(int(request.GET.get('rows', 1)), 1), MAX_TRANSFER_ROWS)
+    except ValueError:
+        rows = 1
+    TransferFormSet = formset_factory(TransferForm, extra=rows, max_num=MAX_TRANSFER_ROWS, validate_max=True)
+    # One query for every row's account choices
+    form_kwargs = {'accounts': list(Account.objects.filter(user=request.user).order_by('name'))}
     if request.method == 'POST':
-        form = TransferForm(request.POST, user=request.user)
-        if form.is_valid():
-            user = request.user
-            src = form.cleaned_data['from_account']
-            dst = form.cleaned_data['to_account']
-            amt = form.cleaned_data['amount']
-            dt  = form.cleaned_data['date']
-            note = form.cleaned_data['note'] or ''
-
-            # Ensure transfer categories exist
-            cat_out, _ = Category.objects.get_or_create(user=user, name='Transfer', type='expense')
-            cat_in,  _ = Category.objects.get_or_create(user=user, name='Transfer', type='income')
-
-            # Outflow from source
-            Transaction.objects.create(
-                user=user, account=src, category=cat_out, type='expense', amount=amt,
-                date=dt, note=f'Transfer to {dst.name}. {note}'.strip()
-            )
-            # Inflow to destination
-            Transaction.objects.create(
-                user=user, account=dst, category=cat_in, type='income', amount=amt,
-                date=dt, note=f'Transfer from {src.name}. {note}'.strip()
-            )
-            messages.success(request, 'Transfer recorded.')
-            return redirect('transactions')
+        formset = TransferFormSet(request.POST, form_kwargs=form_kwargs)
+        if formset.is_valid():
+            transfers = [f.cleaned_data for f in formset if f.has_changed()]
+            if transfers:
+                create_transfers(request.user, transfers)
+                messages.success(request, f'{len(transfers)} transfer(s) recorded.')
+                return redirect('transactions')
+            formset._non_form_errors = formset.error_class(['Enter at least one transfer.'])
     else:
-        form = TransferForm(user=request.user)
-    return render(request, 'accounts/transfer.html', {'form': form, 'title': 'Transfer Between Accounts'})
+        formset = TransferFormSet(form_kwargs=form_kwargs)
+    return render(request, 'accounts/transfer.html', {
+        'formset': formset, 'rows': rows, 'max_rows': MAX_TRANSFER_ROWS, 'title': 'Transfer Between Accounts',
+    })
 
 # ---------- Budgets ----------
 
 @login_required
 def budget_list(request):
-    budgets = Budget.objects.filter(user=request.user).select_related('category')
+    budgets = list(Budget.objects.filter(user=request.user).select_related('category', 'snapshot', 'user__profile'))
+    # Budget vs actual from the snapshots (money.budgets); budgets changed since
+    # the last evaluation get one rollup query covering their (month, category)
+    attach_status(budgets, request.user.pk, live_spend(request.user, Conversion.for_user(request.user)))
     if request.method == 'POST':
         form = BudgetForm(request.POST)
         form.fields['category'].queryset = Category.objects.filter(user=request.user)
@@ -370,6 +376,7 @@ def budget_list(request):
             form.save(); return redirect('budgets')
     else:
         form = BudgetForm()
+        form.fields['category'].queryset = Category.objects.filter(user=request.user)
     return render(request, 'budgets/list.html', {'budgets': budgets, 'form': form, 'type': 'budget'})
 
 @login_required
@@ -396,4 +403,79 @@ def budget_delete(request, pk):
     if request.method == 'POST':
         obj.delete()
         return redirect('budgets')
-    return render(request, 'budgets/confirm_delete.html', {'obj': obj})
\ No newline at end of file
+    return render(request, 'budgets/confirm_delete.html', {'obj': obj})
+
+# ---------- Categorization rules ----------
+
+@login_required
+def rule_list(request):
+    rules = CategoryRule.objects.filter(user=request.user).select_related('category', 'account')
+    if request.method == 'POST':
+        form = CategoryRuleForm(request.POST, user=request.user)
+        form.instance.user = request.user
+        if form.is_valid():
+            form.save()
+            return redirect('rules')
+    else:
+        form = CategoryRuleForm(user=request.user)
+    return render(request, 'rules/list.html', {'rules': rules, 'form': form})
+
+@login_required
+def rule_update(request, pk):
+    obj = get_object_or_404(CategoryRule, pk=pk, user=request.user)
+    if request.method == 'POST':
+        form = CategoryRuleForm(request.POST, instance=obj, user=request.user)
+        if form.is_valid():
+            form.save()
+            return redirect('rules')
+    else:
+        form = CategoryRuleForm(instance=obj, user=request.user)
+    return render(request, 'rules/form.html', {'form': form, 'title': 'Edit Rule'})
+
+@login_required
+def rule_delete(request, pk):
+    obj = get_object_or_404(CategoryRule, pk=pk, user=request.user)
+    if request.method == 'POST':
+        obj.delete()  # categories it already set are kept
+        return redirect('rules')
+    return render(request, 'rules/confirm_delete.html', {'obj': obj})
+
+# ---------- Recurring ----------
+
+@login_required
+def recurring_list(request):
+    schedules = RecurringTransaction.objects.filter(user=request.user).select_related('account', 'category')
+    if request.method == 'POST':
+        form = RecurringForm(request.POST, user=request.user)
+        form.instance.user = request.user
+        if form.is_valid():
+            obj = form.save(commit=False)
+            reschedule(obj)
+            obj.save()
+            return redirect('recurring')
+    else:
+        form = RecurringForm(user=request.user, initial={'start_date': date.today()})
+    return render(request, 'recurring/list.html', {'schedules': schedules, 'form': form})
+
+@login_required
+def recurring_update(request, pk):
+    obj = get_object_or_404(RecurringTransaction, pk=pk, user=request.user)
+    if request.method == 'POST':
+        form = RecurringForm(request.POST, instance=obj, user=request.user)
+        if form.is_valid():
+            obj = form.save(commit=False)
+            # Rule edits apply from the first occurrence not yet written
+            reschedule(obj)
+            obj.save()
+            return redirect('recurring')
+    else:
+        form = RecurringForm(instance=obj, user=request.user)
+    return render(request, 'recurring/form.html', {'form': form, 'title': 'Edit Recurring Transaction'})
+
+@login_required
+def recurring_delete(request, pk):
+    obj = get_object_or_404(RecurringTransaction, pk=pk, user=request.user)
+    if request.method == 'POST':
+        obj.delete()  # already created transactions are kept
+        return redirect('recurring')
+    return render(request, 'recurring/confirm_delete.html', {'obj': obj})